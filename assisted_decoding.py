@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Assisted (speculative) decoding with a small draft model
+
+Every agent call used to decode token by token on GPT-2. AssistedBackend
+lets a smaller model sharing the tokenizer (``distilgpt2``, or a tiny random
+GPT-2 in benchmarks) propose a few tokens at a time, which the main model
+checks in a single forward pass; the longest agreeing run is kept plus one
+token from the main model. Under greedy decoding the output is the same as
+without the draft; with sampling, ``transformers`` uses speculative sampling,
+which keeps the main model's distribution.
+
+Assisted generation in ``transformers`` decodes one sequence at a time, so
+prompts of a batch are generated in turn. Every call records an
+AssistedReport from the draft model's proposals: each draft ``generate()``
+is followed by one verifying main-model pass, and the tokens it returns
+beyond its input are the proposed candidates:
+
+    backend = AssistedBackend.from_pretrained("gpt2", "distilgpt2")
+    orchestrator = MultiAgentOrchestrator(backend, agent_backends={"ScenePlanner": backend})
+    backend.stats()  # tokens/sec, acceptance rate, tokens per main-model pass
+"""
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List
+
+from early_stop import apply_early_stop
+from json_constraint import apply_json_schema
+
+
+@dataclass
+class AssistedReport:
+    """Proposals, verifying passes and timing of one assisted generation"""
+    generated_tokens: int
+    target_passes: int  # main-model verification passes (one per draft proposal)
+    draft_tokens: int   # candidate tokens the draft model proposed
+    seconds: float
+
+    @property
+    def accepted_tokens(self) -> int:
+        # Each verification pass keeps the accepted draft tokens plus one token of its own
+        return max(self.generated_tokens - self.target_passes, 0)
+
+
+def summarize_assisted(reports: Iterable[AssistedReport]) -> Dict[str, Any]:
+    """Tokens/sec and draft acceptance rate over a set of calls"""
+    reports = list(reports)
+    generated = sum(report.generated_tokens for report in reports)
+    passes = sum(report.target_passes for report in reports)
+    drafted = sum(report.draft_tokens for report in reports)
+    accepted = sum(report.accepted_tokens for report in reports)
+    seconds = sum(report.seconds for report in reports)
+    return {
+        "calls": len(reports),
+        "generated_tokens": generated,
+        "seconds": round(seconds, 4),
+        "tokens_per_sec": round(generated / seconds, 1) if seconds > 0 else 0.0,
+        "draft_tokens": drafted,
+        "accepted_tokens": accepted,
+        "acceptance_rate": round(accepted / drafted, 3) if drafted else 0.0,
+        "tokens_per_target_pass": round(generated / passes, 2) if passes else 0.0,
+    }
+
+
+class ProposalCounter:
+    """Draft generate() calls and the candidate tokens they returned"""
+
+    def __init__(self):
+        self.calls = 0
+        self.tokens = 0
+
+
+@contextmanager
+def count_proposals(assistant_model) -> Iterator[ProposalCounter]:
+    """Wrap the draft model's generate() to count its calls and proposed tokens"""
+    counter = ProposalCounter()
+    generate = assistant_model.generate
+
+    def counting_generate(*args, **kwargs):
+        output = generate(*args, **kwargs)
+        input_ids = kwargs.get("input_ids", kwargs.get("decoder_input_ids", args[0] if args else None))
+        sequences = getattr(output, "sequences", output)
+        counter.calls += 1
+        counter.tokens += sequences.shape[-1] - input_ids.shape[-1]
+        return output
+
+    # An instance attribute shadows the method until it is deleted again
+    assistant_model.generate = counting_generate
+    try:
+        yield counter
+    finally:
+        del assistant_model.generate
+
+
+class AssistedBackend:
+    """Backend over a main causal LM that verifies tokens proposed by a draft model"""
+
+    def __init__(self, model, tokenizer, assistant_model, num_assistant_tokens: int = 5, **default_params):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.assistant_model = assistant_model
+        self.default_params = default_params
+        self.model_id = getattr(model, "name_or_path", None) or type(model).__name__
+        self.assistant_id = getattr(assistant_model, "name_or_path", None) or type(assistant_model).__name__
+        # Draft tokens per step to start from; transformers adapts it to how many get accepted
+        assistant_model.generation_config.num_assistant_tokens = num_assistant_tokens
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token_id = tokenizer.eos_token_id
+        self.reports: List[AssistedReport] = []
+
+    @classmethod
+    def from_pretrained(cls, model_id: str = "gpt2", assistant_id: str = "distilgpt2", **kwargs) -> "AssistedBackend":
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = AutoModelForCausalLM.from_pretrained(model_id).eval()
+        assistant = AutoModelForCausalLM.from_pretrained(assistant_id).eval()
+        return cls(model, tokenizer, assistant, **kwargs)
+
+    def generate(self, prompts: List[str], **params) -> List[str]:
+        import torch
+
+        params.pop("batch_size", None)
+        params = {**self.default_params, **params}
+        params.setdefault("pad_token_id", self.tokenizer.pad_token_id)
+
+        texts: List[str] = []
+        for prompt in prompts:
+            inputs = self.tokenizer(prompt, return_tensors="pt")
+            prompt_length = inputs["input_ids"].shape[1]
+            # Fresh constraint and stopping state per prompt: they are told where this generation starts
+            call_params = apply_early_stop(self.tokenizer, apply_json_schema(self.tokenizer, params), prompt_length)
+            with count_proposals(self.assistant_model) as proposals:
+                start = time.perf_counter()
+                with torch.no_grad():
+                    generated = self.model.generate(**inputs, assistant_model=self.assistant_model, **call_params)
+                seconds = time.perf_counter() - start
+            new_tokens = generated[0, prompt_length:]
+            self.reports.append(AssistedReport(len(new_tokens), proposals.calls, proposals.tokens, seconds))
+            texts.append(self.tokenizer.decode(new_tokens, skip_special_tokens=True))
+        return texts
+
+    def stats(self) -> Dict[str, Any]:
+        return summarize_assisted(self.reports)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Append-only version log of character attributes
+
+Every value a character attribute takes is appended as an AttributeVersion
+keyed by the scene id current at the time (the id of the last planned
+scene, 0 before any scene exists). Records use ``__slots__`` and names and
+string values are interned, so a long story costs a few small objects per
+change rather than a copy of the Character.
+
+Scene ids only move forward in the log: a version stamped with an id lower
+than one already logged is clamped to the highest id seen, so both the
+global log and each attribute's history stay sorted and lookups bisect.
+"""
+
+import sys
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class AttributeVersion:
+    """One value of one character attribute, from scene_id onwards"""
+
+    __slots__ = ("character", "attribute", "value", "scene_id")
+
+    def __init__(self, character: str, attribute: str, value: Any, scene_id: int):
+        self.character = character
+        self.attribute = attribute
+        self.value = value
+        self.scene_id = scene_id
+
+    def __repr__(self) -> str:
+        return f"AttributeVersion({self.character!r}, {self.attribute!r}, {self.value!r}, scene_id={self.scene_id})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"character": self.character, "attribute": self.attribute,
+                "value": self.value, "scene_id": self.scene_id}
+
+
+class AttributeLog:
+    """Per-attribute version history with point-in-time and delta queries"""
+
+    def __init__(self):
+        self._records: List[AttributeVersion] = []
+        self._scene_ids: List[int] = []  # parallel to _records, for bisecting
+        self._history: Dict[Tuple[str, str], List[AttributeVersion]] = {}
+        self._history_scene_ids: Dict[Tuple[str, str], List[int]] = {}  # parallel to each history
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def last_scene_id(self) -> int:
+        return self._scene_ids[-1] if self._scene_ids else 0
+
+    def record(self, character: str, attribute: str, value: Any, scene_id: int) -> Optional[AttributeVersion]:
+        """Append a version unless it repeats the attribute's current value"""
+        key = (_intern(character), _intern(attribute))
+        history = self._history.setdefault(key, [])
+        if history and history[-1].value == value:
+            return None
+        version = AttributeVersion(key[0], key[1], _intern(value), max(scene_id, self.last_scene_id))
+        history.append(version)
+        self._history_scene_ids.setdefault(key, []).append(version.scene_id)
+        self._records.append(version)
+        self._scene_ids.append(version.scene_id)
+        return version
+
+    def history(self, character: str, attribute: str) -> List[AttributeVersion]:
+        """Every version of one attribute, oldest first"""
+        return list(self._history.get((character, attribute), ()))
+
+    def value_at(self, character: str, attribute: str, scene_id: int) -> Any:
+        """Value the attribute had at scene_id (None if it was not known yet)"""
+        history = self._history.get((character, attribute))
+        if not history:
+            return None
+        index = bisect_right(self._history_scene_ids[(character, attribute)], scene_id)
+        return history[index - 1].value if index else None
+
+    def changes_since(self, scene_id: int) -> List[AttributeVersion]:
+        """Versions recorded after scene_id, in log order"""
+        return self._records[bisect_right(self._scene_ids, scene_id):]
+
+    def records_from(self, position: int) -> List[AttributeVersion]:
+        """Versions appended since the log had ``position`` records"""
+        return self._records[position:]
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+CPU benchmark for assisted (speculative) decoding with a draft model
+
+For each agent prompt, generates greedily with the main model alone and
+with a draft model proposing tokens, and reports tokens/sec of both, the
+draft acceptance rate and how many tokens each main-model pass yields. It
+also checks that greedy outputs are the same either way, both unconstrained
+and with the agent's JSON schema and early stop, and exits with status 1 if
+any differ. By default it runs offline
+on a randomly initialized tiny GPT-2 whose draft is its own first layers
+(so the two agree often enough to be informative); pass
+--model gpt2 --draft distilgpt2 to use the real models.
+"""
+
+import argparse
+import sys
+import time
+
+from assisted_decoding import AssistedBackend
+from benchmark_prefix_cache import sample_prompts
+from character_consistency_poc import (
+    CharacterExtractionAgent, ConsistencyValidationAgent, ScenePlanningAgent
+)
+from generator_backends import RawModelBackend
+from tiny_models import build_tiny_pair
+
+# Output schema per agent name, as the agents pass it to the backend
+SCHEMAS = {
+    "CharacterExtractor": CharacterExtractionAgent.output_schema,
+    "ScenePlanner": ScenePlanningAgent.output_schema,
+    "ConsistencyValidator": ConsistencyValidationAgent.output_schema,
+}
+
+
+def truncated_draft(model, n_layer: int):
+    """Copy of a GPT-2 keeping only its first n_layer blocks (embeddings and head shared by value)"""
+    from transformers import GPT2LMHeadModel
+
+    config = model.config.to_dict()
+    config["n_layer"] = n_layer
+    draft = GPT2LMHeadModel(type(model.config).from_dict(config)).eval()
+    draft.load_state_dict(model.state_dict(), strict=False)
+    return draft
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", help="HF model id (default: offline tiny random GPT-2)")
+    parser.add_argument("--draft", default="distilgpt2", help="HF draft model id, with --model")
+    parser.add_argument("--draft-layers", type=int, default=2, help="layers of the offline draft")
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--assistant-tokens", type=int, default=5, help="draft tokens per step to start from")
+    args = parser.parse_args()
+
+    prompts = sample_prompts()
+    if args.model:
+        assisted = AssistedBackend.from_pretrained(args.model, args.draft, num_assistant_tokens=args.assistant_tokens)
+    else:
+        tokenizer, model = build_tiny_pair(
+            [prompt for _, _, prompt in prompts], n_layer=6, n_embd=256, n_head=8
+        )
+        assisted = AssistedBackend(model, tokenizer, truncated_draft(model, args.draft_layers),
+                                   num_assistant_tokens=args.assistant_tokens)
+    plain = RawModelBackend(assisted.model, assisted.tokenizer)
+    greedy = {"max_new_tokens": args.new_tokens, "do_sample": False}
+    print(f"main model: {assisted.model_id}, draft: {assisted.assistant_id}\n")
+
+    mismatches = []
+    print(f"{'agent':<22}{'plain tok/s':>12}{'assisted':>10}{'speedup':>9}{'accept':>8}{'tok/pass':>10}"
+          f"{'greedy==':>10}{'json==':>8}")
+    for name, _, prompt in prompts:
+        (plain_text,), plain_seconds = timed(lambda: plain.generate([prompt], **greedy))
+        first = len(assisted.reports)
+        (assisted_text,), assisted_seconds = timed(lambda: assisted.generate([prompt], **greedy))
+        report = assisted.reports[first]
+        plain_tps = len(assisted.tokenizer.encode(plain_text)) / plain_seconds
+        assisted_tps = report.generated_tokens / assisted_seconds
+
+        # The agents' real params: the output schema, stopping once the JSON closes
+        constrained = {**greedy, "json_schema": SCHEMAS[name], "stop_on_json": True}
+        plain_json = plain.generate([prompt], **constrained)[0]
+        assisted_json = assisted.generate([prompt], **constrained)[0]
+        # Once the object closes only EOS is allowed, so draft tokens past it cannot reach the text either
+        json_match = assisted_json == plain_json
+        if plain_text != assisted_text or not json_match:
+            mismatches.append(name)
+
+        print(f"{name:<22}{plain_tps:>12.1f}{assisted_tps:>10.1f}{assisted_tps / plain_tps:>8.2f}x"
+              f"{report.accepted_tokens / max(report.draft_tokens, 1):>8.2f}"
+              f"{report.generated_tokens / max(report.target_passes, 1):>10.2f}"
+              f"{str(plain_text == assisted_text):>10}{str(json_match):>8}")
+
+    print(f"\n{assisted.stats()}")
+    if mismatches:
+        print(f"greedy output differs with the draft model for: {', '.join(mismatches)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Memory and throughput benchmark for compact Character and Scene objects
+
+Builds a synthetic series of scenes and characters three ways: the
+dataclasses serialized with ``dataclasses.asdict`` (the previous output
+path), the dataclasses with their one-level-copy ``to_dict()``, and the slotted
+CompactScene/CompactCharacter. Reports the memory held by the objects
+(tracemalloc) and the time to build them, to serialize them for the output
+JSON and to encode them for a prompt.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List
+
+from character_consistency_poc import Character, Scene
+from compact_models import CompactCharacter, CompactScene
+from prompt_builder import encode_scenes
+
+NAMES = ["علی", "سارا", "دکتر احمد حسینی", "نازنین", "مریم", "رضا", "پدربزرگ", "خانم کریمی"]
+LOCATIONS = ["پارک", "خانه", "مدرسه", "بیمارستان", "کتابخانه", "خیابان"]
+MOODS = ["شاد", "غمگین", "پرتنش", "آرام"]
+
+
+def scene_payload(count: int) -> str:
+    # JSON as the planner would return it: parsing gives fresh strings per scene
+    return json.dumps([{
+        "scene_id": i,
+        "description": f"صحنه {i}: {NAMES[i % len(NAMES)]} در {LOCATIONS[i % len(LOCATIONS)]} قدم می‌زند",
+        "characters_present": [NAMES[i % len(NAMES)], NAMES[(i + 3) % len(NAMES)]],
+        "location": LOCATIONS[i % len(LOCATIONS)],
+        "time_of_day": "صبح",
+        "mood": MOODS[i % len(MOODS)],
+        "key_actions": [f"اقدام {i}"],
+    } for i in range(count)], ensure_ascii=False)
+
+
+def character_payload(count: int) -> str:
+    return json.dumps([{
+        "name": f"{NAMES[i % len(NAMES)]} {i}", "age": 20 + i % 50, "appearance": "موهای سیاه",
+        "personality": "آرام", "role": "فرعی", "relationships": {NAMES[(i + 1) % len(NAMES)]: "دوست"},
+    } for i in range(count)], ensure_ascii=False)
+
+
+def measure(build: Callable[[], List[Any]], serialize: Callable[[Any], Dict[str, Any]]) -> Dict[str, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = build()
+    build_seconds = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    json.dumps([serialize(obj) for obj in objects], ensure_ascii=False)
+    serialize_seconds = time.perf_counter() - start
+    return {"memory_mb": memory / 2 ** 20,
+            "build_s": build_seconds, "serialize_s": serialize_seconds, "items": objects}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenes", type=int, default=50000)
+    parser.add_argument("--characters", type=int, default=5000)
+    args = parser.parse_args()
+
+    scenes = scene_payload(args.scenes)
+    characters = character_payload(args.characters)
+    variants = [
+        ("dataclass+asdict", Scene, Character, asdict, asdict),
+        ("dataclass+to_dict", Scene, Character, Scene.to_dict, Character.to_dict),
+        ("compact", CompactScene, CompactCharacter, CompactScene.to_dict, CompactCharacter.to_dict),
+    ]
+
+    print(f"\n{'variant':<20}{'kind':<11}{'memory MB':>11}{'build s':>10}{'serialize s':>13}{'encode s':>10}")
+    for label, scene_cls, character_cls, scene_dict, character_dict in variants:
+        rows = [
+            ("scenes", measure(lambda: [scene_cls(**data) for data in json.loads(scenes)], scene_dict)),
+            ("characters", measure(lambda: [character_cls(**data) for data in json.loads(characters)], character_dict)),
+        ]
+        start = time.perf_counter()
+        if scene_dict is asdict:
+            # Previous prompt path went through asdict too
+            json.dumps([asdict(scene) for scene in rows[0][1]["items"]], ensure_ascii=False, separators=(",", ":"))
+        else:
+            encode_scenes(rows[0][1]["items"])
+        encode_seconds = time.perf_counter() - start
+        for kind, row in rows:
+            encode = f"{encode_seconds:>10.3f}" if kind == "scenes" else f"{'':>10}"
+            print(f"{label:<20}{kind:<11}{row['memory_mb']:>11.2f}{row['build_s']:>10.3f}{row['serialize_s']:>13.3f}{encode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmark suite for the agents, SharedMemory and both pipelines
+
+Times each building block on its own (prompt construction, JSON extraction
+and parsing, SharedMemory operations, character similarity queries, every
+agent's process() and the local demo's
+extract_characters/plan_scenes/validate_consistency) and the end-to-end
+process_story of MultiAgentOrchestrator and LocalMultiAgentSystem.
+Generation runs on the StubBackend (optionally with simulated latency) or on
+a randomly initialized tiny GPT-2 (--tiny, needs torch), so no download or
+API key is needed.
+
+Results go to a JSON file. Given a baseline saved from an earlier run, every
+case is compared against it and the run fails (exit code 1) when a case got
+slower than the threshold allows:
+
+    python benchmark_suite.py --save-baseline benchmark_baseline.json
+    python benchmark_suite.py --baseline benchmark_baseline.json --threshold 0.25
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import timeit
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from character_consistency_poc import (
+    Character, CharacterExtractionAgent, ConsistencyValidationAgent, MultiAgentOrchestrator, Scene,
+    ScenePlanningAgent, SharedMemory, StoryProcessingAgent
+)
+from generator_backends import GeneratorBackend, RawModelBackend, STUB_CHARACTERS, StubBackend
+from simple_local_demo import (
+    Character as LocalCharacter, CharacterExtractor, ConsistencyValidator, LocalMultiAgentSystem, ScenePlanner
+)
+
+SAMPLE_STORY = """
+در شهری بزرگ، پسرکی به نام علی زندگی می‌کرد. علی ۱۲ ساله بود و موهای سیاه و چشمانی باهوش داشت.
+او همیشه ماجراجو و کنجکاو بود. یک روز علی تصمیم گرفت به پارک برود و ماجراجویی کند.
+
+در پارک، علی با دختری به نام سارا آشنا شد. سارا ۱۱ ساله بود و موهای بلوند و چشمانی آبی داشت.
+او آرام و کتابخوان بود. آنها با هم شروع به بازی کردند و دوستی نزدیکی پیدا کردند.
+
+ناگهان هوا ابری شد و باران شروع به باریدن کرد. علی و سارا زیر درختی پناه گرفتند.
+"""
+
+Case = Tuple[str, Callable[[], Any]]
+
+
+def populated_memory(characters: int = 20, scenes: int = 50) -> SharedMemory:
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", age=12, appearance="موهای سیاه", personality="ماجراجو"))
+    memory.add_character(Character(name="سارا", age=11, appearance="موهای بلوند", personality="آرام"))
+    for i in range(characters - 2):
+        memory.add_character(Character(name=f"کاراکتر {i}", age=20 + i, appearance="موهای قهوه‌ای"))
+    for i in range(scenes):
+        memory.add_scene(Scene(i + 1, f"صحنه {i}: علی و سارا در پارک", ["علی", "سارا"], "پارک"))
+    return memory
+
+
+def sampled_completion(payload: Dict[str, Any]) -> str:
+    """A canned answer wrapped in prose, like an unconstrained sampled completion"""
+    return f"بله، نتیجه:\n{json.dumps(payload, ensure_ascii=False)}\nپایان."
+
+
+def quiet(fn: Callable[[], Any]) -> Callable[[], Any]:
+    """Run fn with the pipelines' progress prints discarded"""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def prompt_cases() -> List[Case]:
+    memory = populated_memory()
+    extractor = CharacterExtractionAgent(None, memory)
+    planner = ScenePlanningAgent(None, memory)
+    validator = ConsistencyValidationAgent(None, memory)
+    recent = {"scenes": memory.scenes[-5:]}
+    return [
+        ("prompt.character_extractor", lambda: extractor.build_prompt({"story_text": SAMPLE_STORY})),
+        ("prompt.scene_planner", lambda: planner.build_prompt({"story_text": SAMPLE_STORY})),
+        ("prompt.consistency_validator", lambda: validator.build_prompt(recent)),
+    ]
+
+
+def json_cases() -> List[Case]:
+    characters = sampled_completion(STUB_CHARACTERS)
+    extractor = CharacterExtractionAgent(None, SharedMemory())
+    return [
+        ("json.extract", lambda: StoryProcessingAgent.extract_json(characters)),
+        ("json.parse_characters", lambda: extractor.parse_response(characters)),
+    ]
+
+
+def memory_cases() -> List[Case]:
+    memory = populated_memory(characters=200, scenes=500)
+    growing = SharedMemory()
+    names = ["علی", "سارا", "کاراکتر 7", "ناشناس"]
+    scene = Scene(1, "علی و سارا در پارک", ["علی", "سارا"], "پارک")
+    counter = iter(range(10 ** 9))
+    return [
+        ("memory.add_character", lambda: growing.add_character(Character(name=f"c{next(counter) % 500}", age=30))),
+        ("memory.update_character", lambda: memory.update_character("علی", personality="ماجراجو")),
+        ("memory.get_character", lambda: memory.get_character("سارا")),
+        ("memory.resolve", lambda: memory.resolve(names)),
+        ("memory.add_scene", lambda: growing.add_scene(Scene(**scene.to_dict()))),
+        ("memory.get_recent_scenes", lambda: memory.get_recent_scenes()),
+        ("memory.snapshot", lambda: memory.snapshot()),
+    ]
+
+
+def similarity_cases(characters: int = 10000) -> List[Case]:
+    memory = SharedMemory()
+    for i in range(characters):
+        memory.add_character(Character(name=f"کاراکتر {i}", age=20 + i % 50,
+                                       appearance=["موهای سیاه", "موهای بلوند", "ریش و عینک"][i % 3],
+                                       personality=["آرام", "ماجراجو", "جدی"][i % 3]))
+    memory.similar_characters("علی")  # builds the index
+    index = memory._similarity
+    query = index.encoder.encode_batch(["آقای حسینی با عینک"])
+    batch = index.encoder.encode_batch([f"کاراکتر {i} موهای سیاه" for i in range(32)])
+    return [
+        ("similarity.encode_query", lambda: index.encoder.encode("آقای حسینی با عینک")),
+        (f"similarity.top_k_{characters}", lambda: index.search(query, 5)),
+        (f"similarity.top_k_{characters}_batch32", lambda: index.search(batch, 5)),
+        ("similarity.similar_characters", lambda: memory.similar_characters("آقای حسینی با عینک")),
+    ]
+
+
+def scene_retrieval_cases(scenes: int = 5000) -> List[Case]:
+    memory = SharedMemory()
+    names = [f"کاراکتر {i}" for i in range(50)]
+    for i in range(scenes):
+        memory.add_scene(Scene(scene_id=i + 1, description=f"صحنه {i}: {names[i % 50]} در مکان {i % 40} می‌ماند",
+                               characters_present=[names[i % 50], names[(i * 7) % 50]], location=f"مکان {i % 40}"))
+    memory.relevant_scenes("", k=3)  # builds the index
+    text = "کاراکتر 3 و کاراکتر 7 در مکان 12"
+    return [
+        (f"scenes.relevant_{scenes}", lambda: memory.relevant_scenes(text, ["کاراکتر 3", "کاراکتر 7"], 5)),
+    ]
+
+
+def agent_cases(backend_factory: Callable[[], GeneratorBackend]) -> List[Case]:
+    memory = populated_memory()
+    backend = backend_factory()
+    extractor = CharacterExtractionAgent(backend, memory)
+    planner = ScenePlanningAgent(backend, memory)
+    validator = ConsistencyValidationAgent(backend, memory)
+    llm_validator = ConsistencyValidationAgent(backend, memory)
+    llm_validator.rule_validator = None
+    scenes = {"scenes": memory.scenes[-5:]}
+    return [
+        ("agent.character_extractor.process", lambda: asyncio.run(extractor.process({"story_text": SAMPLE_STORY}))),
+        ("agent.scene_planner.process", lambda: asyncio.run(planner.process({"story_text": SAMPLE_STORY}))),
+        ("agent.consistency_validator.process", lambda: asyncio.run(validator.process(scenes))),
+        ("agent.consistency_validator.process_llm_only", lambda: asyncio.run(llm_validator.process(scenes))),
+    ]
+
+
+def local_agent_cases(backend_factory: Callable[[], GeneratorBackend]) -> List[Case]:
+    backend = backend_factory()
+    extractor = CharacterExtractor(backend)
+    planner = ScenePlanner(backend)
+    validator = ConsistencyValidator(backend)
+    characters = {"Ahmad": LocalCharacter("Ahmad", 28), "Sara": LocalCharacter("Sara", 25)}
+    scenes = planner.plan_scenes(SAMPLE_STORY, characters)
+    return [
+        ("local.extract_characters", quiet(lambda: extractor.extract_characters(SAMPLE_STORY))),
+        ("local.plan_scenes", quiet(lambda: planner.plan_scenes(SAMPLE_STORY, characters))),
+        ("local.validate_consistency", quiet(lambda: validator.validate_consistency(characters, scenes))),
+    ]
+
+
+def end_to_end_cases(backend_factory: Callable[[], GeneratorBackend]) -> List[Case]:
+    def orchestrator_run():
+        orchestrator = MultiAgentOrchestrator(backend_factory())
+        orchestrator.initialize_agents()
+        return asyncio.run(orchestrator.process_story(SAMPLE_STORY))
+
+    return [
+        ("e2e.orchestrator.process_story", quiet(orchestrator_run)),
+        ("e2e.local.process_story", quiet(lambda: LocalMultiAgentSystem(backend_factory()).process_story(SAMPLE_STORY))),
+    ]
+
+
+def build_cases(backend_factory: Callable[[], GeneratorBackend]) -> List[Case]:
+    return (prompt_cases() + json_cases() + memory_cases() + similarity_cases() + scene_retrieval_cases()
+            + agent_cases(backend_factory) + local_agent_cases(backend_factory) + end_to_end_cases(backend_factory))
+
+
+def time_case(fn: Callable[[], Any], repeats: int, min_seconds: float) -> Dict[str, Any]:
+    """Per-call time: each repeat loops fn long enough to measure, median and min over repeats"""
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_seconds:
+        number *= 2
+    per_call = [seconds / number for seconds in timer.repeat(repeats, number)]
+    return {
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+        "min_us": round(min(per_call) * 1e6, 3),
+        "calls_per_repeat": number,
+        "repeats": repeats,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            threshold: float) -> Dict[str, Dict[str, Any]]:
+    """Median ratio against the baseline per case, flagged beyond +-threshold"""
+    comparison = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median_us"] / baseline[name]["median_us"]
+        status = "regression" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else "ok"
+        comparison[name] = {"baseline_us": baseline[name]["median_us"], "ratio": round(ratio, 3), "status": status}
+    return comparison
+
+
+def tiny_backend_factory() -> Callable[[], GeneratorBackend]:
+    from tiny_models import build_tiny_pair
+
+    # Trained on the agents' own prompts so their text tokenizes sensibly
+    corpus = [prompt for _, fn in prompt_cases() for prompt in [fn()]] + [SAMPLE_STORY]
+    tokenizer, model = build_tiny_pair(corpus)
+    backend = RawModelBackend(model, tokenizer, max_new_tokens=32, do_sample=False)
+    return lambda: backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write this run's results")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="also write this run's results here as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown ratio before a case fails")
+    parser.add_argument("--only", nargs="+", help="only cases whose name starts with one of these prefixes")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="minimum time per repeat")
+    parser.add_argument("--call-overhead", type=float, default=0.0, help="stub seconds per forward pass")
+    parser.add_argument("--tiny", action="store_true", help="generate with a random tiny GPT-2 instead of the stub")
+    args = parser.parse_args()
+
+    if args.tiny:
+        backend_factory = tiny_backend_factory()
+    else:
+        backend_factory = lambda: StubBackend(call_overhead=args.call_overhead)
+
+    cases = build_cases(backend_factory)
+    if args.only:
+        cases = [(name, fn) for name, fn in cases if name.startswith(tuple(args.only))]
+
+    baseline: Optional[Dict[str, Any]] = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    print(f"{'case':<46}{'median µs':>12}{'min µs':>12}{'vs baseline':>14}")
+    for name, fn in cases:
+        results[name] = time_case(fn, args.repeats, args.min_seconds)
+        line = f"{name:<46}{results[name]['median_us']:>12.1f}{results[name]['min_us']:>12.1f}"
+        if baseline is not None and name in baseline:
+            entry = compare({name: results[name]}, baseline, args.threshold)[name]
+            line += f"{entry['ratio']:>9.2f}x {'!' if entry['status'] == 'regression' else ''}"
+        print(line)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "tiny-gpt2" if args.tiny else "stub",
+            "call_overhead": args.call_overhead,
+            "threshold": args.threshold,
+        },
+        "results": results,
+    }
+    regressions = []
+    if baseline is not None:
+        report["comparison"] = compare(results, baseline, args.threshold)
+        regressions = [name for name, entry in report["comparison"].items() if entry["status"] == "regression"]
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
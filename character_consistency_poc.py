@@ -6,14 +6,52 @@ This script demonstrates how to maintain character consistency across multiple a
 processing different scenes of a story using shared memory and coordination.
 """
 
+import argparse
 import asyncio
+import copy
 import json
-import os
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+import re
+import string
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Any, Tuple, Union
+from dataclasses import dataclass, fields
 from datetime import datetime
 
-from transformers import pipeline
+from attribute_log import AttributeLog, AttributeVersion
+from character_index import AliasIndex
+from compact_models import CompactCharacter, CompactScene
+from early_stop import GenerationReport, summarize_generation
+from generator_backends import GeneratorBackend, StubBackend, as_backend
+from model_registry import LazyBackend, registry
+from ndjson_writer import NdjsonWriter
+from prompt_builder import PromptBuilder, PromptReport, encode_scenes, relevant_characters, summarize_reports
+from response_cache import CachedBackend, ResponseCache
+from rule_validator import AMBIGUOUS, CONSISTENT, FastPathReport, RuleValidator, SceneVerdict, summarize_fast_path
+from run_checkpoints import RunCheckpoints, backend_config
+from scheduler import AgentScheduler, Step
+from story_chunking import StoryChunk, chunk_story, iter_chunks
+from storyboard_store import PagedScenes, StoryboardStore
+from story_edits import ChunkRun, StoryRun, changed_characters, chunk_digest, match_chunks
+from tracing import FileSpanExporter, Span, Tracer, call_attributes, format_trace_table, trace_metadata
+
+# Cosine similarity (character_similarity.py) from which a character counts as referred to by a prompt's text
+MIN_TEXT_SIMILARITY = 0.2
+
+
+@dataclass
+class PromptTemplate:
+    """Minimal stand-in for LangChain's PromptTemplate (str.format based)"""
+    input_variables: List[str]
+    template: str
+
+    def format(self, **kwargs) -> str:
+        return self.template.format(**kwargs)
+
+    @property
+    def static_prefix(self) -> str:
+        """Literal text before the first input variable (identical in every prompt)"""
+        literal, _, _, _ = next(iter(string.Formatter().parse(self.template)), ("", None, None, None))
+        return literal
 
 
 @dataclass
@@ -31,7 +69,8 @@ class Character:
             self.relationships = {}
 
     def to_dict(self) -> Dict[str, Any]:
-        return {k: v for k, v in asdict(self).items() if v is not None}
+        # The relationships dict is copied one level (its values are strings) rather than through asdict()
+        return {k: dict(v) if isinstance(v, dict) else v for k, v in self.__dict__.items() if v is not None}
 
 
 @dataclass
@@ -49,63 +88,454 @@ class Scene:
         if self.key_actions is None:
             self.key_actions = []
 
+    def to_dict(self) -> Dict[str, Any]:
+        # Lists are copied one level (their items are strings) rather than through asdict()
+        return {k: list(v) if isinstance(v, list) else v for k, v in self.__dict__.items()}
+
 
 class SharedMemory:
     """Simulated shared memory for character consistency"""
 
-    def __init__(self):
+    def __init__(self, store: Optional[StoryboardStore] = None, compact: bool = False):
         self.characters: Dict[str, Character] = {}
         self.scenes: List[Scene] = []
         self.global_context: Dict[str, Any] = {}
-
-    def add_character(self, character: Character):
-        """Add or update character in shared memory"""
+        # Name variants ("دکتر احمد حسینی", "آقای حسینی", "احمد") -> key in self.characters
+        self.aliases = AliasIndex()
+        # Every value each character attribute has taken, keyed by scene id
+        self.attribute_log = AttributeLog()
+        # Store characters and scenes as slotted, interned CompactCharacter/CompactScene
+        self.compact = compact
+        # Callbacks (kind, payload) for streamed output; kinds are "character",
+        # "scene", "validation" and "checkpoint" (end of a phase or chunk)
+        self.observers: List[Callable[[str, Any], None]] = []
+        # Vector index for similar_characters(); built on the first query, then kept current
+        self._similarity = None
+        # Character/location/description index for relevant_scenes(); built on the first query
+        self._scene_index = None
+        # Optional persistent backing: characters and scenes are written through,
+        # scenes are read back page by page instead of held in a list
+        self.store = store
+        if store is not None:
+            self.scenes = PagedScenes(store, CompactScene if compact else Scene)
+            self.load_from_store()
+        # Position in scenes where the current run's scenes start; earlier ones
+        # (a store's history) are context for prompts, not validated or output again
+        self.run_start = len(self.scenes)
+
+    def load_from_store(self):
+        """Add the characters saved in the store (without writing them back)"""
+        for char_data in self.store.load_characters().values():
+            self._insert(Character(**char_data))
+
+    @property
+    def current_scene_id(self) -> int:
+        """Id of the last planned scene (0 before any scene); attribute versions are stamped with it"""
+        return self.scenes[-1].scene_id if self.scenes else 0
+
+    def add_character(self, character: Character, scene_id: Optional[int] = None) -> Character:
+        """Add a character, or merge it into the known character it is an alias of"""
+        canonical = self.aliases.resolve_one(character.name)
+        if canonical is None:
+            self._insert(character, scene_id)
+            character = self.characters[character.name]
+            self._persist(character)
+            self.notify("character", character)
+            return character
+
+        existing = self.characters[canonical]
+        self.aliases.add(canonical, character.name)
+        if character is not existing:
+            self._merge_into(existing, character, scene_id)
+            self._persist(existing)
+            self.notify("character", existing)
+        return existing
+
+    def _merge_into(self, existing: Character, character: Character, scene_id: Optional[int] = None):
+        """Values stated in character win; attributes it leaves out keep what was known"""
+        for field in fields(Character):
+            value = getattr(character, field.name)
+            if field.name == "name" or value is None:
+                continue
+            if field.name == "relationships":
+                existing.relationships.update(value)
+            else:
+                setattr(existing, field.name, value)
+            self._log_attribute(existing.name, field.name, value, scene_id)
+        self._reindex(existing)
+
+    def notify(self, kind: str, payload: Any):
+        for observer in self.observers:
+            observer(kind, payload)
+
+    def _insert(self, character: Character, scene_id: Optional[int] = None):
+        """Register a new character under its own name and log its initial attributes"""
+        if self.compact and not isinstance(character, CompactCharacter):
+            character = CompactCharacter.from_object(character)
         self.characters[character.name] = character
+        self.aliases.add(character.name)
+        self._reindex(character)
+        for field in fields(Character):
+            value = getattr(character, field.name)
+            if field.name != "name" and value is not None:
+                self._log_attribute(character.name, field.name, value, scene_id)
+
+    def _reindex(self, character: Character):
+        if self._similarity is not None:
+            self._similarity.add(character)
+
+    def _persist(self, character: Character):
+        if self.store is not None:
+            self.store.save_character(character.name, character.to_dict())
+
+    def _log_attribute(self, key: str, attribute: str, value: Any, scene_id: Optional[int]):
+        """Append a new attribute value to the version log (relationships per related character)"""
+        scene_id = self.current_scene_id if scene_id is None else scene_id
+        if attribute == "relationships":
+            for other, relation in value.items():
+                self.attribute_log.record(key, f"relationships.{other}", relation, scene_id)
+        else:
+            self.attribute_log.record(key, attribute, value, scene_id)
+
+    def attribute_at(self, name: str, attribute: str, scene_id: int) -> Any:
+        """Value a character attribute had at scene_id (by name or alias)"""
+        character = self.get_character(name)
+        if character is None:
+            return None
+        return self.attribute_log.value_at(character.name, attribute, scene_id)
+
+    def changes_since(self, scene_id: int) -> List[AttributeVersion]:
+        """Attribute versions recorded after scene_id, oldest first"""
+        return self.attribute_log.changes_since(scene_id)
+
+    def resolve(self, names: List[str]) -> Dict[str, Optional[str]]:
+        """Map each name variant to its character's key in self.characters (None if unknown)"""
+        return self.aliases.resolve(names)
 
     def get_character(self, name: str) -> Optional[Character]:
-        """Retrieve character from shared memory"""
-        return self.characters.get(name)
-
-    def update_character(self, name: str, **updates):
+        """Retrieve character from shared memory (by name or alias)"""
+        character = self.characters.get(name)
+        if character is None:
+            canonical = self.aliases.resolve_one(name)
+            character = self.characters.get(canonical) if canonical is not None else None
+        return character
+
+    def update_character(self, name: str, scene_id: Optional[int] = None, **updates):
         """Update character attributes"""
-        if name in self.characters:
-            char = self.characters[name]
+        char = self.get_character(name)
+        if char is not None:
             for key, value in updates.items():
                 if hasattr(char, key):
                     setattr(char, key, value)
+                    if key != "name" and value is not None:
+                        self._log_attribute(char.name, key, value, scene_id)
+            self._reindex(char)
+            self._persist(char)
+
+    def relevant_characters(self, text: str = "", names: Iterable[str] = (), similar: int = 3) -> List[Character]:
+        """Characters for a prompt about text, most relevant first
+
+        First the characters whose name the text mentions or that are in
+        names (prompt_builder.relevant_characters), then up to ``similar``
+        more that the text refers to without the exact name ("آقای حسینی",
+        a described appearance), found with similar_characters().
+        """
+        characters = list(self.characters.values())
+        found = relevant_characters(characters, text, names)
+        if text and similar and len(found) < len(characters):
+            included = {character.name for character in found}
+            found += [character for character, score in self.similar_characters(text, similar + len(found))
+                      if character.name not in included and score >= MIN_TEXT_SIMILARITY][:similar]
+        return found
+
+    def similar_characters(self, query: Union[str, Character], k: int = 5) -> List[Tuple[Character, float]]:
+        """Known characters most similar to a text or character, most similar first"""
+        return self.similar_characters_batch([query], k)[0]
+
+    def similar_characters_batch(self, queries: List[Union[str, Character]],
+                                 k: int = 5) -> List[List[Tuple[Character, float]]]:
+        """Top-k (character, cosine similarity) per query by hashed n-grams of name, appearance and personality
+
+        A character query never matches itself. The index is built on the
+        first call (needs numpy) and updated as characters are added.
+        """
+        if self._similarity is None:
+            from character_similarity import CharacterSimilarityIndex
+
+            self._similarity = CharacterSimilarityIndex()
+            self._similarity.add_many(list(self.characters.values()))
+        # One extra hit per query so dropping the query character itself still leaves k
+        hits = self._similarity.query(queries, k + 1)
+        results = []
+        for query, query_hits in zip(queries, hits):
+            own = None if isinstance(query, str) else query.name
+            results.append([(self.characters[name], score) for name, score in query_hits if name != own][:k])
+        return results
 
     def add_scene(self, scene: Scene):
         """Add scene to shared memory"""
+        if self.compact and not isinstance(scene, CompactScene):
+            scene = CompactScene.from_object(scene)
         self.scenes.append(scene)
+        if self._scene_index is not None:
+            self._scene_index.add(scene)
+        self.notify("scene", scene)
+
+    def begin_run(self):
+        """Start a new run: scenes added from now on are the ones run_scenes() returns"""
+        self.run_start = len(self.scenes)
+
+    def run_scenes(self) -> List[Scene]:
+        """Scenes added since begin_run() (all scenes of a memory without stored history)"""
+        return self.scenes[self.run_start:]
 
     def get_all_characters(self) -> Dict[str, Character]:
         """Get all characters"""
         return self.characters.copy()
 
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Characters and the current run's scenes as plain data (for checkpoints)"""
+        return {
+            "characters": [character.to_dict() for character in self.characters.values()],
+            "scenes": [scene.to_dict() for scene in self.run_scenes()],
+        }
+
+    def restore(self, snapshot: Dict[str, List[Dict[str, Any]]]):
+        """Add the characters and scenes of a snapshot, which become the current run's scenes
+
+        Scene ids only grow, so a scene at or below current_scene_id is
+        already held (a store keeps the scenes of an interrupted run) and is
+        not appended twice.
+        """
+        for char_data in snapshot.get("characters", []):
+            self.add_character(Character(**char_data))
+        scenes = snapshot.get("scenes", [])
+        for scene_data in scenes:
+            if scene_data["scene_id"] > self.current_scene_id:
+                self.add_scene(Scene(**scene_data))
+        self.run_start = len(self.scenes) - len(scenes)
+
     def get_recent_scenes(self, limit: int = 3) -> List[Scene]:
         """Get recent scenes for context"""
         return self.scenes[-limit:] if self.scenes else []
 
+    def relevant_scenes(self, text: str = "", characters: Iterable[str] = (), k: int = 3,
+                        exclude: Iterable[Scene] = ()) -> List[Scene]:
+        """The k scenes most relevant to a text and its characters, in story order
+
+        Scenes score by shared characters, a location named in the text and
+        description similarity (scene_index.py). With k or fewer scenes no
+        index is needed; otherwise it is built on the first call (needs
+        numpy) and updated as scenes are added. Scenes that reached a shared
+        store without add_scene (other worker processes) are indexed on the
+        next call.
+        """
+        exclude = list(exclude)
+        if len(self.scenes) <= k:
+            excluded = {(scene.scene_id, scene.description) for scene in exclude}
+            return [scene for scene in self.scenes if (scene.scene_id, scene.description) not in excluded]
+        if self._scene_index is None:
+            from scene_index import SceneIndex
+
+            self._scene_index = SceneIndex()
+        # Positions in the index follow self.scenes, so only the tail is missing
+        for scene in self.scenes[len(self._scene_index):]:
+            self._scene_index.add(scene)
+        return [self.scenes[position] for position in self._scene_index.search(text, characters, k, exclude)]
+
+
+# Output schemas for constrained JSON decoding (json_constraint.py); the
+# length and item caps bound how many tokens a constrained answer can take
+NAME_SCHEMA = {"type": "string", "maxLength": 60}
+TEXT_SCHEMA = {"type": "string", "maxLength": 200}
+TEXT_LIST_SCHEMA = {"type": "array", "items": TEXT_SCHEMA, "maxItems": 5}
+
+CHARACTERS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "characters": {
+            "type": "array",
+            "maxItems": 10,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": NAME_SCHEMA,
+                    "age": {"type": ["integer", "null"]},
+                    "appearance": TEXT_SCHEMA,
+                    "personality": TEXT_SCHEMA,
+                    "role": TEXT_SCHEMA,
+                    "relationships": {"type": "object", "additionalProperties": NAME_SCHEMA},
+                },
+                "required": ["name"],
+            },
+        }
+    },
+    "required": ["characters"],
+}
+
+SCENES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "scenes": {
+            "type": "array",
+            "maxItems": 10,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "scene_id": {"type": "integer"},
+                    "description": TEXT_SCHEMA,
+                    "characters_present": {"type": "array", "items": NAME_SCHEMA, "maxItems": 10},
+                    "location": NAME_SCHEMA,
+                    "time_of_day": NAME_SCHEMA,
+                    "mood": NAME_SCHEMA,
+                    "key_actions": TEXT_LIST_SCHEMA,
+                },
+                "required": ["scene_id", "description", "characters_present", "location"],
+            },
+        }
+    },
+    "required": ["scenes"],
+}
+
+VALIDATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "validation_results": {
+            "type": "array",
+            "maxItems": 20,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "scene_id": {"type": "integer"},
+                    "is_consistent": {"type": "boolean"},
+                    "issues": TEXT_LIST_SCHEMA,
+                    "suggestions": TEXT_LIST_SCHEMA,
+                },
+                "required": ["scene_id", "is_consistent"],
+            },
+        },
+        "overall_consistency": {"type": "string", "maxLength": 10},
+    },
+    "required": ["validation_results", "overall_consistency"],
+}
+
+
+def consistency_percent(value: Any) -> Optional[float]:
+    """Number in an overall_consistency value ("85%" -> 85.0), or None"""
+    match = re.search(r"\d+(\.\d+)?", str(value))
+    return float(match.group()) if match else None
+
 
 class StoryProcessingAgent:
     """Base agent for processing story elements"""
 
-    def __init__(self, name: str, generator, shared_memory: SharedMemory):
+    # Sampling parameters passed to the backend on every call; generation
+    # stops as soon as the answer's JSON object closes
+    generation_kwargs: Dict[str, Any] = {
+        "max_new_tokens": 256,
+        "do_sample": True,
+        "temperature": 0.7,
+        "stop_on_json": True,
+    }
+    # JSON schema the output is constrained to (None: unconstrained)
+    output_schema: Optional[Dict[str, Any]] = None
+
+    def __init__(self, name: str, backend: GeneratorBackend, shared_memory: SharedMemory):
         self.name = name
-        self.generator = generator
+        self.backend = backend
         self.shared_memory = shared_memory
         self.memory = []  # Simple list for conversation history
+        self.scheduler: Optional[AgentScheduler] = None
+        self.prompt_builder = PromptBuilder(tokenizer=getattr(backend, "tokenizer", None))
+        self.prompt_reports: List[PromptReport] = []
+        self.generation_reports: List[GenerationReport] = []
+        # Spans of this agent's backend calls (see tracing.py); the orchestrator shares its tracer
+        self.tracer = Tracer()
+        self.call_spans: List[Span] = []
+
+    @property
+    def model_key(self) -> str:
+        """Key used for per-model concurrency limits"""
+        return getattr(self.backend, "model_id", None) or "default"
+
+    def build_prompt(self, input_data: Dict[str, Any]) -> str:
+        """Build the prompt from input data and shared memory"""
+        raise NotImplementedError
+
+    def parse_response(self, result: str) -> Dict[str, Any]:
+        """Parse generated text and update shared memory"""
+        raise NotImplementedError
 
     async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Process input data and return results"""
-        raise NotImplementedError
+        with self.tracer.span(self.name) as span:
+            prompt_text = self.build_prompt(input_data)
+            # Taken before the await: scheduled calls on this agent append their own reports meanwhile
+            prompt_report = self.last_prompt_report()
+            started = time.perf_counter()
+            result = await self.generate(prompt_text)
+            generate_seconds = time.perf_counter() - started
+            generation_report = self.record_generation(result)
+            parsed = self.parse_response(result)
+            span.attributes.update(self.call_attributes(generate_seconds, parsed, prompt_report, generation_report))
+            self.call_spans.append(span)
+        return parsed
+
+    def last_prompt_report(self) -> Optional[PromptReport]:
+        """Report of the prompt build_prompt just assembled (None if it keeps none)"""
+        return self.prompt_reports[-1] if self.prompt_reports else None
+
+    def call_attributes(self, generate_seconds: float, parsed: Dict[str, Any], prompt_report: Optional[PromptReport],
+                        generation_report: GenerationReport, batch_size: int = 1) -> Dict[str, Any]:
+        """Call span attributes from one call's prompt and generation reports"""
+        return call_attributes(
+            prompt_report.tokens if prompt_report is not None else 0,
+            generation_report.generated_tokens,
+            generate_seconds,
+            parsed="error" not in parsed,
+            batch_size=batch_size
+        )
+
+    def record_generation(self, result: str) -> GenerationReport:
+        """Account the tokens of a completion against the max_new_tokens budget"""
+        report = GenerationReport(
+            self.name, self.generation_kwargs["max_new_tokens"], self.prompt_builder.count_tokens(result)
+        )
+        self.generation_reports.append(report)
+        return report
+
+    def generation_params(self) -> Dict[str, Any]:
+        """Backend params for one call: sampling settings plus the output schema"""
+        if self.output_schema is None:
+            return dict(self.generation_kwargs)
+        return {**self.generation_kwargs, "json_schema": self.output_schema}
+
+    async def generate(self, prompt_text: str) -> str:
+        """Call the backend, off the event loop when a scheduler is attached"""
+        if self.scheduler is None:
+            return self.backend.generate([prompt_text], **self.generation_params())[0]
+        texts = await self.scheduler.run_blocking(
+            self.model_key, self.backend.generate, [prompt_text], **self.generation_params()
+        )
+        return texts[0]
+
+    @staticmethod
+    def extract_json(result: str) -> Optional[Dict[str, Any]]:
+        """Return the outermost JSON object in the response, or None if absent"""
+        start_idx = result.find('{')
+        end_idx = result.rfind('}') + 1
+        if start_idx == -1 or end_idx <= start_idx:
+            return None
+        return json.loads(result[start_idx:end_idx])
 
 
 class CharacterExtractionAgent(StoryProcessingAgent):
     """Agent responsible for extracting and maintaining character information"""
 
-    def __init__(self, llm: ChatOpenAI, shared_memory: SharedMemory):
-        super().__init__("CharacterExtractor", llm, shared_memory)
+    output_schema = CHARACTERS_SCHEMA
+
+    def __init__(self, backend: GeneratorBackend, shared_memory: SharedMemory):
+        super().__init__("CharacterExtractor", backend, shared_memory)
 
         self.prompt = PromptTemplate(
             input_variables=["story_text", "existing_characters"],
@@ -142,41 +572,37 @@ class CharacterExtractionAgent(StoryProcessingAgent):
             """
         )
 
-    async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        existing_chars = self.shared_memory.get_all_characters()
-        existing_chars_json = json.dumps(
-            [char.to_dict() for char in existing_chars.values()],
-            ensure_ascii=False,
-            indent=2
-        )
+    def build_prompt(self, input_data: Dict[str, Any]) -> str:
+        story_text = input_data["story_text"]
+        existing_chars = list(self.shared_memory.get_all_characters().values())
 
-        # Create prompt
-        prompt_text = self.prompt.format(
-            story_text=input_data["story_text"],
-            existing_characters=existing_chars_json
+        prompt_text, report = self.prompt_builder.build(
+            self.name, self.prompt, {"story_text": story_text},
+            characters_field="existing_characters",
+            characters=self.shared_memory.relevant_characters(story_text),
+            all_characters=existing_chars
         )
+        self.prompt_reports.append(report)
+        return prompt_text
 
-        # Generate response using local model
-        outputs = self.generator(prompt_text, max_new_tokens=256, do_sample=True, temperature=0.7)
-        result = outputs[0]['generated_text']
-
+    def parse_response(self, result: str) -> Dict[str, Any]:
         # Extract JSON from response (simple approach)
         try:
-            # Try to find JSON in the response
-            start_idx = result.find('{')
-            end_idx = result.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = result[start_idx:end_idx]
-                parsed_result = json.loads(json_str)
-
-                # Update shared memory with new characters
-                for char_data in parsed_result.get("characters", []):
-                    char = Character(**char_data)
-                    self.shared_memory.add_character(char)
-
-                return {"characters_extracted": len(parsed_result.get("characters", []))}
-            else:
+            parsed_result = self.extract_json(result)
+            if parsed_result is None:
                 return {"error": "No JSON found in response", "raw_response": result[:500]}
+
+            # Update shared memory with new characters. Extraction runs before this
+            # text's scenes are planned, so its values hold from the next scene id on
+            next_scene_id = self.shared_memory.current_scene_id + 1
+            for char_data in parsed_result.get("characters", []):
+                char = Character(**char_data)
+                self.shared_memory.add_character(char, scene_id=next_scene_id)
+
+            return {
+                "characters_extracted": len(parsed_result.get("characters", [])),
+                "characters": parsed_result.get("characters", [])
+            }
         except json.JSONDecodeError:
             return {"error": "Failed to parse character extraction result", "raw_response": result[:500]}
 
@@ -184,8 +610,12 @@ class CharacterExtractionAgent(StoryProcessingAgent):
 class ScenePlanningAgent(StoryProcessingAgent):
     """Agent responsible for breaking story into consistent scenes"""
 
-    def __init__(self, llm: ChatOpenAI, shared_memory: SharedMemory):
-        super().__init__("ScenePlanner", llm, shared_memory)
+    output_schema = SCENES_SCHEMA
+
+    def __init__(self, backend: GeneratorBackend, shared_memory: SharedMemory):
+        super().__init__("ScenePlanner", backend, shared_memory)
+        # Earlier scenes shown to the model: the latest one plus the most relevant others
+        self.context_scenes = 3
 
         self.prompt = PromptTemplate(
             input_variables=["story_text", "characters_info", "previous_scenes"],
@@ -230,33 +660,43 @@ class ScenePlanningAgent(StoryProcessingAgent):
             """
         )
 
-    async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        characters = self.shared_memory.get_all_characters()
-        characters_json = json.dumps(
-            [char.to_dict() for char in characters.values()],
-            ensure_ascii=False,
-            indent=2
-        )
-
-        recent_scenes = self.shared_memory.get_recent_scenes()
-        scenes_json = json.dumps(
-            [asdict(scene) for scene in recent_scenes],
-            ensure_ascii=False,
-            indent=2
-        )
-
-        chain = LLMChain(llm=self.llm, prompt=self.prompt)
-        result = await chain.arun(
-            story_text=input_data["story_text"],
-            characters_info=characters_json,
-            previous_scenes=scenes_json
+    def build_prompt(self, input_data: Dict[str, Any]) -> str:
+        story_text = input_data["story_text"]
+        characters = list(self.shared_memory.get_all_characters().values())
+        mentioned = self.shared_memory.relevant_characters(story_text)
+        # The latest scene keeps numbering and continuity; the rest are the
+        # earlier scenes sharing this chunk's characters, places and wording
+        latest = self.shared_memory.get_recent_scenes(1)
+        previous_scenes = self.shared_memory.relevant_scenes(
+            story_text, [char.name for char in mentioned], self.context_scenes - len(latest), exclude=latest
+        ) + latest
+
+        prompt_text, report = self.prompt_builder.build(
+            self.name, self.prompt, {"story_text": story_text},
+            characters_field="characters_info",
+            characters=mentioned,
+            all_characters=characters,
+            scenes_field="previous_scenes",
+            scenes=previous_scenes
         )
+        self.prompt_reports.append(report)
+        return prompt_text
 
+    def parse_response(self, result: str) -> Dict[str, Any]:
         try:
-            parsed_result = json.loads(result)
-            # Add scenes to shared memory
-            for scene_data in parsed_result.get("scenes", []):
-                scene = Scene(**scene_data)
+            parsed_result = self.extract_json(result)
+            if parsed_result is None:
+                return {"error": "No JSON found in response"}
+
+            # Add scenes to shared memory, naming characters by their canonical names and
+            # numbering them after the scenes already stored (each chunk numbers its scenes from 1)
+            first_id = self.shared_memory.current_scene_id + 1
+            for scene_id, scene_data in enumerate(parsed_result.get("scenes", []), start=first_id):
+                scene = Scene(**{**scene_data, "scene_id": scene_id})
+                resolved = self.shared_memory.resolve(scene.characters_present)
+                scene.characters_present = list(dict.fromkeys(
+                    resolved[name] or name for name in scene.characters_present
+                ))
                 self.shared_memory.add_scene(scene)
 
             return {"scenes_planned": len(parsed_result.get("scenes", []))}
@@ -267,11 +707,19 @@ class ScenePlanningAgent(StoryProcessingAgent):
 class ConsistencyValidationAgent(StoryProcessingAgent):
     """Agent responsible for validating character consistency across scenes"""
 
-    def __init__(self, llm: ChatOpenAI, shared_memory: SharedMemory):
-        super().__init__("ConsistencyValidator", llm, shared_memory)
+    output_schema = VALIDATION_SCHEMA
+
+    def __init__(self, backend: GeneratorBackend, shared_memory: SharedMemory):
+        super().__init__("ConsistencyValidator", backend, shared_memory)
+        # Scenes the rules can decide never reach the model; None validates everything with the LLM
+        self.rule_validator: Optional[RuleValidator] = RuleValidator(shared_memory)
+        self.fast_path_reports: List[FastPathReport] = []
+        # Scenes validated per model call, and earlier related scenes shown alongside them for comparison
+        self.scenes_per_call = 8
+        self.context_scenes = 3
 
         self.prompt = PromptTemplate(
-            input_variables=["scenes", "characters_info"],
+            input_variables=["scenes", "characters_info", "related_scenes"],
             template="""
             شما یک validator consistency هستید. صحنه‌های زیر را بررسی کنید و اطمینان حاصل کنید که کاراکترها در همه صحنه‌ها consistent هستند.
 
@@ -281,6 +729,9 @@ class ConsistencyValidationAgent(StoryProcessingAgent):
             صحنه‌ها:
             {scenes}
 
+            صحنه‌های مرتبط دیگر (فقط برای مقایسه، نتیجه‌ای برایشان ندهید):
+            {related_scenes}
+
             برای هر inconsistency، مشکل را شناسایی کرده و پیشنهاد اصلاح بدهید.
 
             خروجی را به صورت JSON بدهید:
@@ -298,118 +749,725 @@ class ConsistencyValidationAgent(StoryProcessingAgent):
             """
         )
 
-    async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
-        characters = self.shared_memory.get_all_characters()
-        characters_json = json.dumps(
-            [char.to_dict() for char in characters.values()],
-            ensure_ascii=False,
-            indent=2
-        )
-
-        scenes = self.shared_memory.scenes
-        scenes_json = json.dumps(
-            [asdict(scene) for scene in scenes],
-            ensure_ascii=False,
-            indent=2
-        )
-
-        chain = LLMChain(llm=self.llm, prompt=self.prompt)
-        result = await chain.arun(
-            characters_info=characters_json,
-            scenes=scenes_json
+    def build_prompt(self, input_data: Dict[str, Any]) -> str:
+        prompt_text, report = self.render_prompt(input_data)
+        self.prompt_reports.append(report)
+        return prompt_text
+
+    def render_prompt(self, input_data: Dict[str, Any]) -> Tuple[str, PromptReport]:
+        """Prompt and its report, without recording it; the scenes under validation are never trimmed"""
+        characters = list(self.shared_memory.get_all_characters().values())
+        scenes = input_data.get("scenes", self.shared_memory.run_scenes())
+
+        # Only the characters that appear in (or are described by) these scenes
+        names = [name for scene in scenes for name in scene.characters_present]
+        present = {canonical or name for name, canonical in self.shared_memory.resolve(names).items()}
+        scene_text = " ".join(scene.description for scene in scenes)
+        # Other scenes with the same characters or places, so a group can be checked against the rest of the story
+        related = []
+        if "scenes" in input_data and self.context_scenes:
+            related = self.shared_memory.relevant_scenes(scene_text, present, self.context_scenes, exclude=scenes)
+
+        return self.prompt_builder.build(
+            self.name, self.prompt, {"related_scenes": encode_scenes(related)},
+            characters_field="characters_info",
+            characters=self.shared_memory.relevant_characters(scene_text, present),
+            all_characters=characters,
+            scenes_field="scenes",
+            scenes=scenes,
+            trim_scenes=False
         )
 
+    def parse_response(self, result: str) -> Dict[str, Any]:
         try:
-            return json.loads(result)
+            parsed_result = self.extract_json(result)
+            if parsed_result is None:
+                return {"error": "No JSON found in response"}
+            return parsed_result
         except json.JSONDecodeError:
             return {"error": "Failed to parse validation result"}
 
+    async def process(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        decided, escalated = self.triage(input_data)
+        llm_result = None
+        results = []
+        if escalated is not None:
+            groups = self.split(escalated)
+            for group in groups:
+                results.append(await super().process(group))
+            llm_result = self.merge_groups(groups, results)
+        return self.publish(self.combine(decided, escalated, llm_result, len(results)))
+
+    def publish(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Hand each per-scene result to the shared memory's observers"""
+        for entry in result.get("validation_results", []):
+            self.shared_memory.notify("validation", entry)
+        return result
+
+    def triage(self, input_data: Dict[str, Any]) -> Tuple[List[SceneVerdict], Optional[Dict[str, Any]]]:
+        """Rule verdicts for the scenes they decide, and the LLM input for the rest (None if no call is needed)"""
+        if self.rule_validator is None:
+            return [], input_data
+        scenes = input_data.get("scenes", self.shared_memory.run_scenes())
+        verdicts = self.rule_validator.check(scenes)
+        escalated = [scene for scene, verdict in zip(scenes, verdicts) if verdict.verdict == AMBIGUOUS]
+        decided = [verdict for verdict in verdicts if verdict.verdict != AMBIGUOUS]
+        return decided, ({"scenes": escalated} if escalated else None)
+
+    def split(self, escalated: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """LLM inputs of at most scenes_per_call scenes each, so prompt size does not grow with the story
+
+        A group whose prompt is still over budget is halved until it fits
+        (or is down to one scene), since its scenes cannot be trimmed.
+        """
+        scenes = escalated.get("scenes", self.shared_memory.run_scenes())
+        if len(scenes) <= self.scenes_per_call:
+            groups = [escalated]
+        else:
+            scenes = list(scenes)
+            groups = [{"scenes": scenes[start:start + self.scenes_per_call]}
+                      for start in range(0, len(scenes), self.scenes_per_call)]
+        return [part for group in groups for part in self._fit_budget(group)]
+
+    def _fit_budget(self, group: Dict[str, Any]) -> List[Dict[str, Any]]:
+        scenes = list(group.get("scenes", self.shared_memory.run_scenes()))
+        if len(scenes) <= 1 or not self.render_prompt(group)[1].over_budget:
+            return [group]
+        half = len(scenes) // 2
+        return self._fit_budget({"scenes": scenes[:half]}) + self._fit_budget({"scenes": scenes[half:]})
+
+    @staticmethod
+    def merge_groups(groups: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """One LLM result from per-group results, overall_consistency weighted by group size"""
+        if len(results) == 1:
+            return results[0]
+        merged: Dict[str, Any] = {"validation_results": []}
+        scored, total, errors = 0, 0.0, []
+        for group, result in zip(groups, results):
+            merged["validation_results"].extend(result.get("validation_results", []))
+            score = consistency_percent(result.get("overall_consistency", ""))
+            if score is not None:
+                scored += len(group["scenes"])
+                total += score * len(group["scenes"])
+            if "error" in result:
+                errors.append(result["error"])
+        merged["overall_consistency"] = f"{total / scored:.0f}%" if scored else "نامشخص"
+        if errors:
+            merged["error"] = "; ".join(errors)
+        return merged
+
+    def combine(self, decided: List[SceneVerdict], escalated: Optional[Dict[str, Any]],
+                llm_result: Optional[Dict[str, Any]], llm_calls: int = 0) -> Dict[str, Any]:
+        """Merge rule verdicts with the LLM result for the escalated scenes
+
+        overall_consistency weights the model's score by the number of
+        scenes it validated; rule-decided scenes count 100 or 0. llm_calls
+        is the number of group calls made for the escalated scenes.
+        """
+        if self.rule_validator is None:
+            return llm_result
+        escalated_count = len(escalated["scenes"]) if escalated is not None else 0
+        scenes = len(decided) + escalated_count
+        # Without the fast path every scene is validated, scenes_per_call per call
+        needed = -(-scenes // self.scenes_per_call)
+        self.fast_path_reports.append(FastPathReport(scenes, len(decided), escalated_count, llm_calls, needed))
+
+        merged: Dict[str, Any] = {"validation_results": [verdict.to_result() for verdict in decided]}
+        scored = len(decided)
+        total = 100.0 * sum(verdict.verdict == CONSISTENT for verdict in decided)
+        if llm_result is not None:
+            merged["validation_results"].extend(llm_result.get("validation_results", []))
+            score = consistency_percent(llm_result.get("overall_consistency", ""))
+            if score is not None:
+                scored += escalated_count
+                total += score * escalated_count
+            if "error" in llm_result:
+                merged["error"] = llm_result["error"]
+        merged["overall_consistency"] = f"{total / scored:.0f}%" if scored else "نامشخص"
+        return merged
+
 
 class MultiAgentOrchestrator:
     """Orchestrates the multi-agent system for video generation"""
 
-    def __init__(self):
-        # Use local GPT-2 model (no API key required)
-        print("🔄 Loading local GPT-2 model... (this may take a moment)")
-        self.generator = pipeline(
-            "text-generation",
-            model="gpt2",
-            max_new_tokens=256,  # Limit output length
-            temperature=0.7,
-            do_sample=True,
-            pad_token_id=50256,
-            repetition_penalty=1.1  # Reduce repetition
+    def __init__(self, backend: Optional[GeneratorBackend] = None, cache: Optional[ResponseCache] = None,
+                 seed: Optional[int] = None, scheduler: Optional[AgentScheduler] = None,
+                 prompt_budgets: Optional[Dict[str, int]] = None, reuse_prefix_kv: bool = False,
+                 prewarm: bool = False, constrain_json: bool = True, fast_validation: bool = True,
+                 store: Optional[StoryboardStore] = None, compact_memory: bool = False,
+                 checkpoints: Optional[RunCheckpoints] = None, resume: bool = False,
+                 tracer: Optional[Tracer] = None, agent_backends: Optional[Dict[str, GeneratorBackend]] = None,
+                 assisted_agents: Iterable[str] = (), draft_model: str = "distilgpt2"):
+        # Sampling defaults for the local GPT-2 model
+        model_defaults = {
+            "max_new_tokens": 256,  # Limit output length
+            "temperature": 0.7,
+            "do_sample": True,
+            "pad_token_id": 50256,
+            "repetition_penalty": 1.1  # Reduce repetition
+        }
+        default_model = backend is None
+        if backend is None:
+            # Local GPT-2 (no API key required), loaded on first generate() and
+            # shared through the model registry; prewarm starts loading now in
+            # the background. With reuse_prefix_kv, template prefixes are
+            # prefilled once and their KV cache reused.
+            backend = LazyBackend("gpt2", kind="prefix" if reuse_prefix_kv else "pipeline",
+                                  prewarm=prewarm, **model_defaults)
+        # Backends for individual agents, keyed by agent name like prompt_budgets;
+        # the other agents use the shared backend. assisted_agents decode the
+        # default GPT-2 with draft_model proposing tokens (assisted_decoding.py).
+        agent_backends = dict(agent_backends or {})
+        if assisted_agents:
+            if not default_model:
+                raise ValueError("assisted_agents applies to the default local model; pass agent_backends instead")
+            assisted = LazyBackend("gpt2", kind="assisted", prewarm=prewarm, draft_model_id=draft_model,
+                                   **model_defaults)
+            for name in assisted_agents:
+                agent_backends.setdefault(name, assisted)
+        backend = as_backend(backend)
+        agent_backends = {name: as_backend(agent_backend) for name, agent_backend in agent_backends.items()}
+        if cache is not None:
+            # Reuse responses for repeated prompts (requires do_sample=False or a fixed seed)
+            backend = CachedBackend(backend, cache, seed=seed)
+            agent_backends = {name: CachedBackend(agent_backend, cache, seed=seed)
+                              for name, agent_backend in agent_backends.items()}
+        self.backend = backend
+        self.agent_backends = agent_backends
+        self.scheduler = scheduler
+        # Constrain agent outputs to their JSON schemas while decoding
+        self.constrain_json = constrain_json
+        # Check scenes with deterministic rules and only send ambiguous ones to the LLM validator
+        self.fast_validation = fast_validation
+        self.prompt_builder = PromptBuilder(
+            tokenizer=getattr(backend, "tokenizer", None),
+            budgets=prompt_budgets or {}
         )
-        self.shared_memory = SharedMemory()
+        # Slotted, interned characters and scenes in every SharedMemory this orchestrator creates
+        self.compact_memory = compact_memory
+        # With a store, process_story's characters and scenes persist across runs
+        self.shared_memory = SharedMemory(store, compact=compact_memory)
         self.agents = {}
+        # Per-chunk results of the last process_story_edited run
+        self.last_run: Optional[StoryRun] = None
+        # Per-phase checkpoints of process_story/process_stories; with resume,
+        # completed phases and stories are loaded instead of run again
+        self.resume = resume
+        self.checkpoints = checkpoints if checkpoints is not None or not resume else RunCheckpoints()
+        # Phase and agent call spans; pass Tracer(FileSpanExporter(path)) to also write them to a file
+        self.tracer = tracer if tracer is not None else Tracer()
+
+    def new_memory(self) -> SharedMemory:
+        """Fresh SharedMemory for one story"""
+        return SharedMemory(compact=self.compact_memory)
 
     def initialize_agents(self):
         """Initialize all agents"""
-        self.agents["character_extractor"] = CharacterExtractionAgent(
-            self.generator, self.shared_memory
-        )
-        self.agents["scene_planner"] = ScenePlanningAgent(
-            self.generator, self.shared_memory
-        )
-        self.agents["consistency_validator"] = ConsistencyValidationAgent(
-            self.generator, self.shared_memory
-        )
-
-    async def process_story(self, story_text: str) -> Dict[str, Any]:
-        """Process a story through the multi-agent pipeline"""
+        self.agents = self.create_agents(self.shared_memory)
+
+    def create_agents(self, shared_memory: SharedMemory) -> Dict[str, StoryProcessingAgent]:
+        """Create a full agent set bound to the given shared memory"""
+        agents = {
+            "character_extractor": CharacterExtractionAgent(self.backend, shared_memory),
+            "scene_planner": ScenePlanningAgent(self.backend, shared_memory),
+            "consistency_validator": ConsistencyValidationAgent(self.backend, shared_memory),
+        }
+        for agent in agents.values():
+            agent.backend = self.agent_backends.get(agent.name, self.backend)
+            agent.scheduler = self.scheduler
+            agent.prompt_builder = self.prompt_builder
+            agent.tracer = self.tracer
+            if not self.constrain_json:
+                agent.output_schema = None
+            if hasattr(agent.backend, "register_prefix"):
+                agent.backend.register_prefix(agent.prompt.static_prefix)
+        if not self.fast_validation:
+            agents["consistency_validator"].rule_validator = None
+        return agents
+
+    async def process_story(self, story_text: str, resume: Optional[bool] = None) -> Dict[str, Any]:
+        """Process a story through the multi-agent pipeline
+
+        With checkpoints, every phase is saved as it completes. With resume
+        (default: the orchestrator's setting) a rerun on a fresh orchestrator
+        restores the last completed phase and continues from there, or
+        returns the saved output of a finished story.
+        """
 
         print("🚀 شروع پردازش داستان...")
         print(f"📖 طول داستان: {len(story_text)} کاراکتر")
+        for agent in self.agents.values():
+            agent.prompt_reports.clear()
+            agent.generation_reports.clear()
+            agent.call_spans.clear()
+        self.agents["consistency_validator"].fast_path_reports.clear()
+
+        key = self.checkpoint_key(story_text)
+        state = self._load_checkpoint(key, self.resume if resume is None else resume)
+        if "output" in state:
+            print("♻️ خروجی این داستان از checkpoint بازیابی شد")
+            return state["output"]
+        phases = state.get("phases", {})
+        # Validation and output cover this run's scenes, not a store's earlier ones
+        self.shared_memory.begin_run()
+        if phases:
+            self.shared_memory.restore(state["memory"])
+
+        with self.tracer.span("process_story", story_length=len(story_text)) as trace:
+            validation_result = await self._run_phases(story_text, key, phases)
+
+        output = self.build_output(story_text, self.shared_memory, self.agents, validation_result, trace)
+        if key is not None:
+            self.checkpoints.save_output(key, output)
+
+        print("\n🎉 پردازش کامل شد!")
+        print(format_trace_table(output["metadata"]["tracing"]))
+        return output
+
+    async def _run_phases(self, story_text: str, key: Optional[str], phases: Dict[str, Any]) -> Dict[str, Any]:
+        """The three phases of process_story, each in its own span; returns the validation result"""
 
         # Phase 1: Character Extraction
         print("\n📝 مرحله 1: استخراج کاراکترها...")
-        char_result = await self.agents["character_extractor"].process({
-            "story_text": story_text
-        })
+        with self.tracer.span("characters", restored="characters" in phases):
+            if "characters" in phases:
+                char_result = phases["characters"]
+            else:
+                char_result = await self.agents["character_extractor"].process({
+                    "story_text": story_text
+                })
+                self._save_phase(key, "characters", char_result, self.shared_memory)
         print(f"✅ {char_result.get('characters_extracted', 0)} کاراکتر استخراج شد")
+        self.shared_memory.notify("checkpoint", {"phase": "characters"})
 
         # Phase 2: Scene Planning
         print("\n🎬 مرحله 2: برنامه‌ریزی صحنه‌ها...")
-        scene_result = await self.agents["scene_planner"].process({
-            "story_text": story_text
-        })
+        with self.tracer.span("scenes", restored="scenes" in phases):
+            if "scenes" in phases:
+                scene_result = phases["scenes"]
+            else:
+                scene_result = await self.agents["scene_planner"].process({
+                    "story_text": story_text
+                })
+                self._save_phase(key, "scenes", scene_result, self.shared_memory)
         print(f"✅ {scene_result.get('scenes_planned', 0)} صحنه برنامه‌ریزی شد")
+        self.shared_memory.notify("checkpoint", {"phase": "scenes"})
 
         # Phase 3: Consistency Validation
         print("\n🔍 مرحله 3: بررسی consistency...")
-        validation_result = await self.agents["consistency_validator"].process({})
-        consistency_score = validation_result.get("overall_consistency", "نامشخص")
-        print(f"✅ امتیاز consistency: {consistency_score}")
-
-        # Prepare final output
-        output = {
+        with self.tracer.span("validation"):
+            validation_result = await self.agents["consistency_validator"].process({})
+        print(f"✅ امتیاز consistency: {validation_result.get('overall_consistency', 'نامشخص')}")
+        fast_path = summarize_fast_path(self.agents["consistency_validator"].fast_path_reports)
+        if fast_path["scenes"]:
+            print(f"⚡ {fast_path['decided_by_rules']} صحنه با قواعد بررسی شد، "
+                  f"{fast_path['llm_calls_avoided']} فراخوانی LLM حذف شد")
+        self.shared_memory.notify("checkpoint", {"phase": "validation"})
+        return validation_result
+
+    def checkpoint_key(self, story_text: str) -> Optional[str]:
+        """Checkpoint key of a story (None without checkpoints)"""
+        if self.checkpoints is None:
+            return None
+        config = {
+            "backend": backend_config(self.backend),
+            "agent_backends": {name: backend_config(backend) for name, backend in self.agent_backends.items()},
+            "constrain_json": self.constrain_json,
+            "fast_validation": self.fast_validation,
+            "prompt_budgets": self.prompt_builder.budgets,
+        }
+        return RunCheckpoints.key(story_text, "orchestrator", config)
+
+    def _load_checkpoint(self, key: Optional[str], resume: bool) -> Dict[str, Any]:
+        """Saved state to resume from; without resume, any old checkpoint is dropped"""
+        if key is None:
+            return {}
+        if not resume:
+            self.checkpoints.clear(key)
+            return {}
+        return self.checkpoints.load(key)
+
+    def _save_phase(self, key: Optional[str], phase: str, result: Dict[str, Any], shared_memory: SharedMemory):
+        if key is not None:
+            self.checkpoints.save_phase(key, phase, result, shared_memory.snapshot())
+
+    async def process_stories(self, stories: List[str], batch_size: int = 8,
+                              resume: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """Process many stories, batching each phase's prompts into padded backend calls
+
+        Every story gets its own SharedMemory and agent set so results stay
+        isolated; only the backend calls are shared across stories. With
+        checkpoints and resume, finished stories are skipped and the others
+        only run the phases they have not completed.
+        """
+
+        print(f"🚀 شروع پردازش دسته‌ای {len(stories)} داستان (batch_size={batch_size})...")
+
+        resume = self.resume if resume is None else resume
+        keys = [self.checkpoint_key(story) for story in stories]
+        states = [self._load_checkpoint(key, resume) for key in keys]
+        memories = [self.new_memory() for _ in stories]
+        agent_sets = [self.create_agents(memory) for memory in memories]
+        outputs = [state.get("output") for state in states]
+        for memory, state in zip(memories, states):
+            if state.get("phases") and "output" not in state:
+                memory.restore(state["memory"])
+        pending = [i for i, output in enumerate(outputs) if output is None]
+        if len(pending) < len(stories):
+            print(f"♻️ {len(stories) - len(pending)} داستان از checkpoint بازیابی شد")
+
+        # Phases 1 and 2: Character Extraction, then Scene Planning (which sees
+        # the characters extracted for its own story)
+        for phase, agent_key in (("characters", "character_extractor"), ("scenes", "scene_planner")):
+            todo = [i for i in pending if phase not in states[i].get("phases", {})]
+            results = self._run_phase_batch(
+                [agent_sets[i][agent_key] for i in todo],
+                [{"story_text": stories[i]} for i in todo],
+                batch_size
+            )
+            for i, result in zip(todo, results):
+                self._save_phase(keys[i], phase, result, memories[i])
+
+        # Phase 3: Consistency Validation (only scenes the rules cannot decide reach the model)
+        validation_results = self._validate_batch(
+            [agent_sets[i]["consistency_validator"] for i in pending],
+            batch_size
+        )
+        for i, validation in zip(pending, validation_results):
+            outputs[i] = self.build_output(stories[i], memories[i], agent_sets[i], validation)
+            if keys[i] is not None:
+                self.checkpoints.save_output(keys[i], outputs[i])
+
+        print("🎉 پردازش دسته‌ای کامل شد!")
+        return outputs
+
+    def _run_phase_batch(self, agents: List[StoryProcessingAgent], inputs: List[Dict[str, Any]],
+                         batch_size: int) -> List[Dict[str, Any]]:
+        """Run one phase for many stories with a single batched backend call"""
+        if not agents:
+            return []
+        # One agent can appear several times (a story's validation groups), so keep each row's prompt report
+        prompts, prompt_reports = [], []
+        for agent, input_data in zip(agents, inputs):
+            prompts.append(agent.build_prompt(input_data))
+            prompt_reports.append(agent.last_prompt_report())
+        start_ns = time.time_ns()
+        texts = agents[0].backend.generate(prompts, batch_size=batch_size, **agents[0].generation_params())
+        end_ns = time.time_ns()
+        results = []
+        for agent, text, prompt_report in zip(agents, texts, prompt_reports):
+            generation_report = agent.record_generation(text)
+            results.append(agent.parse_response(text))
+            # Every row of the batch shares the batch call's wall time
+            agent.call_spans.append(self.tracer.record(
+                agent.name, start_ns, end_ns,
+                **agent.call_attributes((end_ns - start_ns) / 1e9, results[-1], prompt_report, generation_report,
+                                        batch_size=len(agents))
+            ))
+        return results
+
+    def _validate_batch(self, validators: List[ConsistencyValidationAgent], batch_size: int) -> List[Dict[str, Any]]:
+        """Run rule checks per story, then batched calls for the scene groups escalated across stories"""
+        triaged = [validator.triage({}) for validator in validators]
+        groups = [validator.split(escalated) if escalated is not None else []
+                  for validator, (_, escalated) in zip(validators, triaged)]
+        pending = [(validator, group) for validator, story_groups in zip(validators, groups) for group in story_groups]
+        llm_results = iter(self._run_phase_batch(
+            [validator for validator, _ in pending], [group for _, group in pending], batch_size
+        ))
+        outputs = []
+        for validator, (decided, escalated), story_groups in zip(validators, triaged, groups):
+            llm_result = None
+            if escalated is not None:
+                llm_result = validator.merge_groups(story_groups, [next(llm_results) for _ in story_groups])
+            outputs.append(validator.publish(validator.combine(decided, escalated, llm_result, len(story_groups))))
+        return outputs
+
+    async def process_story_scheduled(self, story_text: str, shared_memory: Optional[SharedMemory] = None,
+                                      max_chars: int = 600) -> Dict[str, Any]:
+        """Process a story as a DAG of agent steps on the scheduler
+
+        The story is split into chunks. Extraction and planning run chunk by
+        chunk (planning chunk N waits for its characters and for the scenes
+        of chunk N-1), and each chunk's scenes are validated as soon as they
+        exist, overlapping with work on the next chunk. Output has the same
+        shape as process_story.
+        """
+        if self.scheduler is None:
+            self.scheduler = AgentScheduler()
+        shared_memory = shared_memory if shared_memory is not None else self.new_memory()
+        agents = self.create_agents(shared_memory)
+        chunks = chunk_story(story_text, max_chars=max_chars)
+
+        def extract_step(chunk: StoryChunk):
+            async def extract(results):
+                return await agents["character_extractor"].process({"story_text": chunk.text})
+            return extract
+
+        def plan_step(chunk: StoryChunk):
+            async def plan(results):
+                start = len(shared_memory.scenes)
+                result = await agents["scene_planner"].process({"story_text": chunk.text})
+                return {**result, "scenes": shared_memory.scenes[start:]}
+            return plan
+
+        def validate_step(index: int):
+            async def validate(results):
+                scenes = results[f"plan_{index}"]["scenes"]
+                if not scenes:
+                    return {"validation_results": []}
+                return await agents["consistency_validator"].process({"scenes": scenes})
+            return validate
+
+        steps = []
+        for i, chunk in enumerate(chunks):
+            previous = [f"extract_{i - 1}"] if i else []
+            steps.append(Step(f"extract_{i}", extract_step(chunk), previous))
+            plan_deps = [f"extract_{i}"] + ([f"plan_{i - 1}"] if i else [])
+            steps.append(Step(f"plan_{i}", plan_step(chunk), plan_deps))
+            steps.append(Step(f"validate_{i}", validate_step(i), [f"plan_{i}"]))
+
+        results = await self.scheduler.run_dag(steps)
+
+        validation_result = self.merge_validation_results(
+            [results[f"validate_{i}"] for i in range(len(chunks))]
+        )
+        return self.build_output(story_text, shared_memory, agents, validation_result)
+
+    async def process_stories_concurrently(self, stories: List[str], max_in_flight: int = 4) -> List[Dict[str, Any]]:
+        """Run several stories' DAGs at once, each with its own SharedMemory"""
+        in_flight = asyncio.Semaphore(max_in_flight)
+
+        async def run(story: str) -> Dict[str, Any]:
+            async with in_flight:
+                return await self.process_story_scheduled(story)
+
+        return list(await asyncio.gather(*(run(story) for story in stories)))
+
+    async def stream_story(self, story_text: str, shared_memory: Optional[SharedMemory] = None,
+                           max_chars: int = 600, mode: str = "paragraph") -> AsyncIterator[Scene]:
+        """Yield scenes chunk by chunk while the rest of the story is still being read
+
+        Each chunk runs CharacterExtractionAgent (with the roster built so far
+        as context) and then ScenePlanningAgent, so prompt size depends on the
+        chunk size rather than on the story length.
+        """
+        shared_memory = shared_memory if shared_memory is not None else self.new_memory()
+        agents = self.create_agents(shared_memory)
+        async for _, scenes in self._iter_chunk_scenes(story_text, agents, max_chars, mode):
+            for scene in scenes:
+                yield scene
+
+    async def process_story_incremental(self, story_text: str, max_chars: int = 600, mode: str = "paragraph",
+                                        shared_memory: Optional[SharedMemory] = None) -> Dict[str, Any]:
+        """Chunked version of process_story for inputs longer than the model context
+
+        Scenes are validated per chunk and the results merged, so no prompt
+        contains the whole story or every scene. Output has the same shape as
+        process_story.
+        """
+        shared_memory = shared_memory if shared_memory is not None else self.new_memory()
+        agents = self.create_agents(shared_memory)
+        validations = []
+        async for chunk, scenes in self._iter_chunk_scenes(story_text, agents, max_chars, mode):
+            print(f"📦 بخش {chunk.index + 1}: {len(scenes)} صحنه")
+            if scenes:
+                validations.append(await agents["consistency_validator"].process({"scenes": scenes}))
+                shared_memory.notify("checkpoint", {"chunk": chunk.index, "phase": "validation"})
+
+        validation_result = self.merge_validation_results(validations)
+        return self.build_output(story_text, shared_memory, agents, validation_result)
+
+    async def process_story_edited(self, story_text: str, previous: Optional[StoryRun] = None,
+                                   max_chars: int = 600, mode: str = "paragraph") -> Dict[str, Any]:
+        """Reprocess an edited story, re-running agents only for what the edit affected
+
+        Chunks are hashed and aligned with the previous run (``previous``, or
+        this orchestrator's last run). Changed chunks go through extraction
+        and planning; unchanged ones replay their recorded characters and
+        scenes. A scene is validated again if its chunk changed or one of its
+        characters has different attributes than in the previous run. Output
+        has the same shape as process_story; self.last_run is updated.
+        """
+        previous = previous if previous is not None else self.last_run
+        if previous is not None and (previous.max_chars, previous.mode) != (max_chars, mode):
+            previous = None  # Different chunk boundaries: nothing lines up
+        shared_memory = self.new_memory()
+        agents = self.create_agents(shared_memory)
+        chunks = chunk_story(story_text, max_chars=max_chars, mode=mode)
+        digests = [chunk_digest(chunk.text) for chunk in chunks]
+        matched = match_chunks([chunk.digest for chunk in previous.chunks], digests) if previous else {}
+
+        # Phases 1 and 2: only for changed chunks
+        records: List[ChunkRun] = []
+        bounds: List[Tuple[int, int]] = []
+        # How far each replayed chunk's scene ids moved (earlier chunks may now have more or fewer scenes)
+        shifts: Dict[int, int] = {}
+        for chunk, digest in zip(chunks, digests):
+            start = len(shared_memory.scenes)
+            if chunk.index in matched:
+                old = previous.chunks[matched[chunk.index]]
+                characters = old.characters
+                for char_data in copy.deepcopy(characters):
+                    shared_memory.add_character(Character(**char_data))
+                if old.scenes:
+                    shifts[chunk.index] = shared_memory.current_scene_id + 1 - old.scenes[0]["scene_id"]
+                for scene_data in copy.deepcopy(old.scenes):
+                    scene_data["scene_id"] += shifts[chunk.index]
+                    shared_memory.add_scene(Scene(**scene_data))
+            else:
+                result = await agents["character_extractor"].process({"story_text": chunk.text})
+                characters = result.get("characters", [])
+                await agents["scene_planner"].process({"story_text": chunk.text})
+            bounds.append((start, len(shared_memory.scenes)))
+            records.append(ChunkRun(digest, copy.deepcopy(characters),
+                                    [scene.to_dict() for scene in shared_memory.scenes[start:]]))
+
+        # Phase 3: only scenes whose text or characters changed
+        roster = {key: character.to_dict() for key, character in shared_memory.characters.items()}
+        affected = changed_characters(previous.roster, roster) if previous else set()
+        revalidated = 0
+        for chunk, record, (start, end) in zip(chunks, records, bounds):
+            scenes = shared_memory.scenes[start:end]
+            if chunk.index in matched:
+                old_validation = self.shift_validation(previous.chunks[matched[chunk.index]].validation,
+                                                       shifts.get(chunk.index, 0))
+                stale = [scene for scene in scenes if affected.intersection(scene.characters_present)]
+            else:
+                old_validation, stale = {}, scenes
+            revalidated += len(stale)
+            fresh = await agents["consistency_validator"].process({"scenes": stale}) if stale else None
+            record.validation = self.replace_validation(old_validation, len(scenes), stale, fresh)
+
+        print(f"✏️ {len(chunks) - len(matched)} بخش از {len(chunks)} بخش دوباره پردازش شد، "
+              f"{revalidated} صحنه از {len(shared_memory.scenes)} صحنه دوباره بررسی شد")
+        self.last_run = StoryRun(max_chars, mode, records, roster)
+        validation_result = self.merge_validation_results([record.validation for record in records])
+        return self.build_output(story_text, shared_memory, agents, validation_result)
+
+    @staticmethod
+    def shift_validation(validation: Dict[str, Any], shift: int) -> Dict[str, Any]:
+        """A recorded validation with its scene ids moved by shift"""
+        if not shift:
+            return validation
+        return {**validation, "validation_results": [
+            {**entry, "scene_id": entry["scene_id"] + shift} if isinstance(entry.get("scene_id"), int) else entry
+            for entry in validation.get("validation_results", [])
+        ]}
+
+    @staticmethod
+    def replace_validation(old: Dict[str, Any], scene_count: int, stale: List[Scene],
+                           fresh: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """A chunk's previous validation with the stale scenes' entries replaced by a fresh result
+
+        overall_consistency is the scene-weighted mean of the kept and the
+        fresh scores.
+        """
+        if fresh is None:
+            return old
+        stale_ids = {scene.scene_id for scene in stale}
+        kept = [entry for entry in old.get("validation_results", []) if entry.get("scene_id") not in stale_ids]
+        merged = {**fresh, "validation_results": kept + fresh.get("validation_results", [])}
+        parts = [(consistency_percent(old.get("overall_consistency", "")), scene_count - len(stale)),
+                 (consistency_percent(fresh.get("overall_consistency", "")), len(stale))]
+        parts = [(score, count) for score, count in parts if score is not None and count]
+        if parts:
+            score = sum(score * count for score, count in parts) / sum(count for _, count in parts)
+            merged["overall_consistency"] = f"{score:.0f}%"
+        return merged
+
+    async def _iter_chunk_scenes(self, story_text: str, agents: Dict[str, StoryProcessingAgent],
+                                 max_chars: int, mode: str) -> AsyncIterator[Tuple[StoryChunk, List[Scene]]]:
+        """Run extraction then planning per chunk, yielding the scenes each chunk added"""
+        shared_memory = agents["scene_planner"].shared_memory
+        for chunk in iter_chunks(story_text, max_chars=max_chars, mode=mode):
+            await agents["character_extractor"].process({"story_text": chunk.text})
+            start = len(shared_memory.scenes)
+            await agents["scene_planner"].process({"story_text": chunk.text})
+            shared_memory.notify("checkpoint", {"chunk": chunk.index, "phase": "scenes"})
+            yield chunk, shared_memory.scenes[start:]
+
+    @staticmethod
+    def merge_validation_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine per-chunk validation outputs into one process_story-style result"""
+        merged: Dict[str, Any] = {"validation_results": []}
+        scores = []
+        errors = []
+        for result in results:
+            merged["validation_results"].extend(result.get("validation_results", []))
+            score = consistency_percent(result.get("overall_consistency", ""))
+            if score is not None:
+                scores.append(score)
+            if "error" in result:
+                errors.append(result["error"])
+        merged["overall_consistency"] = f"{sum(scores) / len(scores):.0f}%" if scores else "نامشخص"
+        if errors:
+            merged["errors"] = errors
+        return merged
+
+    @staticmethod
+    def build_output(story_text: str, shared_memory: SharedMemory, agents: Dict[str, StoryProcessingAgent],
+                     validation_result: Dict[str, Any], trace: Optional[Span] = None) -> Dict[str, Any]:
+        """Prepare the final storyboard output for one story (with phase times when given the run's root span)"""
+        return {
             "metadata": {
                 "processing_timestamp": datetime.now().isoformat(),
                 "story_length": len(story_text),
-                "agents_used": list(self.agents.keys())
+                "agents_used": list(agents.keys()),
+                "prompt_usage": summarize_reports(
+                    report for agent in agents.values() for report in agent.prompt_reports
+                ),
+                "generation_usage": summarize_generation(
+                    report for agent in agents.values() for report in agent.generation_reports
+                ),
+                "validation_fast_path": summarize_fast_path(
+                    report for agent in agents.values() for report in getattr(agent, "fast_path_reports", [])
+                ),
+                "tracing": trace_metadata(
+                    (span for agent in agents.values() for span in getattr(agent, "call_spans", [])), trace
+                )
             },
-            "characters": [char.to_dict() for char in self.shared_memory.characters.values()],
-            "scenes": [asdict(scene) for scene in self.shared_memory.scenes],
+            "characters": [char.to_dict() for char in shared_memory.characters.values()],
+            "scenes": [scene.to_dict() for scene in shared_memory.run_scenes()],
             "validation": validation_result,
             "summary": {
-                "total_characters": len(self.shared_memory.characters),
-                "total_scenes": len(self.shared_memory.scenes),
-                "consistency_score": consistency_score
+                "total_characters": len(shared_memory.characters),
+                "total_scenes": len(shared_memory.run_scenes()),
+                "consistency_score": validation_result.get("overall_consistency", "نامشخص")
             }
         }
 
-        print("\n🎉 پردازش کامل شد!")
-        return output
-
 
 async def main():
     """Main function to demonstrate the PoC"""
 
+    parser = argparse.ArgumentParser(description="Character consistency PoC")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub backend instead of GPT-2")
+    parser.add_argument("--prewarm", action="store_true", help="start loading GPT-2 in the background right away")
+    parser.add_argument("--store", help="sqlite file that keeps characters and scenes across runs")
+    parser.add_argument("--ndjson", help="stream characters, scenes and validation results to this NDJSON file")
+    parser.add_argument("--resume", action="store_true", help="skip phases already checkpointed in .checkpoints/")
+    parser.add_argument("--trace", help="append phase and agent call spans to this file as OTLP/JSON lines")
+    parser.add_argument("--assisted", nargs="+", default=[], metavar="AGENT",
+                        help="decode these agents (e.g. ScenePlanner) with a draft model proposing tokens")
+    parser.add_argument("--draft-model", default="distilgpt2", help="draft model for --assisted")
+    parser.add_argument("--cache", help="sqlite file of cached responses, reused across runs")
+    parser.add_argument("--seed", type=int, help="fixed sampling seed; sampled calls are only cached with one")
+    args = parser.parse_args()
+
     print("🚀 شروع سیستم Multi-Agent با مدل محلی GPT-2")
     print("📝 نیازی به API key نیست - از مدل محلی استفاده می‌شود")
 
     # Initialize orchestrator (no API key needed)
-    orchestrator = MultiAgentOrchestrator()
+    store = StoryboardStore(args.store) if args.store else None
+    # With --cache, prompts answered before are read back without loading the model (or importing torch)
+    cache = ResponseCache(db_path=args.cache) if args.cache else None
+    orchestrator = MultiAgentOrchestrator(StubBackend() if args.stub else None, cache=cache, seed=args.seed,
+                                          prewarm=args.prewarm, store=store,
+                                          resume=args.resume,
+                                          tracer=Tracer(FileSpanExporter(args.trace)) if args.trace else None,
+                                          assisted_agents=[] if args.stub else args.assisted,
+                                          draft_model=args.draft_model)
     orchestrator.initialize_agents()
 
     # Sample story (Persian)
@@ -430,13 +1488,23 @@ async def main():
     print(sample_story)
     print("\n" + "="*50)
 
-    # Process the story
-    result = await orchestrator.process_story(sample_story)
-
-    # Save results
-    output_file = "storyboard_output.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.ndjson:
+        # Streaming mode: chunk by chunk, each record written as soon as it exists
+        output_file = args.ndjson
+        with NdjsonWriter(output_file) as writer:
+            orchestrator.shared_memory.observers.append(writer)
+            result = await orchestrator.process_story_incremental(
+                sample_story, shared_memory=orchestrator.shared_memory
+            )
+            writer.write("summary", {"metadata": result["metadata"], **result["summary"]})
+    else:
+        # Process the story
+        result = await orchestrator.process_story(sample_story)
+
+        # Save results
+        output_file = "storyboard_output.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
 
     print(f"\n💾 نتیجه در فایل {output_file} ذخیره شد")
 
@@ -445,6 +1513,11 @@ async def main():
     print(f"• تعداد کاراکترها: {result['summary']['total_characters']}")
     print(f"• تعداد صحنه‌ها: {result['summary']['total_scenes']}")
     print(f"• امتیاز consistency: {result['summary']['consistency_score']}")
+    if cache is not None:
+        print(f"• cache: {cache.stats()}")
+        cache.close()
+    for key, seconds in registry.report().items():
+        print(f"• زمان بارگذاری {key}: {seconds:.2f}s")
 
 
 if __name__ == "__main__":
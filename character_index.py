@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Alias index for character names
+
+Stories refer to one person in many ways: "دکتر احمد حسینی", "آقای حسینی",
+"احمد". Names are normalized (Arabic/Persian letter variants, diacritics,
+zero-width joiners, case, punctuation), honorifics are stripped, and the
+remaining tokens are indexed. A lookup then checks the
+full-name key, and after that only the characters sharing a token with the
+query, so it stays near constant time with thousands of characters.
+
+A query resolves to a character when their token sets nest ("احمد" and
+"احمد حسینی") and exactly one character qualifies. Ambiguous queries ("احمد"
+with two Ahmads) resolve to nothing rather than to a guess. A query longer
+than every known name ("دکتر احمد حسینی" against "احمد حسینی") only matches
+a single character whose name includes the query's given name and is more
+than one word: a bare "علی" is never widened to "سارا علی" or "علی رضا".
+Names are not transliterated, so "Dr. Hosseini" does not match "حسینی".
+"""
+
+import re
+import unicodedata
+from itertools import combinations
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+# Titles and forms of address that do not identify a person
+HONORIFICS = frozenset({
+    # Persian
+    "آقا", "آقای", "خانم", "دکتر", "مهندس", "استاد", "حاج", "حاجی", "حاجیه", "سید", "سیده",
+    "بانو", "جناب", "سرکار", "دوشیزه", "پروفسور", "سرهنگ", "سروان", "شیخ", "میرزا",
+    # English
+    "mr", "mrs", "ms", "miss", "mister", "dr", "doctor", "prof", "professor", "sir", "madam",
+    "lady", "lord", "captain", "uncle", "aunt",
+})
+
+# Arabic code points that Persian text often contains in place of Persian letters
+CHAR_MAP = str.maketrans({
+    "\u064A": "\u06CC", "\u0649": "\u06CC", "\u0643": "\u06A9", "\u0629": "\u0647", "\u06C0": "\u0647",
+    "\u0623": "\u0627", "\u0625": "\u0627", "\u0671": "\u0627",
+    "\u200C": " ", "\u200D": "", "\u0640": "",  # ZWNJ, ZWJ, tatweel
+})
+DIACRITICS = re.compile(r"[\u064B-\u065F\u0670]")
+NON_WORD = re.compile(r"[^\w\s]")
+
+# Longer queries are only matched exactly or as part of a known name
+MAX_SUBSET_TOKENS = 6
+
+
+def name_tokens(name: str) -> List[str]:
+    """Normalized name tokens without honorifics
+
+    If the name is nothing but honorifics ("دکتر"), they are kept so the
+    name still has a key.
+    """
+    text = unicodedata.normalize("NFKC", name).translate(CHAR_MAP)
+    text = DIACRITICS.sub("", text)
+    tokens = NON_WORD.sub(" ", text).lower().split()
+    stripped = [token for token in tokens if token not in HONORIFICS]
+    return stripped or tokens
+
+
+def name_key(name: str) -> str:
+    """Normalized full-name key"""
+    return " ".join(name_tokens(name))
+
+
+class AliasIndex:
+    """Maps any known name variant to a canonical character name"""
+
+    def __init__(self):
+        self._exact: Dict[str, str] = {}                 # full-name key -> canonical
+        self._by_token: Dict[str, Set[str]] = {}         # token -> canonicals containing it
+        self._tokens: Dict[str, FrozenSet[str]] = {}     # canonical -> token set
+        self._by_tokens: Dict[FrozenSet[str], Set[str]] = {}  # token set -> canonicals
+        self.aliases: Dict[str, Set[str]] = {}           # canonical -> raw names seen
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve_one(name) is not None
+
+    def add(self, canonical: str, alias: Optional[str] = None):
+        """Register a canonical name, or an alias of an existing one"""
+        alias = alias if alias is not None else canonical
+        if canonical not in self._tokens:
+            self._tokens[canonical] = frozenset()
+            self.aliases[canonical] = set()
+        self.aliases[canonical].add(alias)
+        self._exact.setdefault(name_key(alias), canonical)
+        tokens = frozenset(name_tokens(alias))
+        # A character's token set grows with its fuller names ("احمد" -> "احمد حسینی")
+        old_tokens = self._tokens[canonical]
+        if tokens <= old_tokens:
+            return
+        self._discard(self._by_tokens, old_tokens, canonical)
+        self._tokens[canonical] = old_tokens | tokens
+        self._by_tokens.setdefault(self._tokens[canonical], set()).add(canonical)
+        for token in tokens:
+            self._by_token.setdefault(token, set()).add(canonical)
+
+    @staticmethod
+    def _discard(index: Dict, key, canonical: str):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.discard(canonical)
+            if not bucket:
+                del index[key]
+
+    def remove(self, canonical: str):
+        tokens = self._tokens.pop(canonical, frozenset())
+        self._discard(self._by_tokens, tokens, canonical)
+        for token in tokens:
+            self._discard(self._by_token, token, canonical)
+        for alias in self.aliases.pop(canonical, ()):
+            if self._exact.get(name_key(alias)) == canonical:
+                del self._exact[name_key(alias)]
+
+    def resolve_one(self, name: str) -> Optional[str]:
+        """Canonical name for a variant, or None if unknown or ambiguous"""
+        found = self.candidates(name)
+        return next(iter(found)) if len(found) == 1 else None
+
+    def candidates(self, name: str) -> Set[str]:
+        """Every canonical name a variant could refer to (empty if unknown)"""
+        key = name_key(name)
+        canonical = self._exact.get(key)
+        if canonical is not None:
+            return {canonical}
+
+        tokens = frozenset(key.split())
+        if not tokens:
+            return set()
+
+        # The query is part of a known name: intersect token buckets, smallest first
+        buckets = sorted((self._by_token.get(token, set()) for token in tokens), key=len)
+        narrower = set(buckets[0])
+        for bucket in buckets[1:]:
+            narrower &= bucket
+        if narrower:
+            return narrower
+
+        # A known name is part of the query: look up the query's token subsets,
+        # keeping only a unique multi-word name that includes the given name
+        wider: Set[str] = set()
+        if len(tokens) <= MAX_SUBSET_TOKENS:
+            given = key.split()[0]
+            for size in range(len(tokens) - 1, 1, -1):
+                for subset in combinations(sorted(tokens), size):
+                    if given in subset:
+                        wider |= self._by_tokens.get(frozenset(subset), set())
+        return wider
+
+    def resolve(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Bulk lookup: each distinct name mapped to its canonical name (or None)"""
+        resolved: Dict[str, Optional[str]] = {}
+        for name in names:
+            if name not in resolved:
+                resolved[name] = self.resolve_one(name)
+        return resolved
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Vector similarity index over characters
+
+Exact dict lookup cannot tell that "دکتر احمد حسینی" and "آقای حسینی" are
+likely the same person, or which known characters a story chunk is about.
+CharacterSimilarityIndex embeds each character's name, appearance and
+personality as hashed character n-gram features (no model, works offline)
+and answers batched top-k cosine-similarity queries with one matrix product.
+
+Hashing is vectorized: the text's code points go through a rolling
+polynomial hash in uint64 arithmetic, one hash per n-gram, and
+``np.bincount`` folds them into a signed fixed-size vector. Rows live in a
+preallocated matrix that doubles when full, so inserting as characters are
+extracted is amortized O(1) and re-inserting a name overwrites its row.
+SharedMemory builds the index on the first similarity query and keeps it
+up to date from then on.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+_PRIME = np.uint64(1000003)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+# How much each character field contributes to its vector (fields are normalized first)
+FIELD_WEIGHTS = {"name": 1.5, "appearance": 1.0, "personality": 1.0}
+
+Query = Union[str, Any]  # free text, or an object with the FIELD_WEIGHTS attributes
+
+
+class HashedNgramEncoder:
+    """Fixed-size signed feature vectors of character n-grams"""
+
+    def __init__(self, dim: int = 256, ngram_range: Tuple[int, int] = (3, 4)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _hashes(self, text: str) -> np.ndarray:
+        normalized = f" {' '.join(text.lower().split())} "
+        codes = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        hashes = []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            count = len(codes) - n + 1
+            if count <= 0:
+                break
+            h = np.full(count, n, dtype=np.uint64)
+            for offset in range(n):
+                h = h * _PRIME + codes[offset:offset + count]
+            hashes.append(h * _MIX)
+        return np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+
+    def encode_text(self, text: str) -> np.ndarray:
+        """Unit-length vector of one text (all zeros for empty text)"""
+        hashes = self._hashes(text or "")
+        buckets = (hashes >> np.uint64(33)) % np.uint64(self.dim)
+        signs = np.where(hashes & np.uint64(1 << 32), 1.0, -1.0)
+        vector = np.bincount(buckets.astype(np.intp), weights=signs, minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, query: Query) -> np.ndarray:
+        """Vector of free text, or the weighted sum of a character's field vectors"""
+        if isinstance(query, str):
+            return self.encode_text(query)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for field, weight in FIELD_WEIGHTS.items():
+            value = getattr(query, field, None)
+            if value:
+                vector += weight * self.encode_text(str(value))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode_batch(self, queries: Iterable[Query]) -> np.ndarray:
+        queries = list(queries)
+        if not queries:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.encode(query) for query in queries])
+
+
+class CharacterSimilarityIndex:
+    """Top-k cosine similarity over character vectors, with incremental upserts"""
+
+    def __init__(self, encoder: Optional[HashedNgramEncoder] = None, capacity: int = 64):
+        self.encoder = encoder or HashedNgramEncoder()
+        self._matrix = np.zeros((capacity, self.encoder.dim), dtype=np.float32)
+        self.names: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows
+
+    def add(self, character: Any):
+        self.add_many([character])
+
+    def add_many(self, characters: Sequence[Any]):
+        """Insert characters, or overwrite the rows of names already indexed"""
+        vectors = self.encoder.encode_batch(characters)
+        for character, vector in zip(characters, vectors):
+            row = self._rows.get(character.name)
+            if row is None:
+                row = len(self.names)
+                if row == len(self._matrix):
+                    grown = np.zeros((2 * len(self._matrix), self.encoder.dim), dtype=np.float32)
+                    grown[:row] = self._matrix
+                    self._matrix = grown
+                self._rows[character.name] = row
+                self.names.append(character.name)
+            self._matrix[row] = vector
+
+    def search(self, vectors: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Top-k (name, cosine similarity) per query vector, most similar first"""
+        count = len(self.names)
+        k = min(k, count)
+        if k == 0:
+            return [[] for _ in range(len(vectors))]
+        scores = vectors @ self._matrix[:count].T
+        if k < count:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(count), (len(vectors), count))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(self.names[row], float(score)) for row, score in zip(rows, row_scores)]
+            for rows, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]
+
+    def query(self, queries: Sequence[Query], k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Batched top-k for texts or character objects"""
+        return self.search(self.encoder.encode_batch(queries), k)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Compact Character and Scene representations
+
+The Character and Scene dataclasses carry a per-instance ``__dict__``, and
+serializing them through ``dataclasses.asdict`` deep-copies every list and
+dict. For series with tens of thousands of scenes both costs add up.
+
+CompactCharacter and CompactScene take the same constructor arguments and
+expose the same attributes, but use ``__slots__`` and intern their short
+strings (names, locations, moods), which repeat across scenes. Their
+``to_dict()`` copies lists and dicts one level, which is all their string
+items need, instead of asdict's recursive deep copy. Like the dataclasses
+they compare by value and are unhashable.
+SharedMemory(compact=True) stores every character and scene in this form.
+"""
+
+import sys
+from typing import Any, Dict, List, Optional
+
+CHARACTER_FIELDS = ("name", "age", "appearance", "personality", "role", "relationships")
+SCENE_FIELDS = ("scene_id", "description", "characters_present", "location", "time_of_day", "mood", "key_actions")
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CompactCharacter:
+    """Slotted Character with interned name"""
+
+    __slots__ = CHARACTER_FIELDS
+
+    def __init__(self, name: str, age: Optional[int] = None, appearance: Optional[str] = None,
+                 personality: Optional[str] = None, role: Optional[str] = None,
+                 relationships: Optional[Dict[str, str]] = None):
+        self.name = _intern(name)
+        self.age = age
+        self.appearance = appearance
+        self.personality = personality
+        self.role = _intern(role)
+        self.relationships = {_intern(other): _intern(relation) for other, relation in (relationships or {}).items()}
+
+    @classmethod
+    def from_object(cls, character: Any) -> "CompactCharacter":
+        return cls(*(getattr(character, name) for name in CHARACTER_FIELDS))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: value for name in CHARACTER_FIELDS if (value := getattr(self, name)) is not None}
+        data["relationships"] = dict(self.relationships)
+        return data
+
+    def __eq__(self, other: Any) -> bool:
+        return all(getattr(self, name) == getattr(other, name, None) for name in CHARACTER_FIELDS)
+
+    # Mutable and compared by value, like the Character dataclass
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"CompactCharacter({', '.join(f'{name}={getattr(self, name)!r}' for name in CHARACTER_FIELDS)})"
+
+
+class CompactScene:
+    """Slotted Scene with interned character names, location, time of day and mood"""
+
+    __slots__ = SCENE_FIELDS
+
+    def __init__(self, scene_id: int, description: str, characters_present: List[str], location: str,
+                 time_of_day: Optional[str] = None, mood: Optional[str] = None,
+                 key_actions: Optional[List[str]] = None):
+        self.scene_id = scene_id
+        self.description = description
+        self.characters_present = [_intern(name) for name in characters_present]
+        self.location = _intern(location)
+        self.time_of_day = _intern(time_of_day)
+        self.mood = _intern(mood)
+        self.key_actions = key_actions if key_actions is not None else []
+
+    @classmethod
+    def from_object(cls, scene: Any) -> "CompactScene":
+        return cls(*(getattr(scene, name) for name in SCENE_FIELDS))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in SCENE_FIELDS}
+        data["characters_present"] = list(self.characters_present)
+        data["key_actions"] = list(self.key_actions)
+        return data
+
+    def __eq__(self, other: Any) -> bool:
+        return all(getattr(self, name) == getattr(other, name, None) for name in SCENE_FIELDS)
+
+    # Mutable and compared by value, like the Scene dataclass
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"CompactScene({', '.join(f'{name}={getattr(self, name)!r}' for name in SCENE_FIELDS)})"
+
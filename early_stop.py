@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Early stopping once the generated JSON object is complete
+
+Agents ask for a fixed ``max_new_tokens`` budget, but their answer is a
+single JSON object: everything after its closing brace is thrown away by
+``extract_json``. Passing ``stop_on_json=True`` to a model backend adds a
+stopping criterion that tracks brace depth and string/escape state of the
+decoded stream per batch row, and stops a row as soon as its top-level
+object closes.
+
+GenerationReport records, per agent call, how many tokens were generated
+against the budget so runs can report the tokens saved.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class JsonBraceTracker:
+    """Incremental brace/string scanner over generated text"""
+
+    __slots__ = ("depth", "in_string", "escaped", "started")
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+
+    @property
+    def complete(self) -> bool:
+        return self.started and self.depth == 0
+
+    def copy(self) -> "JsonBraceTracker":
+        tracker = JsonBraceTracker()
+        tracker.depth, tracker.in_string, tracker.escaped, tracker.started = (
+            self.depth, self.in_string, self.escaped, self.started
+        )
+        return tracker
+
+    def feed(self, text: str) -> bool:
+        """Consume text; True once the first top-level object has closed"""
+        for char in text:
+            if self.complete:
+                break
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.started:
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+                self.started = True
+            elif char == "}" and self.started:
+                self.depth -= 1
+        return self.complete
+
+
+def shared_prefix_length(previous, input_ids) -> int:
+    """Length of the prefix every row of input_ids shares with previous (-1 if the batch size differs)"""
+    if previous is None or previous.shape[0] != input_ids.shape[0]:
+        return -1
+    length = min(previous.shape[1], input_ids.shape[1])
+    differs = (previous[:, :length] != input_ids[:, :length]).any(dim=0).nonzero()
+    return int(differs[0]) if len(differs) else length
+
+
+class JsonStoppingCriteria:
+    """Stopping criterion: a row is done when its top-level JSON object closes
+
+    Like JsonLogitsProcessor, it keeps a tracker per row after each generated
+    token, so an input that jumps several tokens ahead or rewinds (assisted
+    decoding accepts several draft tokens per step) continues from the
+    longest prefix it shares with the previous one. An input that diverges
+    before the generated part starts a new generation. ``prompt_length``
+    marks where generation starts; without it the first call is assumed to
+    hold one new token.
+    """
+
+    def __init__(self, tokenizer, prompt_length: Optional[int] = None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self._previous = None
+        self._start = 0
+        self._history: List[List[JsonBraceTracker]] = []
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        shared = shared_prefix_length(self._previous, input_ids)
+        if shared < self._start:
+            # Criteria run after each step, so without a prompt length the last column is the first new token
+            self._start = self.prompt_length if self.prompt_length is not None else input_ids.shape[1] - 1
+            self._history = [[JsonBraceTracker()] for _ in range(input_ids.shape[0])]
+            shared = self._start
+        for row, history in enumerate(self._history):
+            del history[shared - self._start + 1:]
+            for token in input_ids[row, shared:].tolist():
+                tracker = history[-1].copy()
+                if not tracker.complete:
+                    tracker.feed(self.tokenizer.decode([token]))
+                history.append(tracker)
+        self._previous = input_ids
+        return torch.tensor([history[-1].complete for history in self._history], device=input_ids.device)
+
+
+def apply_early_stop(tokenizer, params: Dict[str, Any], prompt_length: Optional[int] = None) -> Dict[str, Any]:
+    """Turn a ``stop_on_json`` generation param into a stopping criterion
+
+    Returns params without ``stop_on_json``; without a tokenizer the flag is dropped.
+    """
+    params = dict(params)
+    if not params.pop("stop_on_json", False) or tokenizer is None:
+        return params
+    from transformers import StoppingCriteriaList
+
+    criteria = StoppingCriteriaList(params.pop("stopping_criteria", None) or [])
+    criteria.append(JsonStoppingCriteria(tokenizer, prompt_length))
+    params["stopping_criteria"] = criteria
+    return params
+
+
+@dataclass
+class GenerationReport:
+    """Generated tokens against the budget for one agent call"""
+    agent: str
+    max_new_tokens: int
+    generated_tokens: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.max_new_tokens - self.generated_tokens, 0)
+
+
+def count_generated_tokens(tokenizer, text: str) -> int:
+    """Token count of a completion (utf-8 bytes / 2 without a tokenizer)"""
+    if tokenizer is None:
+        return len(text.encode("utf-8")) // 2
+    return len(tokenizer.encode(text))
+
+
+def summarize_generation(reports: Iterable[GenerationReport]) -> Dict[str, Any]:
+    """Aggregate generation reports per agent for run metadata"""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for report in reports:
+        entry = summary.setdefault(report.agent, {
+            "calls": 0, "generated_tokens": 0, "token_budget": 0, "tokens_saved": 0, "tokens_saved_per_call": []
+        })
+        entry["calls"] += 1
+        entry["generated_tokens"] += report.generated_tokens
+        entry["token_budget"] += report.max_new_tokens
+        entry["tokens_saved"] += report.tokens_saved
+        entry["tokens_saved_per_call"].append(report.tokens_saved)
+    return summary
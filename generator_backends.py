@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Pluggable text-generation backends for the story agents
+
+Agents only depend on the GeneratorBackend protocol:
+``generate(prompts, **params) -> List[str]``, returning the generated
+continuation (without the prompt) for each prompt. Implementations:
+
+- PipelineBackend: a ``transformers.pipeline("text-generation")``
+- RawModelBackend: a causal LM + tokenizer with left-padded batching
+- StubBackend: deterministic canned JSON, for offline tests and benchmarks
+
+Faster backends (prefix KV reuse, caching) plug in the same way. Model
+backends accept a ``json_schema`` param for constrained JSON decoding
+(see json_constraint.py) and ``stop_on_json`` to stop once the JSON object
+closes (see early_stop.py).
+"""
+
+import json
+import time
+from typing import Any, List, Optional, Protocol, runtime_checkable
+
+from early_stop import apply_early_stop
+from json_constraint import apply_json_schema
+
+
+@runtime_checkable
+class GeneratorBackend(Protocol):
+    """Anything that turns a list of prompts into a list of continuations"""
+    model_id: str
+
+    def generate(self, prompts: List[str], **params) -> List[str]:
+        ...
+
+
+class PipelineBackend:
+    """Backend over a Hugging Face text-generation pipeline"""
+
+    def __init__(self, pipe, **default_params):
+        self.pipeline = pipe
+        self.default_params = default_params
+        self.tokenizer = getattr(pipe, "tokenizer", None)
+        self.model = getattr(pipe, "model", None)
+        self.model_id = getattr(self.model, "name_or_path", None) or "pipeline"
+
+    @classmethod
+    def from_model(cls, model_id: str = "gpt2", **pipeline_kwargs) -> "PipelineBackend":
+        from transformers import pipeline
+
+        pipe = pipeline("text-generation", model=model_id, **pipeline_kwargs)
+        # Batched calls need a pad token; decoder-only models pad on the left
+        pipe.tokenizer.pad_token_id = pipe.tokenizer.eos_token_id
+        pipe.tokenizer.padding_side = "left"
+        return cls(pipe)
+
+    def generate(self, prompts: List[str], **params) -> List[str]:
+        params = {**self.default_params, **params, "return_full_text": False}
+        params = apply_early_stop(self.tokenizer, apply_json_schema(self.tokenizer, params))
+        outputs = self.pipeline(list(prompts), **params)
+        return [output[0]["generated_text"] for output in outputs]
+
+
+class RawModelBackend:
+    """Backend over a causal LM and tokenizer, generating left-padded batches"""
+
+    def __init__(self, model, tokenizer, batch_size: int = 8, **default_params):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.default_params = default_params
+        self.model_id = getattr(model, "name_or_path", None) or type(model).__name__
+        if tokenizer.pad_token_id is None:
+            tokenizer.pad_token_id = tokenizer.eos_token_id
+        tokenizer.padding_side = "left"
+
+    @classmethod
+    def from_pretrained(cls, model_id: str = "gpt2", **kwargs) -> "RawModelBackend":
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = AutoModelForCausalLM.from_pretrained(model_id).eval()
+        return cls(model, tokenizer, **kwargs)
+
+    def generate(self, prompts: List[str], **params) -> List[str]:
+        import torch
+
+        batch_size = params.pop("batch_size", self.batch_size)
+        params = {**self.default_params, **params}
+        params = apply_early_stop(self.tokenizer, apply_json_schema(self.tokenizer, params))
+        params.setdefault("pad_token_id", self.tokenizer.pad_token_id)
+
+        texts: List[str] = []
+        for start in range(0, len(prompts), batch_size):
+            batch = self.tokenizer(list(prompts[start:start + batch_size]), return_tensors="pt", padding=True)
+            with torch.no_grad():
+                generated = self.model.generate(**batch, **params)
+            new_tokens = generated[:, batch["input_ids"].shape[1]:]
+            texts.extend(self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True))
+        return texts
+
+
+# Canned payloads use only fields shared by both modules' Character/Scene classes
+STUB_CHARACTERS = {
+    "characters": [
+        {"name": "علی", "age": 12, "appearance": "موهای سیاه", "personality": "ماجراجو", "role": "قهرمان"},
+        {"name": "سارا", "age": 11, "appearance": "موهای بلوند", "personality": "آرام", "role": "دوست"}
+    ]
+}
+STUB_SCENES = {
+    "scenes": [
+        {"scene_id": 1, "description": "آشنایی در پارک", "characters_present": ["علی", "سارا"],
+         "location": "پارک", "mood": "شاد"}
+    ]
+}
+STUB_VALIDATION = {
+    "validation_results": [{"scene_id": 1, "is_consistent": True, "issues": [], "suggestions": []}],
+    "overall_consistency": "100%"
+}
+STUB_SCORE = {"consistency_score": 100, "issues": [], "recommendations": []}
+
+# Checked in order: the first marker found in the prompt picks the payload
+DEFAULT_STUB_RESPONSES = [
+    ("validation_results", STUB_VALIDATION),
+    ("consistency_score", STUB_SCORE),
+    ('"scenes"', STUB_SCENES),
+    ('"characters"', STUB_CHARACTERS),
+]
+
+
+class StubBackend:
+    """Deterministic offline backend returning canned JSON for each agent's prompt
+
+    Optional latency makes it usable for throughput benchmarks: every forward
+    pass costs ``call_overhead`` plus ``item_cost`` per prompt in the batch.
+    """
+
+    model_id = "stub"
+    tokenizer = None
+
+    def __init__(self, responses: Optional[List[Any]] = None, call_overhead: float = 0.0,
+                 item_cost: float = 0.0, batch_size: int = 1):
+        self.responses = responses if responses is not None else DEFAULT_STUB_RESPONSES
+        self.call_overhead = call_overhead
+        self.item_cost = item_cost
+        self.batch_size = batch_size
+        self.calls = 0
+        self.prompts_seen = 0
+
+    def respond(self, prompt: str) -> str:
+        for marker, payload in self.responses:
+            if marker in prompt:
+                return json.dumps(payload, ensure_ascii=False)
+        return "{}"
+
+    def generate(self, prompts: List[str], **params) -> List[str]:
+        # Canned payloads are already bare JSON matching the agents' schemas
+        params.pop("json_schema", None)
+        params.pop("stop_on_json", None)
+        batch_size = params.get("batch_size") or self.batch_size
+        texts = []
+        for start in range(0, len(prompts), batch_size):
+            batch = prompts[start:start + batch_size]
+            self.calls += 1
+            self.prompts_seen += len(batch)
+            if self.call_overhead or self.item_cost:
+                time.sleep(self.call_overhead + self.item_cost * len(batch))
+            texts.extend(self.respond(prompt) for prompt in batch)
+        return texts
+
+
+def as_backend(generator) -> GeneratorBackend:
+    """Accept a backend as-is, or wrap a bare HF pipeline for compatibility"""
+    if isinstance(generator, GeneratorBackend):
+        return generator
+    if callable(generator):
+        return PipelineBackend(generator)
+    raise TypeError(f"Not a generator backend: {generator!r}")
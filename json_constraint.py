@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+Schema-constrained JSON decoding for the story agents
+
+GPT-2 rarely produces parseable JSON on its own, so agents spent their whole
+token budget on text that ``extract_json`` then rejected. Passing
+``json_schema=<schema>`` to a backend's ``generate`` installs a logits
+processor that masks every token which would take the output off the
+schema. As soon as the top-level object closes, only EOS is allowed, so
+generation stops there, and when ``max_new_tokens`` runs low the shortest
+valid closing sequence is forced, so the output always parses.
+
+Schemas use a small JSON Schema subset: ``type`` (a name or a list of
+object/array/string/integer/number/boolean/null), ``properties``,
+``required``, ``additionalProperties`` (a schema for free-form keys),
+``items``, ``maxItems`` and ``maxLength`` (in UTF-8 bytes).
+
+The automaton works on bytes, so byte-level BPE tokens that split a
+multi-byte (e.g. Persian) character are handled inside strings. Nothing in
+this module imports torch until a processor is actually built.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from early_stop import shared_prefix_length
+
+WHITESPACE = frozenset(b" \t\n\r")
+ESCAPES = frozenset(b'"\\/bfnrt')
+DIGITS = frozenset(b"0123456789")
+QUOTE, BACKSLASH = ord('"'), ord("\\")
+
+# Bounds that keep a constrained model from looping on filler
+MAX_WHITESPACE_RUN = 2
+MAX_NUMBER_CHARS = 10
+MAX_FREE_KEY_BYTES = 40
+
+# A parser state is (frames, whitespace_run); frames is a tuple used as a stack
+State = Tuple[Tuple[Tuple[Any, ...], ...], int]
+
+
+def bytes_to_unicode() -> Dict[int, str]:
+    """GPT-2's reversible byte -> printable character table for byte-level BPE"""
+    printable = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) \
+        + list(range(ord("®"), ord("ÿ") + 1))
+    chars = printable[:]
+    extra = 0
+    for byte in range(256):
+        if byte not in printable:
+            printable.append(byte)
+            chars.append(256 + extra)
+            extra += 1
+    return dict(zip(printable, map(chr, chars)))
+
+
+class JsonSchemaAutomaton:
+    """Byte-level pushdown automaton accepting JSON that matches a schema
+
+    ``advance(state, byte)`` returns the next state, or None if the byte is
+    not allowed. States are immutable tuples, so they can be shared and
+    memoized.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.nodes: List[Dict[str, Any]] = []
+        self._any: Optional[int] = None
+        self.root = self._compile(schema)
+
+    def _compile(self, schema: Dict[str, Any]) -> int:
+        # The unconstrained schema {} refers to itself for nested values
+        if not schema and self._any is not None:
+            return self._any
+        node_id = len(self.nodes)
+        if not schema:
+            self._any = node_id
+        node: Dict[str, Any] = {}
+        self.nodes.append(node)
+
+        types = schema.get("type")
+        if types is None:
+            types = ["object", "array", "string", "integer", "number", "boolean", "null"]
+        node["types"] = frozenset([types] if isinstance(types, str) else types)
+        node["max_length"] = schema.get("maxLength")
+        node["max_items"] = schema.get("maxItems")
+        node["properties"] = {name: self._compile(sub) for name, sub in schema.get("properties", {}).items()}
+        node["required"] = frozenset(schema.get("required", ()))
+        additional = schema.get("additionalProperties")
+        if additional is None and "properties" not in schema:
+            additional = {}
+        node["additional"] = self._compile(additional) if isinstance(additional, dict) else None
+        node["items"] = self._compile(schema.get("items", {})) if "array" in node["types"] else None
+        return node_id
+
+    def minimal_value(self, node_id: int) -> bytes:
+        """Shortest JSON text valid for a schema node"""
+        node = self.nodes[node_id]
+        types = node["types"]
+        if "integer" in types or "number" in types:
+            return b"0"
+        if "string" in types:
+            return b'""'
+        if "array" in types:
+            return b"[]"
+        if "object" in types:
+            return b"{" + self._required_members(node, frozenset()) + b"}"
+        return b"null" if "null" in types else b"true"
+
+    def _required_members(self, node: Dict[str, Any], seen) -> bytes:
+        return b",".join(
+            json.dumps(name, ensure_ascii=False).encode("utf-8") + b":" + self.minimal_value(node["properties"][name])
+            for name in sorted(node["required"] - seen)
+        )
+
+    def closing_suffix(self, state: State) -> bytes:
+        """Shortest byte string that takes the state to a complete document"""
+        frames = list(state[0])
+        suffix = b""
+        while frames:
+            top = frames.pop()
+            kind = top[0]
+            if kind == "S":
+                suffix += b'n"' if top[2] else b'"'
+            elif kind == "N":
+                suffix += b"" if top[2][-1] in DIGITS else b"0"
+            elif kind == "L":
+                suffix += top[1]
+            elif kind == "V":
+                suffix += self.minimal_value(top[1])
+            elif kind == "K":
+                # Finish the key (shortest matching property), then give it a minimal value
+                _, node_id, buffer = top
+                parent = frames.pop()
+                node, seen = self.nodes[node_id], parent[3]
+                names = [name.encode("utf-8") for name in self._open_keys(node, seen)
+                         if name.encode("utf-8").startswith(buffer)]
+                key_bytes = min(names, key=len) if names else buffer
+                key = key_bytes.decode("utf-8", errors="replace")
+                value_id = node["properties"].get(key, node["additional"])
+                suffix += key_bytes[len(buffer):] + b'":' + self.minimal_value(value_id)
+                frames.append(("O", node_id, "after", seen | {key}, key))
+            elif kind == "O":
+                _, node_id, phase, seen, key = top
+                node = self.nodes[node_id]
+                if phase == "colon":
+                    value_id = node["properties"].get(key, node["additional"])
+                    suffix += b":" + self.minimal_value(value_id)
+                    seen, phase = seen | {key}, "after"
+                members = self._required_members(node, seen)
+                if phase == "first":
+                    suffix += members + b"}"
+                elif phase == "key":
+                    if not members:
+                        # A comma was written, so some member must follow
+                        names = self._open_keys(node, seen)
+                        name = min(names, key=len) if names else ""
+                        value_id = node["properties"].get(name, node["additional"])
+                        members = json.dumps(name, ensure_ascii=False).encode("utf-8") + b":" \
+                            + self.minimal_value(value_id)
+                    suffix += members + b"}"
+                else:
+                    suffix += (b"," + members if members else b"") + b"}"
+            elif kind == "A":
+                _, node_id, phase, _ = top
+                if phase == "next":
+                    suffix += self.minimal_value(self.nodes[node_id]["items"])
+                suffix += b"]"
+        return suffix
+
+    def initial_state(self) -> State:
+        return ((("V", self.root),), 0)
+
+    @staticmethod
+    def is_complete(state: State) -> bool:
+        return not state[0]
+
+    def advance(self, state: State, byte: int) -> Optional[State]:
+        frames, ws = state
+        if not frames:
+            return None
+        top, rest = frames[-1], frames[:-1]
+        kind = top[0]
+
+        if kind == "S":
+            return self._string(top, rest, byte)
+        if kind == "K":
+            return self._key(top, rest, byte)
+        if kind == "N":
+            return self._number(top, rest, byte)
+        if kind == "L":
+            if byte != top[1][0]:
+                return None
+            return self._complete(rest) if len(top[1]) == 1 else (rest + (("L", top[1][1:]),), 0)
+
+        if byte in WHITESPACE:
+            return (frames, ws + 1) if ws < MAX_WHITESPACE_RUN else None
+        if kind == "V":
+            return self._value_start(top[1], rest, byte)
+        if kind == "O":
+            return self._object(top, rest, byte)
+        if kind == "A":
+            return self._array(top, rest, byte)
+        return None
+
+    def _complete(self, rest) -> State:
+        """A value just ended; move its container past it"""
+        if not rest:
+            return ((), 0)
+        parent = rest[-1]
+        if parent[0] == "O":
+            _, node_id, _, seen, key = parent
+            return (rest[:-1] + (("O", node_id, "after", seen, key),), 0)
+        _, node_id, _, count = parent
+        return (rest[:-1] + (("A", node_id, "after", count),), 0)
+
+    def _value_start(self, node_id: int, rest, byte: int) -> Optional[State]:
+        node = self.nodes[node_id]
+        types = node["types"]
+        if byte == ord("{") and "object" in types:
+            return (rest + (("O", node_id, "first", frozenset(), None),), 0)
+        if byte == ord("[") and "array" in types:
+            return (rest + (("A", node_id, "first", 0),), 0)
+        if byte == QUOTE and "string" in types:
+            return (rest + (("S", node["max_length"], False),), 0)
+        if (byte in DIGITS or byte == ord("-")) and ("integer" in types or "number" in types):
+            return (rest + (("N", "number" in types, bytes([byte])),), 0)
+        if byte == ord("t") and "boolean" in types:
+            return (rest + (("L", b"rue"),), 0)
+        if byte == ord("f") and "boolean" in types:
+            return (rest + (("L", b"alse"),), 0)
+        if byte == ord("n") and "null" in types:
+            return (rest + (("L", b"ull"),), 0)
+        return None
+
+    def _string(self, top, rest, byte: int) -> Optional[State]:
+        _, remaining, escaped = top
+        if escaped:
+            if byte not in ESCAPES:
+                return None
+            return (rest + (("S", None if remaining is None else remaining - 2, False),), 0)
+        if byte == QUOTE:
+            return self._complete(rest)
+        if byte < 0x20:
+            return None
+        if byte == BACKSLASH:
+            if remaining is not None and remaining < 2:
+                return None
+            return (rest + (("S", remaining, True),), 0)
+        if remaining is not None:
+            if remaining < 1:
+                return None
+            remaining -= 1
+        return (rest + (("S", remaining, False),), 0)
+
+    def _open_keys(self, node: Dict[str, Any], seen) -> List[str]:
+        return [name for name in node["properties"] if name not in seen]
+
+    def _key(self, top, rest, byte: int) -> Optional[State]:
+        _, node_id, buffer = top
+        parent = rest[-1]
+        node, seen = self.nodes[node_id], parent[3]
+
+        if byte == QUOTE:
+            key = buffer.decode("utf-8", errors="replace")
+            if key in seen or (key not in node["properties"] and node["additional"] is None):
+                return None
+            return (rest[:-1] + (("O", node_id, "colon", seen, key),), 0)
+
+        buffer += bytes([byte])
+        if node["additional"] is not None:
+            if byte < 0x20 or byte == BACKSLASH or len(buffer) > MAX_FREE_KEY_BYTES:
+                return None
+        elif not any(name.encode("utf-8").startswith(buffer) for name in self._open_keys(node, seen)):
+            return None
+        return (rest + (("K", node_id, buffer),), 0)
+
+    def _object(self, top, rest, byte: int) -> Optional[State]:
+        _, node_id, phase, seen, key = top
+        node = self.nodes[node_id]
+        can_close = node["required"] <= seen
+
+        if phase in ("first", "key"):
+            if byte == QUOTE and (node["additional"] is not None or self._open_keys(node, seen)):
+                return (rest + (top, ("K", node_id, b"")), 0)
+            if byte == ord("}") and phase == "first" and can_close:
+                return self._complete(rest)
+            return None
+        if phase == "colon":
+            if byte != ord(":"):
+                return None
+            value_id = node["properties"].get(key, node["additional"])
+            return (rest + (("O", node_id, "value", seen | {key}, key), ("V", value_id)), 0)
+        if phase == "after":
+            if byte == ord(",") and (node["additional"] is not None or self._open_keys(node, seen)):
+                return (rest + (("O", node_id, "key", seen, None),), 0)
+            if byte == ord("}") and can_close:
+                return self._complete(rest)
+        return None
+
+    def _array(self, top, rest, byte: int) -> Optional[State]:
+        _, node_id, phase, count = top
+        node = self.nodes[node_id]
+
+        if phase == "after":
+            if byte == ord(",") and (node["max_items"] is None or count < node["max_items"]):
+                return (rest + (("A", node_id, "next", count),), 0)
+            if byte == ord("]"):
+                return self._complete(rest)
+            return None
+        if byte == ord("]") and phase == "first":
+            return self._complete(rest)
+        if node["max_items"] == 0:
+            return None
+        return self._value_start(node["items"], rest + (("A", node_id, "value", count + 1),), byte)
+
+    def _number(self, top, rest, byte: int) -> Optional[State]:
+        _, allow_float, text = top
+        if byte in DIGITS:
+            if len(text) >= MAX_NUMBER_CHARS or text in (b"0", b"-0"):
+                return None
+            return (rest + (("N", allow_float, text + bytes([byte])),), 0)
+        if byte == ord(".") and allow_float and b"." not in text and text[-1] in DIGITS:
+            return (rest + (("N", allow_float, text + b"."),), 0)
+        if text[-1] not in DIGITS:
+            return None
+        # The number ended; the byte belongs to its container
+        return self.advance(self._complete(rest), byte)
+
+
+class _TrieNode:
+    __slots__ = ("children", "token_ids")
+
+    def __init__(self):
+        self.children: Dict[int, "_TrieNode"] = {}
+        self.token_ids: List[int] = []
+
+
+class TokenTable:
+    """Byte strings of a tokenizer's vocabulary, arranged for fast masking
+
+    Tokens made only of plain string bytes (no quote, backslash or control
+    byte) are kept in a flat array: inside a JSON string they are allowed
+    whenever they fit the remaining length. All other tokens go into a
+    byte trie that is walked with the automaton.
+    """
+
+    def __init__(self, tokenizer):
+        import torch
+
+        self.eos_token_id = tokenizer.eos_token_id
+        special = set(getattr(tokenizer, "all_special_ids", []) or [])
+        byte_decoder = {char: byte for byte, char in bytes_to_unicode().items()}
+
+        self.bytes_by_id: Dict[int, bytes] = {}
+        self.trie = _TrieNode()
+        self.string_trie = _TrieNode()
+        plain_ids, plain_lengths = [], []
+        for token, token_id in tokenizer.get_vocab().items():
+            if token_id in special:
+                continue
+            if all(char in byte_decoder for char in token):
+                data = bytes(byte_decoder[char] for char in token)
+            else:
+                data = tokenizer.decode([token_id]).encode("utf-8")
+            if not data:
+                continue
+            self.bytes_by_id[token_id] = data
+            self._insert(self.trie, data, token_id)
+            if all(byte >= 0x20 and byte not in (QUOTE, BACKSLASH) for byte in data):
+                plain_ids.append(token_id)
+                plain_lengths.append(len(data))
+            else:
+                self._insert(self.string_trie, data, token_id)
+
+        self.plain_ids = torch.tensor(plain_ids, dtype=torch.long)
+        self.plain_lengths = torch.tensor(plain_lengths, dtype=torch.long)
+
+    def longest_prefix_token(self, data: bytes) -> Optional[int]:
+        """Id of the longest token whose bytes start ``data``"""
+        node, best = self.trie, None
+        for byte in data:
+            node = node.children.get(byte)
+            if node is None:
+                break
+            if node.token_ids:
+                best = node.token_ids[0]
+        return best
+
+    @staticmethod
+    def _insert(root: _TrieNode, data: bytes, token_id: int):
+        node = root
+        for byte in data:
+            node = node.children.setdefault(byte, _TrieNode())
+        node.token_ids.append(token_id)
+
+
+class JsonConstraint:
+    """Allowed-token computation for one schema and one tokenizer"""
+
+    MAX_MEMO = 4096
+
+    def __init__(self, schema: Dict[str, Any], table: TokenTable):
+        self.automaton = JsonSchemaAutomaton(schema)
+        self.table = table
+        self._memo: Dict[State, Any] = {}
+        # Upper bound on how much one token can lengthen the closing suffix
+        self.max_growth = max(len(self.automaton.minimal_value(node_id))
+                              for node_id in range(len(self.automaton.nodes))) + 8
+
+    def allowed_tokens(self, state: State):
+        """Token ids that keep the output valid from this state"""
+        import torch
+
+        cached = self._memo.get(state)
+        if cached is not None:
+            return cached
+
+        if self.automaton.is_complete(state):
+            allowed = torch.tensor([self.table.eos_token_id], dtype=torch.long)
+        else:
+            top = state[0][-1]
+            ids: List[int] = []
+            if top[0] == "S" and not top[2]:
+                # Inside a string: plain tokens by length, the rest by walking
+                remaining = top[1]
+                plain = self.table.plain_ids if remaining is None \
+                    else self.table.plain_ids[self.table.plain_lengths <= remaining]
+                self._walk(self.table.string_trie, state, ids)
+                allowed = torch.cat([plain, torch.tensor(ids, dtype=torch.long)])
+            else:
+                self._walk(self.table.trie, state, ids)
+                allowed = torch.tensor(ids, dtype=torch.long)
+
+        if len(self._memo) >= self.MAX_MEMO:
+            self._memo.clear()
+        self._memo[state] = allowed
+        return allowed
+
+    def _walk(self, node: _TrieNode, state: State, ids: List[int]):
+        advance = self.automaton.advance
+        for byte, child in node.children.items():
+            next_state = advance(state, byte)
+            if next_state is None:
+                continue
+            ids.extend(child.token_ids)
+            if child.children:
+                self._walk(child, next_state, ids)
+
+    def closing_token(self, state: State) -> Optional[int]:
+        """Next token of the shortest completion (None if already complete)"""
+        suffix = self.automaton.closing_suffix(state)
+        return self.table.longest_prefix_token(suffix) if suffix else None
+
+    def advance_token(self, state: State, token_id: int) -> Optional[State]:
+        """Feed a generated token's bytes; None if it is not a valid continuation"""
+        data = self.table.bytes_by_id.get(token_id)
+        if data is None:
+            return None
+        for byte in data:
+            state = self.automaton.advance(state, byte)
+            if state is None:
+                return None
+        return state
+
+
+class JsonLogitsProcessor:
+    """Logits processor masking tokens that would break the schema
+
+    Keeps the automaton state of each batch row after every generated
+    token. An input continues from the longest prefix it shares with the
+    previous one, which covers the usual one token per step as well as
+    assisted decoding, where draft and main model share the processor and
+    verification rewinds to the last accepted token. An input that diverges
+    before the generated part starts a new generation, so one instance can
+    serve the several ``generate`` calls a batched pipeline makes.
+
+    With ``max_new_tokens`` it also guarantees a complete document: once the
+    remaining budget only just covers the shortest closing sequence, that
+    sequence is forced token by token.
+    """
+
+    def __init__(self, constraint: JsonConstraint, max_new_tokens: Optional[int] = None):
+        self.constraint = constraint
+        self.max_new_tokens = max_new_tokens
+        self._previous = None
+        self._start = 0
+        # Per row: the state before any generated token, then after each one (None once the row left the schema)
+        self._history: List[List[Optional[State]]] = []
+
+    def __call__(self, input_ids, scores):
+        import torch
+
+        shared = shared_prefix_length(self._previous, input_ids)
+        if shared < self._start:
+            self._start = input_ids.shape[1]
+            self._history = [[self.constraint.automaton.initial_state()] for _ in range(input_ids.shape[0])]
+            shared = self._start
+        for history in self._history:
+            del history[shared - self._start + 1:]
+        for history, tokens in zip(self._history, input_ids[:, shared:].tolist()):
+            for token in tokens:
+                state = history[-1]
+                history.append(None if state is None else self.constraint.advance_token(state, token))
+        self._previous = input_ids
+        states = [history[-1] for history in self._history]
+
+        remaining = None
+        if self.max_new_tokens is not None:
+            remaining = self.max_new_tokens - (input_ids.shape[1] - self._start)
+
+        mask = torch.full_like(scores, float("-inf"))
+        for row, state in enumerate(states):
+            if state is None:
+                # Row already ended (EOS, then padding): leave it unconstrained
+                mask[row] = 0
+                continue
+            forced = self._forced_token(state, remaining)
+            if forced is not None:
+                mask[row, forced] = 0
+                continue
+            allowed = self.constraint.allowed_tokens(state)
+            mask[row, allowed[allowed < scores.shape[-1]]] = 0
+        return scores + mask
+
+    def _forced_token(self, state: State, remaining: Optional[int]) -> Optional[int]:
+        if remaining is None or self.constraint.automaton.is_complete(state):
+            return None
+        suffix = self.constraint.automaton.closing_suffix(state)
+        if len(suffix) + self.constraint.max_growth < remaining:
+            return None
+        return self.constraint.closing_token(state)
+
+
+_TABLES: Dict[int, TokenTable] = {}
+_CONSTRAINTS: Dict[Tuple[int, str], JsonConstraint] = {}
+
+
+def json_constraint(tokenizer, schema: Dict[str, Any]) -> JsonConstraint:
+    """Shared constraint for (tokenizer, schema); the vocabulary scan runs once per tokenizer"""
+    schema_key = json.dumps(schema, sort_keys=True)
+    key = (id(tokenizer), schema_key)
+    if key not in _CONSTRAINTS:
+        if id(tokenizer) not in _TABLES:
+            _TABLES[id(tokenizer)] = TokenTable(tokenizer)
+        _CONSTRAINTS[key] = JsonConstraint(schema, _TABLES[id(tokenizer)])
+    return _CONSTRAINTS[key]
+
+
+def apply_json_schema(tokenizer, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a ``json_schema`` generation param into a logits processor
+
+    Returns params without ``json_schema``. Backends call this before
+    ``model.generate`` / the pipeline; without a tokenizer the schema is dropped.
+    """
+    params = dict(params)
+    schema = params.pop("json_schema", None)
+    if schema is None or tokenizer is None:
+        return params
+    from transformers import LogitsProcessorList
+
+    processors = LogitsProcessorList(params.pop("logits_processor", None) or [])
+    processors.append(JsonLogitsProcessor(json_constraint(tokenizer, schema), params.get("max_new_tokens")))
+    params["logits_processor"] = processors
+    params.setdefault("eos_token_id", tokenizer.eos_token_id)
+    return params
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Process-wide registry of loaded models with lazy loading and pre-warming
+
+Orchestrators used to build a fresh GPT-2 pipeline in ``__init__``, so every
+script run (and every orchestrator) paid the full model load even when all
+responses came from the cache. Models are now loaded on first use and shared:
+one causal LM per model id serves the pipeline, raw-model and prefix-cache
+backends of every orchestrator and agent in the process.
+
+Token counting uses the standalone ``tokenizers`` package, so building
+prompts (and answering from the response cache) never imports torch.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+class ModelRegistry:
+    """Thread-safe load-once store keyed by name, with per-key load timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Future] = {}
+        self.load_times: Dict[str, float] = {}
+
+    def get(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return the value for key, loading it on first use (concurrent callers wait)"""
+        future, owner = self._claim(key)
+        if owner:
+            self._load(key, loader, future)
+        return future.result()
+
+    def prewarm(self, key: str, loader: Callable[[], Any]) -> Future:
+        """Start loading key in a background thread; later get() calls wait for it"""
+        future, owner = self._claim(key)
+        if owner:
+            threading.Thread(target=self._load, args=(key, loader, future),
+                             name=f"prewarm-{key}", daemon=True).start()
+        return future
+
+    def _claim(self, key: str):
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._entries[key] = future
+            return future, True
+
+    def _load(self, key: str, loader: Callable[[], Any], future: Future):
+        start = time.perf_counter()
+        try:
+            value = loader()
+        except BaseException as exc:
+            # Forget failed loads so a later call can retry
+            with self._lock:
+                self._entries.pop(key, None)
+            future.set_exception(exc)
+            return
+        self.load_times[key] = time.perf_counter() - start
+        future.set_result(value)
+
+    def is_loaded(self, key: str) -> bool:
+        future = self._entries.get(key)
+        return future is not None and future.done() and future.exception() is None
+
+    def report(self) -> Dict[str, float]:
+        """Seconds spent loading each entry so far"""
+        return dict(self.load_times)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.load_times.clear()
+
+
+# Shared by every orchestrator and agent in the process
+registry = ModelRegistry()
+
+
+def load_causal_lm(model_id: str):
+    """Model and HF tokenizer, configured for left-padded batched generation"""
+    print(f"🔄 Loading {model_id}... (this may take a moment)")
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    tokenizer.pad_token_id = tokenizer.eos_token_id
+    tokenizer.padding_side = "left"
+    model = AutoModelForCausalLM.from_pretrained(model_id).eval()
+    return model, tokenizer
+
+
+def load_token_counter(model_id: str):
+    """Fast tokenizer from the ``tokenizers`` package (no torch import)"""
+    from tokenizers import Tokenizer
+
+    return Tokenizer.from_pretrained(model_id)
+
+
+class LazyTokenizer:
+    """Tokenizer stand-in that loads on the first encode() call"""
+
+    def __init__(self, model_id: str, registry: ModelRegistry = registry):
+        self.model_id = model_id
+        self.registry = registry
+
+    def encode(self, text: str) -> List[int]:
+        tokenizer = self.registry.get(f"tokenizer:{self.model_id}", lambda: load_token_counter(self.model_id))
+        return tokenizer.encode(text).ids
+
+
+class LazyBackend:
+    """GeneratorBackend that loads its shared model on the first generate() call
+
+    ``kind`` picks the backend built on top of the shared model:
+    ``pipeline`` (PipelineBackend), ``raw`` (RawModelBackend), ``prefix``
+    (PrefixCacheBackend) or ``assisted`` (AssistedBackend, drafting with the
+    shared ``draft_model_id``). Prefixes registered before loading are
+    applied once the model is loaded.
+    """
+
+    def __init__(self, model_id: str = "gpt2", kind: str = "pipeline", prewarm: bool = False,
+                 registry: ModelRegistry = registry, draft_model_id: str = "distilgpt2", **default_params):
+        if kind not in ("pipeline", "raw", "prefix", "assisted"):
+            raise ValueError(f"Unknown backend kind: {kind}")
+        self.model_id = model_id
+        self.kind = kind
+        self.draft_model_id = draft_model_id
+        self.registry = registry
+        self.default_params = default_params
+        self.tokenizer = LazyTokenizer(model_id, registry)
+        self._backend = None
+        self._lock = threading.Lock()
+        self._pending_prefixes: List[str] = []
+        if prewarm:
+            self.registry.prewarm(self._model_key, self._load_model)
+            if kind == "assisted":
+                self.registry.prewarm(self._draft_key, self._load_draft)
+
+    @property
+    def _model_key(self) -> str:
+        return f"causal_lm:{self.model_id}"
+
+    def _load_model(self):
+        return load_causal_lm(self.model_id)
+
+    @property
+    def _draft_key(self) -> str:
+        return f"causal_lm:{self.draft_model_id}"
+
+    def _load_draft(self):
+        return load_causal_lm(self.draft_model_id)
+
+    @property
+    def loaded(self) -> bool:
+        return self._backend is not None
+
+    @property
+    def backend(self):
+        """The concrete backend, loading the shared model if needed"""
+        if self._backend is None:
+            model, tokenizer = self.registry.get(self._model_key, self._load_model)
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._build(model, tokenizer)
+        return self._backend
+
+    def _build(self, model, tokenizer):
+        from generator_backends import PipelineBackend, RawModelBackend
+        from prefix_cache import PrefixCacheBackend
+
+        if self.kind == "prefix":
+            backend = PrefixCacheBackend(model, tokenizer, **self.default_params)
+            for prefix in self._pending_prefixes:
+                backend.register_prefix(prefix)
+            return backend
+        if self.kind == "raw":
+            return RawModelBackend(model, tokenizer, **self.default_params)
+        if self.kind == "assisted":
+            from assisted_decoding import AssistedBackend
+
+            draft_model, _ = self.registry.get(self._draft_key, self._load_draft)
+            return AssistedBackend(model, tokenizer, draft_model, **self.default_params)
+
+        from transformers import pipeline
+        pipe = pipeline("text-generation", model=model, tokenizer=tokenizer)
+        return PipelineBackend(pipe, **self.default_params)
+
+    def register_prefix(self, prefix: str):
+        """Queue (or apply) a static prefix for the prefix-cache backend"""
+        if self.kind != "prefix":
+            return
+        if self._backend is None:
+            if prefix not in self._pending_prefixes:
+                self._pending_prefixes.append(prefix)
+        else:
+            self._backend.register_prefix(prefix)
+
+    def generate(self, prompts: List[str], **params) -> List[str]:
+        return self.backend.generate(prompts, **params)
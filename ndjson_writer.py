@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Streaming newline-delimited JSON output for storyboards
+
+Instead of one pretty-printed JSON file written when the whole story is
+done, NdjsonWriter appends one record per line as soon as an agent produces
+it: characters (again whenever a character is updated; the last record per
+name wins), scenes and validation results. Each line is flushed so a reader
+tailing the file sees it right away. At checkpoints (the end of a phase or
+chunk) the writer adds a checkpoint record and fsyncs the file, so
+everything before the last checkpoint line survives a crash.
+
+    {"type": "scene", "data": {"scene_id": 1, ...}}
+    {"type": "checkpoint", "records": 7, "data": {"phase": "scenes"}}
+
+The writer is a SharedMemory observer: ``memory.observers.append(writer)``.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+
+def _plain(payload: Any) -> Any:
+    if hasattr(payload, "to_dict"):
+        return payload.to_dict()
+    if hasattr(payload, "__dict__"):
+        return dict(vars(payload))
+    return payload
+
+
+class NdjsonWriter:
+    """Appends storyboard records to an NDJSON file as they are produced"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self.records = 0
+
+    def __call__(self, kind: str, payload: Any):
+        """Observer entry point: checkpoint events fsync, everything else is a record"""
+        if kind == "checkpoint":
+            self.checkpoint(payload)
+        else:
+            self.write(kind, payload)
+
+    def write(self, kind: str, payload: Any):
+        line = json.dumps({"type": kind, "data": _plain(payload)}, ensure_ascii=False)
+        self._file.write(line + "\n")
+        self._file.flush()
+        self.records += 1
+
+    def checkpoint(self, payload: Optional[Dict[str, Any]] = None):
+        """Mark everything written so far as durable"""
+        record = {"type": "checkpoint", "records": self.records, "data": payload or {}}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint({"phase": "done"})
+            self._file.close()
+
+    def __enter__(self) -> "NdjsonWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+KV-cache reuse for static prompt prefixes
+
+Every agent prompt starts with the same long instruction block from its
+PromptTemplate. A plain ``transformers.pipeline`` re-encodes that block on
+every call. PrefixCacheBackend precomputes ``past_key_values`` once per
+registered prefix and hands a copy to ``model.generate``, so only the
+variable suffix (story text, roster) pays prefill cost.
+
+It implements the GeneratorBackend protocol, so agents need no changes.
+"""
+
+import copy
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from early_stop import apply_early_stop
+from json_constraint import apply_json_schema
+
+
+class PrefixCacheBackend:
+    """GeneratorBackend that reuses KV caches of registered prefixes
+
+    The prefix and the suffix are tokenized separately. Token boundaries can
+    therefore differ slightly from tokenizing the whole prompt at once.
+    Registered prefixes end in whitespace, which keeps the difference
+    negligible. Prompts in a list are generated one by one: each has its own
+    cached prefix, so left-padded batching does not apply.
+    """
+
+    def __init__(self, model, tokenizer, **default_kwargs):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.default_kwargs = default_kwargs
+        self.model_id = getattr(model, "name_or_path", None) or type(model).__name__
+        self._prefixes: Dict[str, Tuple[Any, Any]] = {}
+
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.prefill_tokens_saved = 0
+
+    @classmethod
+    def from_pretrained(cls, model_id: str = "gpt2", **default_kwargs) -> "PrefixCacheBackend":
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = AutoModelForCausalLM.from_pretrained(model_id).eval()
+        return cls(model, tokenizer, **default_kwargs)
+
+    def register_prefix(self, prefix: str) -> float:
+        """Prefill and store the KV cache for a static prefix; returns seconds spent"""
+        if not prefix or prefix in self._prefixes:
+            return 0.0
+        import torch
+
+        start = time.perf_counter()
+        input_ids = self.tokenizer(prefix, return_tensors="pt").input_ids
+        with torch.no_grad():
+            past_key_values = self.model(input_ids, use_cache=True).past_key_values
+        self._prefixes[prefix] = (input_ids, past_key_values)
+        return time.perf_counter() - start
+
+    def _match(self, prompt: str) -> Optional[str]:
+        """Longest registered prefix the prompt starts with"""
+        matches = [prefix for prefix in self._prefixes if prompt.startswith(prefix)]
+        return max(matches, key=len) if matches else None
+
+    def encode(self, prompt: str) -> Tuple[Any, Any, int]:
+        """Input ids for the prompt plus a fresh copy of the matching prefix cache (or None)"""
+        import torch
+
+        prefix = self._match(prompt)
+        if prefix is not None:
+            prefix_ids, past_key_values = self._prefixes[prefix]
+            suffix_ids = self.tokenizer(
+                prompt[len(prefix):], return_tensors="pt", add_special_tokens=False
+            ).input_ids
+            # generate() needs at least one uncached token to start from
+            if suffix_ids.shape[1] > 0:
+                self.prefix_hits += 1
+                self.prefill_tokens_saved += prefix_ids.shape[1]
+                input_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+                # generate() extends the cache in place, so each call gets its own copy
+                return input_ids, copy.deepcopy(past_key_values), prefix_ids.shape[1]
+
+        self.prefix_misses += 1
+        return self.tokenizer(prompt, return_tensors="pt").input_ids, None, 0
+
+    def generate(self, prompts: List[str], **generation_kwargs) -> List[str]:
+        import torch
+
+        kwargs = {**self.default_kwargs, **generation_kwargs}
+        kwargs = apply_early_stop(self.tokenizer, apply_json_schema(self.tokenizer, kwargs))
+        kwargs.pop("batch_size", None)
+        kwargs.setdefault("pad_token_id", self.tokenizer.eos_token_id)
+
+        texts: List[str] = []
+        for prompt in prompts:
+            input_ids, past_key_values, _ = self.encode(prompt)
+            with torch.no_grad():
+                generated = self.model.generate(
+                    input_ids=input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    past_key_values=past_key_values,
+                    **kwargs
+                )
+            texts.append(self.tokenizer.decode(generated[0, input_ids.shape[1]:], skip_special_tokens=True))
+        return texts
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "registered_prefixes": len(self._prefixes),
+            "prefix_hits": self.prefix_hits,
+            "prefix_misses": self.prefix_misses,
+            "prefill_tokens_saved": self.prefill_tokens_saved,
+        }
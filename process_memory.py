@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Multi-process SharedMemory for parallel agent workers
+
+SharedMemory lives in one process, so agents cannot be spread over cores.
+ProcessSharedMemory keeps the roster and scenes in a StoryboardStore (sqlite
+in WAL mode). Every process opens its own connection to the same file, and
+the object pickles as just its path.
+
+Character writes use optimistic versioning: a write only succeeds if the
+stored row still has the version this process last saw. When another
+worker updated the character in between, its version is merged in (gaps
+filled from theirs, relationships unioned) and the write is retried. If both
+sides set an attribute to different values, this worker's value wins, the
+clash is recorded as a CharacterConflict, and both values go into the
+attribute log so RuleValidator reports the drift.
+
+ProcessAgentPool runs CharacterExtractionAgent, ScenePlanningAgent and
+ConsistencyValidationAgent calls in a ProcessPoolExecutor. Each worker
+builds its own backend from a picklable factory and its own agents.
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from character_consistency_poc import Character, MultiAgentOrchestrator, SharedMemory
+from generator_backends import GeneratorBackend, StubBackend
+from storyboard_store import StoryboardStore
+from story_chunking import chunk_story
+
+# Per-agent report lists collected in the workers and gathered in the parent
+REPORT_LISTS = ("prompt_reports", "generation_reports", "fast_path_reports")
+
+
+@dataclass
+class CharacterConflict:
+    """Two workers stated different values for the same attribute"""
+    character: str
+    attribute: str
+    theirs: Any
+    ours: Any
+
+
+class ProcessSharedMemory(SharedMemory):
+    """SharedMemory whose state lives in a sqlite file shared by several processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._versions: Dict[str, int] = {}  # character -> stored version this process has seen
+        self.conflicts: List[CharacterConflict] = []
+        super().__init__(StoryboardStore(path))
+
+    def __reduce__(self):
+        # Each process opens its own connection
+        return (ProcessSharedMemory, (self.path,))
+
+    def load_from_store(self):
+        self.refresh()
+
+    def refresh(self):
+        """Pull in characters other processes added or changed since the last look
+
+        A new name that is an alias of a known character (another worker
+        stored it before it knew that character) is merged into it, as
+        add_character would.
+        """
+        for name, (version, data) in self.store.load_character_versions().items():
+            if self._versions.get(name, 0) >= version:
+                continue
+            self._versions[name] = version
+            character = self.characters.get(name)
+            if character is not None:
+                # The stored version is newer and already includes this process's last write
+                self._merge_into(character, Character(**data))
+                continue
+            canonical = self.aliases.resolve_one(name)
+            if canonical is None:
+                self._insert(Character(**data))
+                continue
+            # Another worker stored an alias of a known character under its own row: fold it in
+            self.aliases.add(canonical, name)
+            self._merge_into(self.characters[canonical], Character(**data))
+            self._persist(self.characters[canonical])
+
+    def _persist(self, character: Character):
+        """Write with optimistic versioning, merging and retrying after a lost race"""
+        while True:
+            version = self.store.compare_and_set_character(
+                character.name, character.to_dict(), self._versions.get(character.name, 0)
+            )
+            if version is not None:
+                self._versions[character.name] = version
+                return
+            version, theirs = self.store.load_character(character.name)
+            self._merge(character, theirs)
+            self._versions[character.name] = version
+
+    def _merge(self, character: Character, theirs: Dict[str, Any]):
+        """Fill gaps from the stored version; on differing values ours wins and the clash is recorded"""
+        for field in fields(Character):
+            their_value = theirs.get(field.name)
+            if field.name == "name" or their_value is None:
+                continue
+            ours = getattr(character, field.name)
+            if field.name == "relationships":
+                for other, relation in their_value.items():
+                    character.relationships.setdefault(other, relation)
+            elif ours is None:
+                setattr(character, field.name, their_value)
+                self._log_attribute(character.name, field.name, their_value, None)
+            elif ours != their_value:
+                self.conflicts.append(CharacterConflict(character.name, field.name, their_value, ours))
+                self._log_attribute(character.name, field.name, their_value, None)
+                self._log_attribute(character.name, field.name, ours, None)
+
+
+# State of the current worker process, set up by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(path: str, backend_factory: Callable[[], GeneratorBackend]):
+    memory = ProcessSharedMemory(path)
+    _worker["memory"] = memory
+    _worker["agents"] = MultiAgentOrchestrator(backend_factory()).create_agents(memory)
+
+
+def _run_agent(agent_key: str, input_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, list], List[CharacterConflict]]:
+    """One agent call in a worker: result, the reports it produced and any write conflicts"""
+    memory: ProcessSharedMemory = _worker["memory"]
+    agent = _worker["agents"][agent_key]
+    memory.refresh()
+    for name in REPORT_LISTS:
+        if hasattr(agent, name):
+            getattr(agent, name).clear()
+    result = asyncio.run(agent.process(input_data))
+    reports = {name: list(getattr(agent, name)) for name in REPORT_LISTS if hasattr(agent, name)}
+    conflicts, memory.conflicts = memory.conflicts, []
+    return result, reports, conflicts
+
+
+class ProcessAgentPool:
+    """Fans agent calls out over worker processes sharing one ProcessSharedMemory file"""
+
+    def __init__(self, path: str, backend_factory: Callable[[], GeneratorBackend] = StubBackend,
+                 max_workers: Optional[int] = None):
+        self.memory = ProcessSharedMemory(path)
+        self.executor = ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(path, backend_factory))
+        # Local agent set that only collects the workers' reports for the output metadata
+        self.agents = MultiAgentOrchestrator(StubBackend()).create_agents(self.memory)
+        self.conflicts: List[CharacterConflict] = []
+
+    async def run(self, agent_key: str, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run one agent over many inputs in parallel, then pull the workers' writes"""
+        loop = asyncio.get_running_loop()
+        outcomes = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, _run_agent, agent_key, input_data) for input_data in inputs
+        ))
+        agent = self.agents[agent_key]
+        results = []
+        for result, reports, conflicts in outcomes:
+            for name, items in reports.items():
+                getattr(agent, name).extend(items)
+            self.conflicts.extend(conflicts)
+            results.append(result)
+        self.memory.refresh()
+        return results
+
+    async def process_story(self, story_text: str, max_chars: int = 600) -> Dict[str, Any]:
+        """Chunked pipeline with extraction and validation spread over the workers
+
+        Planning stays in order (chunk N sees the scenes of chunk N-1) but
+        still runs in a worker. Output has the same shape as process_story.
+        """
+        chunks = chunk_story(story_text, max_chars=max_chars)
+        await self.run("character_extractor", [{"story_text": chunk.text} for chunk in chunks])
+
+        scene_groups = []
+        for chunk in chunks:
+            start = len(self.memory.scenes)
+            await self.run("scene_planner", [{"story_text": chunk.text}])
+            scene_groups.append(self.memory.scenes[start:])
+
+        validations = await self.run("consistency_validator", [{"scenes": scenes} for scenes in scene_groups if scenes])
+        validation_result = MultiAgentOrchestrator.merge_validation_results(validations)
+        if self.conflicts:
+            print(f"⚠️ {len(self.conflicts)} تداخل همزمان در به‌روزرسانی کاراکترها ادغام شد")
+        return MultiAgentOrchestrator.build_output(story_text, self.memory, self.agents, validation_result)
+
+    def close(self):
+        self.executor.shutdown()
+        self.memory.store.close()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted prompt assembly for the story agents
+
+Agents used to paste the whole roster (and, for validation, every scene) into
+each prompt as indented JSON, so prompt length grew without bound. The
+PromptBuilder instead:
+
+- measures prompts with the model tokenizer,
+- encodes the roster and scenes compactly (short keys, no indentation),
+- keeps only the characters relevant to the current text,
+- trims the least relevant entries until the prompt fits the agent's budget,
+- and reports how many tokens that saved compared to the old encoding.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# GPT-2 has a 1024-token context and the agents generate up to 256 new tokens
+DEFAULT_PROMPT_BUDGET = 1024 - 256
+
+CHARACTER_KEYS = {
+    "name": "n",
+    "age": "a",
+    "appearance": "ap",
+    "personality": "p",
+    "role": "r",
+    "relationships": "rel",
+}
+
+SCENE_KEYS = {
+    "scene_id": "id",
+    "description": "d",
+    "characters_present": "c",
+    "location": "l",
+    "time_of_day": "t",
+    "mood": "m",
+    "key_actions": "k",
+}
+
+
+def _legend(keys: Dict[str, str]) -> str:
+    return "keys: " + ", ".join(f"{short}={full}" for full, short in keys.items())
+
+
+CHARACTER_LEGEND = _legend(CHARACTER_KEYS)
+SCENE_LEGEND = _legend(SCENE_KEYS)
+
+
+def _compact(data: Dict[str, Any], keys: Dict[str, str]) -> Dict[str, Any]:
+    """Rename fields to short keys and drop empty values"""
+    return {keys.get(k, k): v for k, v in data.items() if v not in (None, "", [], {})}
+
+
+def encode_characters(characters: Sequence[Any]) -> str:
+    """Compact JSON for a list of Character objects (empty list if none)"""
+    if not characters:
+        return "[]"
+    rows = [_compact(char.to_dict(), CHARACTER_KEYS) for char in characters]
+    return CHARACTER_LEGEND + "\n" + json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_scenes(scenes: Sequence[Any]) -> str:
+    """Compact JSON for a list of Scene objects (empty list if none)"""
+    if not scenes:
+        return "[]"
+    rows = [_compact(scene.to_dict(), SCENE_KEYS) for scene in scenes]
+    return SCENE_LEGEND + "\n" + json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+
+
+def legacy_characters(characters: Iterable[Any]) -> str:
+    """The original roster encoding, kept to measure savings against"""
+    return json.dumps([char.to_dict() for char in characters], ensure_ascii=False, indent=2)
+
+
+def legacy_scenes(scenes: Iterable[Any]) -> str:
+    """The original scene encoding, kept to measure savings against"""
+    return json.dumps([scene.to_dict() for scene in scenes], ensure_ascii=False, indent=2)
+
+
+def relevant_characters(characters: Iterable[Any], text: str = "",
+                        names: Iterable[str] = ()) -> List[Any]:
+    """Characters mentioned in the text or named explicitly, most relevant first"""
+    named = set(names)
+    scored = []
+    for char in characters:
+        score = text.count(char.name) if text else 0
+        if char.name in named:
+            score += 1000
+        if score:
+            scored.append((score, char))
+    scored.sort(key=lambda item: -item[0])
+    return [char for _, char in scored]
+
+
+@dataclass
+class PromptReport:
+    """Token accounting for one assembled prompt"""
+    agent: str
+    tokens: int
+    baseline_tokens: int
+    budget: int
+    characters_included: int = 0
+    characters_dropped: int = 0
+    scenes_included: int = 0
+    scenes_dropped: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_tokens - self.tokens
+
+    @property
+    def over_budget(self) -> bool:
+        return self.tokens > self.budget
+
+
+@dataclass
+class PromptBuilder:
+    """Assembles agent prompts within a per-agent token budget"""
+    tokenizer: Any = None
+    budgets: Dict[str, int] = field(default_factory=dict)
+    default_budget: int = DEFAULT_PROMPT_BUDGET
+
+    def count_tokens(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text))
+        # GPT-2 BPE is byte-level; Persian text averages about two bytes per token
+        return len(text.encode("utf-8")) // 2
+
+    def budget_for(self, agent_name: str) -> int:
+        return self.budgets.get(agent_name, self.default_budget)
+
+    def build(self, agent_name: str, template: Any, fields: Dict[str, str],
+              characters_field: Optional[str] = None, characters: Sequence[Any] = (),
+              all_characters: Sequence[Any] = (), scenes_field: Optional[str] = None,
+              scenes: Sequence[Any] = (), trim_scenes: bool = True) -> Tuple[str, PromptReport]:
+        """Render ``template`` with compact roster/scene fields trimmed to budget
+
+        ``characters`` are the relevant characters, most relevant first;
+        ``all_characters`` is the full roster the old encoding would have sent.
+        Scenes are dropped oldest first, then characters least relevant first,
+        until the prompt fits. Fixed ``fields`` (the story text) are never cut,
+        nor are the scenes with ``trim_scenes=False`` (scenes the prompt is
+        about rather than context); the report is then over budget if the
+        characters alone do not make it fit.
+        """
+        budget = self.budget_for(agent_name)
+        characters = list(characters)
+        scenes = list(scenes)
+
+        def render(chars: List[Any], scene_list: List[Any], legacy: bool = False) -> str:
+            values = dict(fields)
+            if characters_field:
+                values[characters_field] = legacy_characters(chars) if legacy else encode_characters(chars)
+            if scenes_field:
+                values[scenes_field] = legacy_scenes(scene_list) if legacy else encode_scenes(scene_list)
+            return template.format(**values)
+
+        baseline_tokens = self.count_tokens(render(list(all_characters), scenes, legacy=True))
+
+        def trimmed(dropped: int) -> Tuple[List[Any], List[Any]]:
+            """Drop the first `dropped` entries of: scenes oldest first, then characters from the end"""
+            scene_drop = min(dropped, len(scenes)) if trim_scenes else 0
+            char_drop = dropped - scene_drop
+            return characters[:len(characters) - char_drop], scenes[scene_drop:]
+
+        kept_chars, kept_scenes = characters, scenes
+        prompt = render(kept_chars, kept_scenes)
+        tokens = self.count_tokens(prompt)
+        if tokens > budget:
+            # Prompt length shrinks monotonically with entries dropped: binary search the fewest drops
+            low, high = 1, (len(scenes) if trim_scenes else 0) + len(characters)
+            best = (high, *trimmed(high))
+            while low <= high:
+                mid = (low + high) // 2
+                chars_mid, scenes_mid = trimmed(mid)
+                if self.count_tokens(render(chars_mid, scenes_mid)) <= budget:
+                    best = (mid, chars_mid, scenes_mid)
+                    high = mid - 1
+                else:
+                    low = mid + 1
+            _, kept_chars, kept_scenes = best
+            prompt = render(kept_chars, kept_scenes)
+            tokens = self.count_tokens(prompt)
+
+        report = PromptReport(
+            agent=agent_name,
+            tokens=tokens,
+            baseline_tokens=baseline_tokens,
+            budget=budget,
+            characters_included=len(kept_chars),
+            characters_dropped=len(characters) - len(kept_chars),
+            scenes_included=len(kept_scenes),
+            scenes_dropped=len(scenes) - len(kept_scenes),
+        )
+        return prompt, report
+
+
+def summarize_reports(reports: Iterable[PromptReport]) -> Dict[str, Any]:
+    """Aggregate prompt reports per agent for run metadata"""
+    summary: Dict[str, Dict[str, int]] = {}
+    for report in reports:
+        entry = summary.setdefault(report.agent, {
+            "calls": 0, "prompt_tokens": 0, "baseline_tokens": 0, "tokens_saved": 0, "over_budget_calls": 0
+        })
+        entry["calls"] += 1
+        entry["prompt_tokens"] += report.tokens
+        entry["baseline_tokens"] += report.baseline_tokens
+        entry["tokens_saved"] += report.tokens_saved
+        entry["over_budget_calls"] += int(report.over_budget)
+    return summary
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Prompt-level response cache for text-generation backends
+
+Wraps any GeneratorBackend (``backend.generate(prompts, **params)``) with a
+content-addressed cache. Keys are a hash of the model id, the prompt and
+the generation kwargs. Entries live in an in-memory LRU tier and, optionally,
+in a size-bounded sqlite tier that survives across runs.
+
+Only deterministic calls are cached: ``do_sample=False`` or a fixed ``seed``.
+Sampled calls always go to the model and are counted as ``uncacheable``.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Kwargs that change how a call is executed but not what it returns
+NON_SEMANTIC_KWARGS = {"batch_size"}
+
+
+def make_cache_key(model_id: str, prompt: str, generation_kwargs: Dict[str, Any]) -> str:
+    """Hash model id, prompt and generation kwargs into a stable cache key"""
+    semantic_kwargs = {k: v for k, v in generation_kwargs.items() if k not in NON_SEMANTIC_KWARGS}
+    payload = json.dumps(
+        {"model": model_id, "prompt": prompt, "kwargs": semantic_kwargs},
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(generation_kwargs: Dict[str, Any]) -> bool:
+    """A call is reproducible with greedy decoding or a fixed seed"""
+    return generation_kwargs.get("do_sample") is False or generation_kwargs.get("seed") is not None
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional sqlite) store for generator outputs"""
+
+    def __init__(self, max_entries: int = 1024, db_path: Optional[str] = None,
+                 max_disk_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+
+        if db_path:
+            self._db = sqlite3.connect(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Look a key up in memory, then on disk (promoting disk hits to memory)"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return self._memory[key]
+
+        if self._db is not None:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+                value = json.loads(row[0])
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any):
+        """Store a value in both tiers"""
+        self._remember(key, value)
+
+        if self._db is not None:
+            encoded = json.dumps(value, ensure_ascii=False)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, encoded, len(encoded.encode("utf-8")), time.time())
+            )
+            self._evict_disk()
+            self._db.commit()
+
+    def _remember(self, key: str, value: Any):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk(self):
+        """Drop least recently used rows until the disk tier fits its byte budget"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, size in self._db.execute(
+                "SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for reporting"""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class CachedBackend:
+    """GeneratorBackend wrapper that consults a ResponseCache before generating
+
+    If ``seed`` is given it is applied before every prompt, which makes
+    sampled generation reproducible and therefore cacheable.
+    """
+
+    def __init__(self, backend, cache: ResponseCache, seed: Optional[int] = None):
+        self.backend = backend
+        self.cache = cache
+        self.seed = seed
+        self.model_id = backend.model_id
+
+    def __getattr__(self, name: str):
+        # Expose the wrapped backend's attributes (tokenizer, register_prefix, ...)
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def generate(self, prompts: List[str], **generation_kwargs) -> List[str]:
+        if self.seed is not None:
+            generation_kwargs.setdefault("seed", self.seed)
+
+        if not is_deterministic(generation_kwargs):
+            self.cache.uncacheable += len(prompts)
+            return self._generate(prompts, generation_kwargs)
+
+        keys = [make_cache_key(self.model_id, prompt, generation_kwargs) for prompt in prompts]
+        results: List[Optional[str]] = [self.cache.get(key) for key in keys]
+
+        # Generate each distinct missing prompt once, even if it repeats within the batch
+        missing: Dict[str, int] = {}
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(keys[i], i)
+        if missing:
+            generated = dict(zip(missing, self._generate(
+                [prompts[i] for i in missing.values()], generation_kwargs)))
+            for key, text in generated.items():
+                self.cache.put(key, text)
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = generated[key]
+
+        return results
+
+    def _generate(self, prompts: List[str], generation_kwargs: Dict[str, Any]) -> List[str]:
+        kwargs = dict(generation_kwargs)
+        seed = kwargs.pop("seed", None)
+        if seed is None:
+            return self.backend.generate(list(prompts), **kwargs)
+        # Seed and generate each prompt on its own, so a cached completion does
+        # not depend on which other prompts happened to share its batch
+        texts = []
+        for prompt in prompts:
+            self._seed(seed)
+            texts.extend(self.backend.generate([prompt], **kwargs))
+        return texts
+
+    def _seed(self, seed: int):
+        """Seed the model's RNGs; backends without a tokenizer (the stub) are not transformers models"""
+        if getattr(self.backend, "tokenizer", None) is None:
+            return
+        from transformers import set_seed
+        set_seed(seed)
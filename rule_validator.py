@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Rule-based fast path for consistency validation
+
+Many inconsistencies are visible in the structured data alone, without
+asking the model: a scene naming a character the roster does not know, an
+age or hair color that changed between Character updates, or a relationship
+only one side of the pair knows about. RuleValidator checks a batch of
+scenes against SharedMemory and sorts each scene into one of three verdicts:
+
+- consistent: every character resolves and nothing contradicts the roster
+- inconsistent: a rule found a contradiction (issues and suggestions filled in)
+- ambiguous: the rules cannot decide (a name matching several characters, or
+  a hair color or age in the description that no present character has);
+  only these scenes are escalated to ConsistencyValidationAgent's LLM call
+
+Roster facts (drift, asymmetric relationships) are derived once per batch
+and every scene name is resolved in one bulk AliasIndex lookup, so the cost
+is one pass over the roster plus one pass over the scenes. Drift is read
+from SharedMemory.attribute_log and kept up to date from its new versions
+only. Hair colors are compared as bit masks and ages as floats, in numpy
+arrays covering every consecutive pair of versions (or every scene) at once.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from character_index import CHAR_MAP, DIACRITICS, NON_WORD
+
+CONSISTENT = "consistent"
+INCONSISTENT = "inconsistent"
+AMBIGUOUS = "ambiguous"
+
+# Hair color words (Persian and English) -> canonical color
+HAIR_COLORS = {
+    "سیاه": "black", "مشکی": "black", "black": "black", "dark": "black",
+    "بلوند": "blond", "طلایی": "blond", "بور": "blond", "blond": "blond", "blonde": "blond", "golden": "blond",
+    "قهوه": "brown", "خرمایی": "brown", "brown": "brown", "brunette": "brown",
+    "قرمز": "red", "حنایی": "red", "red": "red", "ginger": "red", "auburn": "red",
+    "سفید": "white", "white": "white",
+    "خاکستری": "gray", "جوگندمی": "gray", "gray": "gray", "grey": "gray",
+}
+# Canonical hair colors as bits, so sets of colors compare as integer masks
+COLOR_BITS = {color: 1 << bit for bit, color in enumerate(sorted(set(HAIR_COLORS.values())))}
+HAIR_WORDS = frozenset({"مو", "موی", "موهای", "موها", "گیسو", "hair", "haired"})
+# Tokens on either side of a hair word that may name its color
+HAIR_WINDOW = 3
+# Logged attributes whose changes count as drift
+DRIFT_ATTRIBUTES = frozenset({"age", "appearance"})
+
+AGE_PATTERN = re.compile(r"(\d{1,3})\s*(?:ساله|سال|years?\s*old|-year-old)")
+PERSIAN_DIGITS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789")
+
+
+def _words(text: str) -> List[str]:
+    text = text.translate(CHAR_MAP)
+    return NON_WORD.sub(" ", DIACRITICS.sub("", text)).lower().split()
+
+
+def hair_colors(text: str) -> FrozenSet[str]:
+    """Canonical hair colors mentioned next to a hair word ("موهای سیاه", "blond hair")"""
+    words = _words(text or "")
+    colors = set()
+    for i, word in enumerate(words):
+        if word in HAIR_WORDS:
+            for neighbour in words[max(i - HAIR_WINDOW, 0):i + HAIR_WINDOW + 1]:
+                if neighbour in HAIR_COLORS:
+                    colors.add(HAIR_COLORS[neighbour])
+    return frozenset(colors)
+
+
+def hair_color_mask(text: str) -> int:
+    """hair_colors as a COLOR_BITS mask (0 if none)"""
+    mask = 0
+    for color in hair_colors(text):
+        mask |= COLOR_BITS[color]
+    return mask
+
+
+def _age_number(value: Any) -> float:
+    """Age as a float for array comparisons; NaN (unequal to everything) if missing or not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def stated_ages(text: str) -> Set[int]:
+    """Ages written in the text ("۱۲ ساله", "28 years old")"""
+    return {int(match) for match in AGE_PATTERN.findall((text or "").translate(PERSIAN_DIGITS))}
+
+
+@dataclass
+class SceneVerdict:
+    """Outcome of the rule checks for one scene"""
+    scene_id: int
+    verdict: str
+    issues: List[str] = field(default_factory=list)
+    suggestions: List[str] = field(default_factory=list)
+
+    def to_result(self) -> Dict[str, Any]:
+        """Same shape as one entry of the LLM's validation_results"""
+        return {
+            "scene_id": self.scene_id,
+            "is_consistent": self.verdict == CONSISTENT,
+            "issues": self.issues,
+            "suggestions": self.suggestions,
+            "checked_by": "rules",
+        }
+
+
+@dataclass
+class FastPathReport:
+    """Scenes decided by rules vs escalated, for one validation call"""
+    scenes: int
+    decided: int
+    escalated: int
+    llm_calls: int         # group calls made for the escalated scenes
+    llm_calls_needed: int  # group calls validating every scene would have taken
+
+    @property
+    def llm_calls_avoided(self) -> int:
+        return self.llm_calls_needed - self.llm_calls
+
+
+def summarize_fast_path(reports: Iterable[FastPathReport]) -> Dict[str, int]:
+    """Aggregate fast-path reports for run metadata"""
+    summary = {"validation_calls": 0, "scenes": 0, "decided_by_rules": 0, "escalated_to_llm": 0,
+               "llm_calls": 0, "llm_calls_avoided": 0}
+    for report in reports:
+        summary["validation_calls"] += 1
+        summary["scenes"] += report.scenes
+        summary["decided_by_rules"] += report.decided
+        summary["escalated_to_llm"] += report.escalated
+        summary["llm_calls"] += report.llm_calls
+        summary["llm_calls_avoided"] += report.llm_calls_avoided
+    return summary
+
+
+class RuleValidator:
+    """Deterministic scene checks against a SharedMemory roster"""
+
+    def __init__(self, shared_memory):
+        self.shared_memory = shared_memory
+        # Character key -> attribute -> drift issues, updated from the attribute log's deltas
+        self._drift: Dict[str, Dict[str, List[str]]] = {}
+        self._log_position = 0
+
+    def roster_drift(self) -> Dict[str, List[str]]:
+        """Character key -> descriptions of age/hair color changes across updates
+
+        Only the attributes with versions appended since the previous call
+        are re-examined.
+        """
+        log = self.shared_memory.attribute_log
+        touched = sorted({(version.character, version.attribute) for version in log.records_from(self._log_position)
+                          if version.attribute in DRIFT_ATTRIBUTES})
+        self._log_position = len(log)
+        histories = [log.history(key, attribute) for key, attribute in touched]
+        for (key, attribute), issues in zip(touched, self._drift_issues(touched, histories)):
+            self._drift.setdefault(key, {})[attribute] = issues
+        return {
+            key: [issue for issues in attributes.values() for issue in issues]
+            for key, attributes in self._drift.items() if any(attributes.values())
+        }
+
+    def _drift_issues(self, touched: List[Tuple[str, str]], histories: List[List[Any]]) -> List[List[str]]:
+        """Drift issues of each history, comparing all consecutive versions in one go"""
+        issues: List[List[str]] = [[] for _ in histories]
+        versions = [version for history in histories for version in history]
+        if len(versions) < 2:
+            return issues
+        segment = np.repeat(np.arange(len(histories)), [len(history) for history in histories])
+        is_age = np.array([version.attribute == "age" for version in versions])
+        ages = np.array([_age_number(version.value) if version.attribute == "age" else np.nan
+                         for version in versions])
+        masks = np.array([hair_color_mask(version.value) if version.attribute == "appearance" else 0
+                          for version in versions], dtype=np.int64)
+
+        old, new = slice(None, -1), slice(1, None)
+        age_changed = is_age[new] & (ages[old] != ages[new])
+        # Both versions name a hair color and no color is shared
+        hair_changed = (masks[old] != 0) & (masks[new] != 0) & ((masks[old] & masks[new]) == 0)
+        drifted = (segment[old] == segment[new]) & (age_changed | hair_changed)
+        for i in np.flatnonzero(drifted):
+            key, attribute = touched[segment[i]]
+            issues[segment[i]].append(self._describe_drift(key, attribute, versions[i], versions[i + 1]))
+        return issues
+
+    @staticmethod
+    def _describe_drift(key: str, attribute: str, old: Any, new: Any) -> str:
+        if attribute == "age":
+            return f"سن {key} در صحنه {new.scene_id} از {old.value} به {new.value} تغییر کرده است"
+        return f"رنگ موی {key} در صحنه {new.scene_id} از «{old.value}» به «{new.value}» تغییر کرده است"
+
+    def asymmetric_pairs(self) -> Set[FrozenSet[str]]:
+        """Pairs where one character lists the other but not the reverse
+
+        Only counted when the other side has relationships of its own, so a
+        character whose relationships were never extracted is not flagged.
+        """
+        characters = self.shared_memory.characters
+        targets = [name for character in characters.values() for name in character.relationships]
+        resolved = self.shared_memory.resolve(targets)
+        links: Dict[str, Set[str]] = {
+            key: {resolved[name] for name in character.relationships if resolved[name] is not None}
+            for key, character in characters.items()
+        }
+        pairs = set()
+        for key, others in links.items():
+            for other in others:
+                if other != key and characters[other].relationships and key not in links[other]:
+                    pairs.add(frozenset((key, other)))
+        return pairs
+
+    def check(self, scenes: List[Any]) -> List[SceneVerdict]:
+        """Verdict for each scene, in the order of scenes"""
+        aliases = self.shared_memory.aliases
+        drift = self.roster_drift()
+        asymmetric = self.asymmetric_pairs()
+        resolved = self.shared_memory.resolve([name for scene in scenes for name in scene.characters_present])
+
+        verdicts = []
+        presents: List[List[str]] = []
+        for scene in scenes:
+            verdict = SceneVerdict(scene.scene_id, CONSISTENT)
+            present: List[str] = []
+            for name in scene.characters_present:
+                canonical = resolved[name]
+                if canonical is not None:
+                    present.append(canonical)
+                elif aliases.candidates(name):
+                    verdict.verdict = AMBIGUOUS
+                else:
+                    verdict.issues.append(f"کاراکتر «{name}» در حافظه مشترک وجود ندارد")
+                    verdict.suggestions.append(f"«{name}» را استخراج کنید یا به یک کاراکتر موجود نسبت دهید")
+            verdicts.append(verdict)
+            presents.append(present)
+
+        unexplained = self._descriptions_unexplained(scenes, presents)
+        for verdict, present, is_unexplained in zip(verdicts, presents, unexplained):
+            for key in dict.fromkeys(present):
+                if key in drift:
+                    verdict.issues.extend(drift[key])
+                    verdict.suggestions.append(f"یک مقدار واحد برای ویژگی‌های {key} در همه صحنه‌ها انتخاب کنید")
+            for pair in asymmetric:
+                if pair <= set(present):
+                    first, second = sorted(pair)
+                    verdict.issues.append(f"رابطه {first} و {second} فقط از یک طرف ثبت شده است")
+                    verdict.suggestions.append(f"رابطه را برای هر دو کاراکتر {first} و {second} ثبت کنید")
+
+            if verdict.issues:
+                verdict.verdict = INCONSISTENT
+            elif verdict.verdict == CONSISTENT and is_unexplained:
+                verdict.verdict = AMBIGUOUS
+        return verdicts
+
+    def _descriptions_unexplained(self, scenes: List[Any], presents: List[List[str]]) -> np.ndarray:
+        """Per scene: does the description state a hair color or age that no present character has"""
+        characters = self.shared_memory.characters
+        masks = {key: hair_color_mask(characters[key].appearance) for key in set().union(*presents)}
+        described = np.array([hair_color_mask(scene.description) for scene in scenes], dtype=np.int64)
+        known = np.array([np.bitwise_or.reduce(np.array([masks[key] for key in present], dtype=np.int64))
+                          for present in presents], dtype=np.int64)
+        unexplained = (described & ~known) != 0
+        # Ages are few per description; a set difference is simpler than a ragged array
+        for i, (scene, present) in enumerate(zip(scenes, presents)):
+            if not unexplained[i]:
+                ages = stated_ages(scene.description)
+                unexplained[i] = bool(ages) and bool(ages - {characters[key].age for key in present})
+        return unexplained
+
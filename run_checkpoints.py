@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Per-phase checkpoints for resumable pipeline runs
+
+After every phase of a story (extraction, planning, validation) the pipeline
+saves the phase's result together with a snapshot of its SharedMemory, in
+one JSON file per story named by a hash of the story text. A finished story
+also stores its final output. With ``resume=True`` a rerun loads the file,
+restores the memory from the last completed phase and carries on from
+there; stories that already finished are returned from the file without
+calling any agent. The hash also covers the pipeline's run config (model
+ids and generation defaults), so a run with another model or settings does
+not pick up checkpoints it did not produce.
+
+Files are written to a temporary name, fsynced and renamed over the old
+checkpoint, so a crash mid-write leaves the previous checkpoint intact.
+"""
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+
+def backend_config(backend: Any) -> Dict[str, Any]:
+    """What a backend generates with: model id, decoding variant, draft model, default params and seed"""
+    config = {"model": getattr(backend, "model_id", type(backend).__name__)}
+    for name in ("kind", "draft_model_id", "assistant_id", "default_params", "seed"):
+        value = getattr(backend, name, None)
+        if value is not None:
+            config[name] = value
+    return config
+
+
+class RunCheckpoints:
+    """Directory of per-story checkpoint files"""
+
+    def __init__(self, directory: str = ".checkpoints"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(story_text: str, pipeline: str, config: Optional[Dict[str, Any]] = None) -> str:
+        """Checkpoint key of a story for one pipeline (their phases and outputs differ) and run config"""
+        config_json = json.dumps(config or {}, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(f"{pipeline}\0{config_json}\0{story_text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Dict[str, Any]:
+        """Saved state: {"phases": {name: result}, "memory": snapshot, "output": ...} (empty if none)"""
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, key: str, state: Dict[str, Any]):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def save_phase(self, key: str, phase: str, result: Any, memory: Dict[str, List[Dict[str, Any]]]):
+        """Record a completed phase and the memory as it stands after it"""
+        state = self.load(key)
+        state.setdefault("phases", {})[phase] = result
+        state["memory"] = memory
+        self._write(key, state)
+
+    def save_output(self, key: str, output: Dict[str, Any]):
+        """Mark the story finished"""
+        state = self.load(key)
+        state["output"] = output
+        self._write(key, state)
+
+    def clear(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
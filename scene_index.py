@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Relevance-based scene retrieval
+
+The scene planner used to see only the last three scenes, losing long-range
+context, while the validator pasted every scene into its prompt. SceneIndex
+picks the k scenes most relevant to the text and characters at hand:
+
+- an inverted index from character name and from location to scene
+  positions scores scenes sharing the current characters or a location
+  named in the text,
+- hashed n-gram vectors of the descriptions (see character_similarity.py)
+  add the cosine similarity to the current text,
+- a small recency term breaks ties in favour of later scenes.
+
+Scoring is a few vectorized NumPy operations over all scenes, so retrieval
+stays cheap with thousands of scenes while the prompt only ever gets k of
+them. Scenes are indexed by position in SharedMemory.scenes as they are
+added.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from character_similarity import HashedNgramEncoder
+
+CHARACTER_WEIGHT = 1.0
+LOCATION_WEIGHT = 0.5
+TEXT_WEIGHT = 1.0
+RECENCY_WEIGHT = 0.1
+
+
+def scene_key(scene: Any) -> Tuple[int, str]:
+    """Identity of a scene that survives reloading it from a store"""
+    return scene.scene_id, scene.description
+
+
+class SceneIndex:
+    """Inverted character/location index plus description vectors over scene positions"""
+
+    def __init__(self, encoder: Optional[HashedNgramEncoder] = None, capacity: int = 256):
+        self.encoder = encoder or HashedNgramEncoder()
+        self._matrix = np.zeros((capacity, self.encoder.dim), dtype=np.float32)
+        self._count = 0
+        self._by_character: Dict[str, List[int]] = {}
+        self._by_location: Dict[str, List[int]] = {}
+        self._positions: Dict[Tuple[int, str], List[int]] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, scene: Any):
+        position = self._count
+        if position == len(self._matrix):
+            grown = np.zeros((2 * len(self._matrix), self.encoder.dim), dtype=np.float32)
+            grown[:position] = self._matrix
+            self._matrix = grown
+        self._matrix[position] = self.encoder.encode_text(scene.description)
+        for name in dict.fromkeys(scene.characters_present):
+            self._by_character.setdefault(name, []).append(position)
+        if scene.location:
+            self._by_location.setdefault(scene.location, []).append(position)
+        self._positions.setdefault(scene_key(scene), []).append(position)
+        self._count += 1
+
+    def search(self, text: str = "", characters: Iterable[str] = (), k: int = 3,
+               exclude: Iterable[Any] = ()) -> List[int]:
+        """Positions of the k most relevant scenes, in story order"""
+        count = self._count
+        scores = RECENCY_WEIGHT * np.arange(1, count + 1, dtype=np.float32) / max(count, 1)
+        if text:
+            scores += TEXT_WEIGHT * (self._matrix[:count] @ self.encoder.encode_text(text))
+            for location, positions in self._by_location.items():
+                if location in text:
+                    scores[positions] += LOCATION_WEIGHT
+        for name in dict.fromkeys(characters):
+            positions = self._by_character.get(name)
+            if positions:
+                scores[positions] += CHARACTER_WEIGHT
+        for scene in exclude:
+            scores[self._positions.get(scene_key(scene), [])] = -np.inf
+        available = count - int(np.isneginf(scores).sum())
+        k = min(k, available)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < count else np.arange(count)
+        return sorted(top.tolist())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+DAG-based async scheduler for agent steps
+
+Blocking work (HF pipeline calls) runs on a bounded executor through
+``loop.run_in_executor`` so the event loop stays responsive. Steps declare
+their dependencies and start as soon as those finish, so independent steps
+overlap (e.g. validating scene chunk N while chunk N+1 is being planned) and
+many stories can be in flight at once. Per-model semaphores cap how many
+generator calls hit the same model concurrently.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+
+@dataclass
+class Step:
+    """One node of a DAG: an async callable run after all of its dependencies"""
+    name: str
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: List[str] = field(default_factory=list)
+
+
+class SchedulerError(RuntimeError):
+    """Raised when a DAG is malformed or one of its steps fails"""
+
+
+class AgentScheduler:
+    """Runs step DAGs concurrently with a bounded executor and per-model limits"""
+
+    def __init__(self, max_workers: int = 4, model_limits: Optional[Dict[str, int]] = None,
+                 default_model_limit: int = 1, executor: Optional[Executor] = None):
+        # Callables sent to a ProcessPoolExecutor must be picklable; the HF
+        # pipeline is not, so the default is a thread pool.
+        self.executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+        self.model_limits = dict(model_limits or {})
+        self.default_model_limit = default_model_limit
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _semaphore(self, model_key: str) -> asyncio.Semaphore:
+        if model_key not in self._semaphores:
+            limit = self.model_limits.get(model_key, self.default_model_limit)
+            self._semaphores[model_key] = asyncio.Semaphore(limit)
+        return self._semaphores[model_key]
+
+    async def run_blocking(self, model_key: str, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call on the executor, respecting the model's concurrency limit"""
+        async with self._semaphore(model_key):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def run_dag(self, steps: List[Step]) -> Dict[str, Any]:
+        """Run steps as soon as their dependencies complete; return results by step name
+
+        Each step receives the results of the steps finished so far. If any
+        step fails, every pending step is cancelled and SchedulerError is raised.
+        """
+        self.validate_dag(steps)
+
+        results: Dict[str, Any] = {}
+        done_events = {step.name: asyncio.Event() for step in steps}
+
+        async def run_step(step: Step):
+            for dep in step.depends_on:
+                await done_events[dep].wait()
+            results[step.name] = await step.run(results)
+            done_events[step.name].set()
+
+        tasks = [asyncio.create_task(run_step(step), name=step.name) for step in steps]
+        self._tasks.update(tasks)
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        except asyncio.CancelledError:
+            # The caller was cancelled: take the whole DAG down with it
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._tasks.difference_update(tasks)
+
+        failed = [task for task in done if not task.cancelled() and task.exception() is not None]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if failed:
+            task = failed[0]
+            raise SchedulerError(f"Step {task.get_name()} failed: {task.exception()!r}") from task.exception()
+        if any(task.cancelled() for task in tasks):
+            raise asyncio.CancelledError()
+        return results
+
+    @staticmethod
+    def validate_dag(steps: List[Step]):
+        """Reject duplicate names, unknown dependencies and cycles before running"""
+        by_name = {step.name: step for step in steps}
+        if len(by_name) != len(steps):
+            raise SchedulerError("Duplicate step names in DAG")
+        for step in steps:
+            missing = [dep for dep in step.depends_on if dep not in by_name]
+            if missing:
+                raise SchedulerError(f"Step {step.name} depends on unknown steps {missing}")
+
+        # Kahn's algorithm: every step must become ready at some point
+        remaining = {step.name: set(step.depends_on) for step in steps}
+        ready = [name for name, deps in remaining.items() if not deps]
+        while ready:
+            name = ready.pop()
+            del remaining[name]
+            for other, deps in remaining.items():
+                if name in deps:
+                    deps.discard(name)
+                    if not deps:
+                        ready.append(other)
+        if remaining:
+            raise SchedulerError(f"Dependency cycle between steps {sorted(remaining)}")
+
+    def cancel(self):
+        """Cancel every step that has not finished yet
+
+        Generator calls already running on the executor finish in the
+        background, but no new steps are started.
+        """
+        for task in list(self._tasks):
+            task.cancel()
+
+    def shutdown(self, wait: bool = True):
+        self.cancel()
+        self.executor.shutdown(wait=wait)
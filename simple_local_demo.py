@@ -9,14 +9,60 @@ This is a simplified version that demonstrates the core concept.
 
 import sys
 import io
+import argparse
 
 # Set encoding for stdout
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 import json
-from transformers import pipeline
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Any
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from early_stop import GenerationReport, count_generated_tokens, summarize_generation
+from generator_backends import GeneratorBackend, StubBackend, as_backend
+from model_registry import LazyBackend, registry
+from ndjson_writer import NdjsonWriter
+from response_cache import CachedBackend, ResponseCache
+from run_checkpoints import RunCheckpoints, backend_config
+from story_chunking import iter_chunks
+from tracing import (FileSpanExporter, Span, Tracer, call_attributes, current_span, format_trace_table,
+                     trace_metadata)
+
+# Story text is fed to the agents in chunks of at most this many characters
+CHUNK_CHARS = 500
+
+# Output schemas for constrained JSON decoding (see json_constraint.py)
+SHORT_TEXT = {"type": "string", "maxLength": 120}
+CHARACTERS_SCHEMA = {
+    "type": "object",
+    "properties": {"characters": {"type": "array", "maxItems": 8, "items": {
+        "type": "object",
+        "properties": {"name": SHORT_TEXT, "age": {"type": ["integer", "null"]},
+                       "appearance": SHORT_TEXT, "personality": SHORT_TEXT},
+        "required": ["name"]
+    }}},
+    "required": ["characters"]
+}
+SCENES_SCHEMA = {
+    "type": "object",
+    "properties": {"scenes": {"type": "array", "maxItems": 4, "items": {
+        "type": "object",
+        "properties": {"scene_id": {"type": "integer"}, "description": SHORT_TEXT,
+                       "characters_present": {"type": "array", "items": SHORT_TEXT, "maxItems": 8},
+                       "location": SHORT_TEXT, "mood": SHORT_TEXT},
+        "required": ["scene_id", "description", "characters_present", "location"]
+    }}},
+    "required": ["scenes"]
+}
+SCORE_SCHEMA = {
+    "type": "object",
+    "properties": {"consistency_score": {"type": "integer"},
+                   "issues": {"type": "array", "items": SHORT_TEXT, "maxItems": 3},
+                   "recommendations": {"type": "array", "items": SHORT_TEXT, "maxItems": 3}},
+    "required": ["consistency_score"]
+}
 
 
 @dataclass
@@ -48,10 +94,17 @@ class SharedMemory:
     def __init__(self):
         self.characters: Dict[str, Character] = {}
         self.scenes: List[Scene] = []
+        # Callbacks (kind, payload) for streamed output (see ndjson_writer.py)
+        self.observers: List[Callable[[str, Any], None]] = []
+
+    def notify(self, kind: str, payload: Any):
+        for observer in self.observers:
+            observer(kind, payload)
 
     def add_character(self, character: Character):
         """Add or update character in shared memory"""
         self.characters[character.name] = character
+        self.notify("character", character)
 
     def get_character(self, name: str) -> Optional[Character]:
         """Retrieve character from shared memory"""
@@ -60,89 +113,147 @@ class SharedMemory:
     def add_scene(self, scene: Scene):
         """Add scene to shared memory"""
         self.scenes.append(scene)
+        self.notify("scene", scene)
 
     def get_all_characters(self) -> Dict[str, Character]:
         """Get all characters"""
         return self.characters.copy()
 
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Characters and scenes as plain data (for checkpoints)"""
+        return {
+            "characters": [dict(char.__dict__) for char in self.characters.values()],
+            "scenes": [dict(scene.__dict__) for scene in self.scenes],
+        }
 
-class CharacterExtractor:
+    def restore(self, snapshot: Dict[str, List[Dict[str, Any]]]):
+        """Add the characters and scenes of a snapshot (into an empty memory)"""
+        for char_data in snapshot.get("characters", []):
+            self.add_character(Character(**char_data))
+        for scene_data in snapshot.get("scenes", []):
+            self.add_scene(Scene(**scene_data))
+
+
+class JsonAgent:
+    """Base for the demo agents: one JSON answer per backend call"""
+
+    def __init__(self, backend: GeneratorBackend):
+        self.backend = backend
+        self.generation_reports: List[GenerationReport] = []
+        # Spans of this agent's calls (see tracing.py); the system shares its tracer
+        self.tracer = Tracer()
+        self.call_spans: List[Span] = []
+
+    @contextmanager
+    def call(self) -> Iterator[Span]:
+        """Span of one agent call; generate() fills in the tokens, the caller marks parsed/fallback"""
+        with self.tracer.span(type(self).__name__, **call_attributes(0, 0, 0.0, parsed=False)) as span:
+            self.call_spans.append(span)
+            yield span
+
+    def generate(self, prompt: str, max_new_tokens: int, schema: Dict[str, Any]) -> str:
+        """Generate a schema-constrained answer, stopping when its JSON object closes"""
+        started = time.perf_counter()
+        result = self.backend.generate(
+            [prompt], max_new_tokens=max_new_tokens, do_sample=True, temperature=0.7,
+            json_schema=schema, stop_on_json=True
+        )[0]
+        generate_seconds = time.perf_counter() - started
+        tokenizer = getattr(self.backend, "tokenizer", None)
+        tokens = count_generated_tokens(tokenizer, result)
+        self.generation_reports.append(GenerationReport(type(self).__name__, max_new_tokens, tokens))
+        span = current_span()
+        if span is not None:
+            span.attributes.update(call_attributes(
+                count_generated_tokens(tokenizer, prompt), tokens, generate_seconds, parsed=False
+            ))
+        return result
+
+
+class CharacterExtractor(JsonAgent):
     """Simple character extraction agent"""
 
-    def __init__(self, generator):
-        self.generator = generator
-
-    def extract_characters(self, story_text: str) -> List[Character]:
+    def extract_characters(self, story_text: str, use_fallback: bool = True) -> List[Character]:
         """Extract characters from story text"""
         prompt = f"""Extract characters from this Persian story. Return as JSON:
 
-Story: {story_text[:500]}...
+Story: {story_text}
 
 Format: {{"characters": [{{"name": "name", "age": age, "appearance": "description", "personality": "traits"}}]}}"""
 
-        try:
-            outputs = self.generator(prompt, max_new_tokens=200, do_sample=True, temperature=0.7)
-            result = outputs[0]['generated_text']
-
-            # Simple JSON extraction
-            start_idx = result.find('{')
-            end_idx = result.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = result[start_idx:end_idx]
-                data = json.loads(json_str)
-
-                characters = []
-                for char_data in data.get("characters", []):
-                    if isinstance(char_data, dict) and "name" in char_data:
-                        characters.append(Character(**char_data))
-                return characters
-
-        except Exception as e:
-            print(f"Character extraction error: {e}")
-
-        # Fallback: extract basic characters
+        with self.call() as span:
+            try:
+                result = self.generate(prompt, 200, CHARACTERS_SCHEMA)
+
+                # Simple JSON extraction
+                start_idx = result.find('{')
+                end_idx = result.rfind('}') + 1
+                if start_idx != -1 and end_idx > start_idx:
+                    json_str = result[start_idx:end_idx]
+                    data = json.loads(json_str)
+
+                    characters = []
+                    for char_data in data.get("characters", []):
+                        if isinstance(char_data, dict) and "name" in char_data:
+                            characters.append(Character(**char_data))
+                    span.attributes["parsed"] = True
+                    return characters
+
+            except Exception as e:
+                print(f"Character extraction error: {e}")
+
+            span.attributes["fallback"] = use_fallback
+            return self.fallback_characters() if use_fallback else []
+
+    @staticmethod
+    def fallback_characters() -> List[Character]:
+        """Fallback: extract basic characters"""
         return [
             Character(name="علی", age=12, appearance="موهای سیاه", personality="ماجراجو"),
             Character(name="سارا", age=11, appearance="موهای بلوند", personality="آرام")
         ]
 
 
-class ScenePlanner:
+class ScenePlanner(JsonAgent):
     """Simple scene planning agent"""
 
-    def __init__(self, generator):
-        self.generator = generator
-
-    def plan_scenes(self, story_text: str, characters: Dict[str, Character]) -> List[Scene]:
+    def plan_scenes(self, story_text: str, characters: Dict[str, Character],
+                    use_fallback: bool = True) -> List[Scene]:
         """Plan scenes from story text"""
         char_names = list(characters.keys())
         prompt = f"""Create 3-4 scenes for this story. Characters: {', '.join(char_names)}
 
-Story: {story_text[:300]}...
+Story: {story_text}
 
 Format: {{"scenes": [{{"scene_id": 1, "description": "desc", "characters_present": ["name"], "location": "place"}}]}}"""
 
-        try:
-            outputs = self.generator(prompt, max_new_tokens=200, do_sample=True, temperature=0.7)
-            result = outputs[0]['generated_text']
-
-            # Simple JSON extraction
-            start_idx = result.find('{')
-            end_idx = result.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = result[start_idx:end_idx]
-                data = json.loads(json_str)
-
-                scenes = []
-                for scene_data in data.get("scenes", []):
-                    if isinstance(scene_data, dict):
-                        scenes.append(Scene(**scene_data))
-                return scenes
-
-        except Exception as e:
-            print(f"Scene planning error: {e}")
-
-        # Fallback scenes
+        with self.call() as span:
+            try:
+                result = self.generate(prompt, 200, SCENES_SCHEMA)
+
+                # Simple JSON extraction
+                start_idx = result.find('{')
+                end_idx = result.rfind('}') + 1
+                if start_idx != -1 and end_idx > start_idx:
+                    json_str = result[start_idx:end_idx]
+                    data = json.loads(json_str)
+
+                    scenes = []
+                    for scene_data in data.get("scenes", []):
+                        if isinstance(scene_data, dict):
+                            scenes.append(Scene(**scene_data))
+                    span.attributes["parsed"] = True
+                    return scenes
+
+            except Exception as e:
+                print(f"Scene planning error: {e}")
+
+            span.attributes["fallback"] = use_fallback
+            return self.fallback_scenes(char_names) if use_fallback else []
+
+    @staticmethod
+    def fallback_scenes(char_names: List[str]) -> List[Scene]:
+        """Fallback scenes"""
         return [
             Scene(1, "معرفی شخصیت‌ها", char_names[:2], "شهر"),
             Scene(2, "ماجراجویی", char_names[:2], "پارک"),
@@ -150,12 +261,9 @@ Format: {{"scenes": [{{"scene_id": 1, "description": "desc", "characters_present
         ]
 
 
-class ConsistencyValidator:
+class ConsistencyValidator(JsonAgent):
     """Simple consistency validation agent"""
 
-    def __init__(self, generator):
-        self.generator = generator
-
     def validate_consistency(self, characters: Dict[str, Character], scenes: List[Scene]) -> Dict[str, Any]:
         """Validate consistency across scenes"""
         char_names = list(characters.keys())
@@ -168,82 +276,133 @@ Scenes: {scene_count} scenes
 
 Rate consistency from 0-100: {{"consistency_score": 85, "issues": ["minor issue"], "recommendations": ["suggestion"]}}"""
 
-        try:
-            outputs = self.generator(prompt, max_new_tokens=100, do_sample=True, temperature=0.7)
-            result = outputs[0]['generated_text']
-
-            # Simple JSON extraction
-            start_idx = result.find('{')
-            end_idx = result.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = result[start_idx:end_idx]
-                return json.loads(json_str)
-
-        except Exception as e:
-            print(f"Consistency validation error: {e}")
-
-        # Fallback result
-        return {
-            "consistency_score": 80,
-            "issues": ["بررسی دستی توصیه می‌شود"],
-            "recommendations": ["از shared memory استفاده کنید"]
-        }
+        with self.call() as span:
+            try:
+                result = self.generate(prompt, 100, SCORE_SCHEMA)
+
+                # Simple JSON extraction
+                start_idx = result.find('{')
+                end_idx = result.rfind('}') + 1
+                if start_idx != -1 and end_idx > start_idx:
+                    json_str = result[start_idx:end_idx]
+                    validation = json.loads(json_str)
+                    span.attributes["parsed"] = True
+                    return validation
+
+            except Exception as e:
+                print(f"Consistency validation error: {e}")
+
+            # Fallback result
+            span.attributes["fallback"] = True
+            return {
+                "consistency_score": 80,
+                "issues": ["بررسی دستی توصیه می‌شود"],
+                "recommendations": ["از shared memory استفاده کنید"]
+            }
 
 
 class LocalMultiAgentSystem:
     """Local multi-agent system using GPT-2"""
 
-    def __init__(self):
-        print("Loading GPT-2 model locally... (first run may take time)")
-        self.generator = pipeline(
-            "text-generation",
-            model="gpt2",
-            max_new_tokens=256,
-            temperature=0.7,
-            do_sample=True,
-            pad_token_id=50256
-        )
+    def __init__(self, backend: Optional[GeneratorBackend] = None, cache: Optional[ResponseCache] = None,
+                 seed: Optional[int] = None, checkpoints: Optional[RunCheckpoints] = None,
+                 tracer: Optional[Tracer] = None, agent_backends: Optional[Dict[str, GeneratorBackend]] = None,
+                 assisted_agents: Iterable[str] = (), draft_model: str = "distilgpt2"):
+        model_defaults = dict(max_new_tokens=256, temperature=0.7, do_sample=True, pad_token_id=50256)
+        # Backends for individual agents by class name; assisted_agents decode the
+        # default GPT-2 with draft_model proposing tokens (assisted_decoding.py)
+        agent_backends = dict(agent_backends or {})
+        if assisted_agents:
+            if backend is not None:
+                raise ValueError("assisted_agents applies to the default local model; pass agent_backends instead")
+            assisted = LazyBackend("gpt2", kind="assisted", draft_model_id=draft_model, **model_defaults)
+            for name in assisted_agents:
+                agent_backends.setdefault(name, assisted)
+        if backend is None:
+            # Loaded on first use and shared with other systems in the process
+            backend = LazyBackend("gpt2", **model_defaults)
+        self.backend = as_backend(backend)
+        agent_backends = {name: as_backend(agent_backend) for name, agent_backend in agent_backends.items()}
+        if cache is not None:
+            # Reuse responses for repeated prompts (requires do_sample=False or a fixed seed)
+            self.backend = CachedBackend(self.backend, cache, seed=seed)
+            agent_backends = {name: CachedBackend(agent_backend, cache, seed=seed)
+                              for name, agent_backend in agent_backends.items()}
 
         self.shared_memory = SharedMemory()
-        self.extractor = CharacterExtractor(self.generator)
-        self.planner = ScenePlanner(self.generator)
-        self.validator = ConsistencyValidator(self.generator)
-
-    def process_story(self, story_text: str) -> Dict[str, Any]:
-        """Process a complete story through the agent pipeline"""
+        # Per-phase checkpoints (see run_checkpoints.py); resume=True defaults to .checkpoints/
+        self.checkpoints = checkpoints
+        self.extractor = CharacterExtractor(agent_backends.get("CharacterExtractor", self.backend))
+        self.planner = ScenePlanner(agent_backends.get("ScenePlanner", self.backend))
+        self.validator = ConsistencyValidator(agent_backends.get("ConsistencyValidator", self.backend))
+        # Phase and agent call spans; pass Tracer(FileSpanExporter(path)) to also write them to a file
+        self.tracer = tracer if tracer is not None else Tracer()
+        for agent in (self.extractor, self.planner, self.validator):
+            agent.tracer = self.tracer
+
+    def _add_scenes(self, scenes: List[Scene], first_id: int):
+        """Store scenes, renumbering them across the story (each chunk numbers its scenes from 1)"""
+        for scene_id, scene in enumerate(scenes, start=first_id):
+            scene.scene_id = scene_id
+            self.shared_memory.add_scene(scene)
 
-        print("Starting story processing...")
-        print(f"Story length: {len(story_text)} characters")
+    def _save_phase(self, key: Optional[str], phase: str):
+        if key is not None:
+            self.checkpoints.save_phase(key, phase, True, self.shared_memory.snapshot())
 
-        # Phase 1: Character Extraction
-        print("\nPhase 1: Extracting characters...")
-        characters = self.extractor.extract_characters(story_text)
-        for char in characters:
-            self.shared_memory.add_character(char)
-        print(f"Extracted {len(characters)} characters")
+    def process_story(self, story_text: str, resume: bool = False) -> Dict[str, Any]:
+        """Process a complete story through the agent pipeline
 
-        # Phase 2: Scene Planning
-        print("\nPhase 2: Planning scenes...")
-        scenes = self.planner.plan_scenes(story_text, self.shared_memory.get_all_characters())
-        for scene in scenes:
-            self.shared_memory.add_scene(scene)
-        print(f"Planned {len(scenes)} scenes")
+        With checkpoints every phase is saved as it completes; with resume a
+        rerun restores the last completed phase instead of running it again,
+        and a finished story is returned straight from its checkpoint.
+        """
 
-        # Phase 3: Consistency Validation
-        print("\nPhase 3: Validating consistency...")
-        validation = self.validator.validate_consistency(
-            self.shared_memory.get_all_characters(),
-            self.shared_memory.scenes
-        )
-        print(f"Consistency score: {validation.get('consistency_score', 'N/A')}")
+        print("Starting story processing...")
+        print(f"Story length: {len(story_text)} characters")
+        for agent in (self.extractor, self.planner, self.validator):
+            agent.generation_reports.clear()
+            agent.call_spans.clear()
+
+        if resume and self.checkpoints is None:
+            self.checkpoints = RunCheckpoints()
+        key = None
+        if self.checkpoints is not None:
+            config = {agent.__class__.__name__: backend_config(agent.backend)
+                      for agent in (self.extractor, self.planner, self.validator)}
+            key = RunCheckpoints.key(story_text, "local", config)
+        state = {}
+        if key is not None:
+            if resume:
+                state = self.checkpoints.load(key)
+            else:
+                self.checkpoints.clear(key)
+        if "output" in state:
+            print("Restored finished story from checkpoint")
+            return state["output"]
+        phases = state.get("phases", {})
+        if phases:
+            self.shared_memory.restore(state["memory"])
+            print(f"Resuming after completed phases: {', '.join(phases)}")
+
+        with self.tracer.span("process_story", story_length=len(story_text)) as trace:
+            validation = self._run_phases(story_text, key, phases)
 
         # Prepare final output
-        return {
+        output = {
             "metadata": {
                 "processing_timestamp": "2025-01-08T07:30:00",
                 "story_length": len(story_text),
                 "model": "GPT-2 (local)",
-                "agents": ["CharacterExtractor", "ScenePlanner", "ConsistencyValidator"]
+                "agents": ["CharacterExtractor", "ScenePlanner", "ConsistencyValidator"],
+                "generation_usage": summarize_generation(
+                    report for agent in (self.extractor, self.planner, self.validator)
+                    for report in agent.generation_reports
+                ),
+                "tracing": trace_metadata(
+                    (span for agent in (self.extractor, self.planner, self.validator) for span in agent.call_spans),
+                    trace
+                )
             },
             "characters": [char.to_dict() for char in self.shared_memory.characters.values()],
             "scenes": [scene.__dict__ for scene in self.shared_memory.scenes],
@@ -254,11 +413,82 @@ class LocalMultiAgentSystem:
                 "consistency_score": validation.get('consistency_score', 0)
             }
         }
+        if key is not None:
+            self.checkpoints.save_output(key, output)
+        print()
+        print(format_trace_table(output["metadata"]["tracing"]))
+        return output
+
+    def _run_phases(self, story_text: str, key: Optional[str], phases: Dict[str, Any]) -> Dict[str, Any]:
+        """The three phases of process_story, each in its own span; returns the validation result"""
+
+        # Phases 1 and 2 run chunk by chunk so long stories are not truncated
+        chunks = list(iter_chunks(story_text, max_chars=CHUNK_CHARS))
+        print(f"Story split into {len(chunks)} chunks")
+
+        # Phase 1: Character Extraction
+        print("\nPhase 1: Extracting characters...")
+        with self.tracer.span("characters", restored="characters" in phases) as span:
+            if "characters" not in phases:
+                for chunk in chunks:
+                    for char in self.extractor.extract_characters(chunk.text, use_fallback=False):
+                        self.shared_memory.add_character(char)
+                if not self.shared_memory.characters:
+                    span.attributes["fallback"] = True
+                    for char in self.extractor.fallback_characters():
+                        self.shared_memory.add_character(char)
+                self._save_phase(key, "characters")
+        print(f"Extracted {len(self.shared_memory.characters)} characters")
+        self.shared_memory.notify("checkpoint", {"phase": "characters"})
+
+        # Phase 2: Scene Planning
+        print("\nPhase 2: Planning scenes...")
+        characters = self.shared_memory.get_all_characters()
+        with self.tracer.span("scenes", restored="scenes" in phases) as span:
+            if "scenes" not in phases:
+                scenes = []
+                for chunk in chunks:
+                    # Scenes are stored as each chunk is planned so streamed output can start early
+                    planned = self.planner.plan_scenes(chunk.text, characters, use_fallback=False)
+                    self._add_scenes(planned, first_id=len(scenes) + 1)
+                    scenes.extend(planned)
+                    self.shared_memory.notify("checkpoint", {"phase": "scenes", "chunk": chunk.index})
+                if not scenes:
+                    span.attributes["fallback"] = True
+                    scenes = self.planner.fallback_scenes(list(characters.keys()))
+                    self._add_scenes(scenes, first_id=1)
+                    self.shared_memory.notify("checkpoint", {"phase": "scenes"})
+                self._save_phase(key, "scenes")
+        print(f"Planned {len(self.shared_memory.scenes)} scenes")
+
+        # Phase 3: Consistency Validation
+        print("\nPhase 3: Validating consistency...")
+        with self.tracer.span("validation"):
+            validation = self.validator.validate_consistency(
+                self.shared_memory.get_all_characters(),
+                self.shared_memory.scenes
+            )
+        print(f"Consistency score: {validation.get('consistency_score', 'N/A')}")
+        self.shared_memory.notify("validation", validation)
+        self.shared_memory.notify("checkpoint", {"phase": "validation"})
+        return validation
 
 
 def main():
     """Main function to demonstrate the local system"""
 
+    parser = argparse.ArgumentParser(description="Local multi-agent demo")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub backend instead of GPT-2")
+    parser.add_argument("--ndjson", help="stream characters, scenes and validation to this NDJSON file")
+    parser.add_argument("--resume", action="store_true", help="skip phases already checkpointed in .checkpoints/")
+    parser.add_argument("--trace", help="append phase and agent call spans to this file as OTLP/JSON lines")
+    parser.add_argument("--assisted", nargs="+", default=[], metavar="AGENT",
+                        help="decode these agents (e.g. ScenePlanner) with a draft model proposing tokens")
+    parser.add_argument("--draft-model", default="distilgpt2", help="draft model for --assisted")
+    parser.add_argument("--cache", help="sqlite file of cached responses, reused across runs")
+    parser.add_argument("--seed", type=int, help="fixed sampling seed; sampled calls are only cached with one")
+    args = parser.parse_args()
+
     print("Local Multi-Agent System with GPT-2")
     print("===================================")
     print("✓ No API key required")
@@ -266,7 +496,16 @@ def main():
     print()
 
     # Initialize system
-    system = LocalMultiAgentSystem()
+    # With --cache, prompts answered before are read back without loading the model (or importing torch)
+    cache = ResponseCache(db_path=args.cache) if args.cache else None
+    system = LocalMultiAgentSystem(
+        StubBackend() if args.stub else None,
+        cache=cache,
+        seed=args.seed,
+        tracer=Tracer(FileSpanExporter(args.trace)) if args.trace else None,
+        assisted_agents=[] if args.stub else args.assisted,
+        draft_model=args.draft_model
+    )
 
     # Sample story (comprehensive example with complex relationships)
     sample_story = """
@@ -297,13 +536,21 @@ def main():
     print(sample_story.strip())
     print("\n" + "="*60)
 
-    # Process the story
-    result = system.process_story(sample_story)
-
-    # Save results
-    output_file = "local_demo_output.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.ndjson:
+        # Streaming mode: each record is written as soon as its phase produces it
+        output_file = args.ndjson
+        with NdjsonWriter(output_file) as writer:
+            system.shared_memory.observers.append(writer)
+            result = system.process_story(sample_story, resume=args.resume)
+            writer.write("summary", {"metadata": result["metadata"], **result["summary"]})
+    else:
+        # Process the story
+        result = system.process_story(sample_story, resume=args.resume)
+
+        # Save results
+        output_file = "local_demo_output.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
 
     print(f"\nResult saved to file {output_file}")
 
@@ -312,6 +559,11 @@ def main():
     print(f"• Total characters: {result['summary']['total_characters']}")
     print(f"• Total scenes: {result['summary']['total_scenes']}")
     print(f"• Consistency score: {result['summary']['consistency_score']}")
+    if cache is not None:
+        print(f"• cache: {cache.stats()}")
+        cache.close()
+    for key, seconds in registry.report().items():
+        print(f"• Load time {key}: {seconds:.2f}s")
 
     print("\nProcessing completed!")
     print("This system runs completely locally and requires no internet (after model download)")
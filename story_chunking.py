@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Story chunking for incremental processing of long inputs
+
+Splits a story into paragraph or sentence-window chunks that fit a character
+budget, so each agent call only sees a bounded slice of the text. Every
+sentence of the input ends up in exactly one chunk; nothing is truncated.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Iterator, List
+
+# Sentence terminators for Persian and English text (incl. Arabic question mark)
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?؟…。])\s+")
+PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+
+
+@dataclass
+class StoryChunk:
+    """A contiguous slice of the story"""
+    index: int
+    text: str
+
+
+def iter_paragraphs(story_text: str) -> Iterator[str]:
+    """Yield paragraphs (split on blank lines) as the text is scanned, skipping whitespace-only ones"""
+    start = 0
+    for boundary in PARAGRAPH_BOUNDARY.finditer(story_text):
+        paragraph = story_text[start:boundary.start()].strip()
+        if paragraph:
+            yield paragraph
+        start = boundary.end()
+    paragraph = story_text[start:].strip()
+    if paragraph:
+        yield paragraph
+
+
+def split_paragraphs(story_text: str) -> List[str]:
+    """Split on blank lines, dropping whitespace-only paragraphs"""
+    return list(iter_paragraphs(story_text))
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split on sentence terminators followed by whitespace"""
+    return [s.strip() for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+
+
+def _split_oversized(text: str, max_chars: int) -> List[str]:
+    """Hard-split a single over-long sentence on whitespace (or mid-word as a last resort)"""
+    pieces = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def _pack(units: Iterator[str], max_chars: int, separator: str) -> Iterator[str]:
+    """Greedily pack units, in order, into groups no longer than max_chars"""
+    current = ""
+    for unit in units:
+        candidate = f"{current}{separator}{unit}" if current else unit
+        if len(candidate) <= max_chars:
+            current = candidate
+            continue
+        if current:
+            yield current
+        current = unit
+    if current:
+        yield current
+
+
+def _paragraph_units(paragraph: str, max_chars: int) -> List[str]:
+    """A paragraph as one unit, or as sentence groups if it is too long on its own"""
+    if len(paragraph) <= max_chars:
+        return [paragraph]
+    sentences: List[str] = []
+    for sentence in split_sentences(paragraph):
+        sentences.extend(_split_oversized(sentence, max_chars))
+    return list(_pack(iter(sentences), max_chars, " "))
+
+
+def _sentence_windows(paragraph: str, max_chars: int, window: int) -> Iterator[str]:
+    sentences: List[str] = []
+    for sentence in split_sentences(paragraph):
+        sentences.extend(_split_oversized(sentence, max_chars))
+    for start in range(0, len(sentences), window):
+        yield from _pack(iter(sentences[start:start + window]), max_chars, " ")
+
+
+def iter_chunks(story_text: str, max_chars: int = 600, mode: str = "paragraph",
+                window: int = 3) -> Iterator[StoryChunk]:
+    """Yield chunks of the story in reading order
+
+    ``paragraph`` mode packs consecutive paragraphs up to ``max_chars`` and
+    falls back to sentences for paragraphs that are too long on their own.
+    ``sentence`` mode emits non-overlapping windows of ``window`` sentences
+    (still capped at ``max_chars``). Paragraphs are found as chunks are
+    requested, so the first chunk is ready without scanning the whole text.
+    """
+    if mode == "paragraph":
+        units = (unit for paragraph in iter_paragraphs(story_text)
+                 for unit in _paragraph_units(paragraph, max_chars))
+        groups = _pack(units, max_chars, "\n\n")
+    elif mode == "sentence":
+        groups = (group for paragraph in iter_paragraphs(story_text)
+                  for group in _sentence_windows(paragraph, max_chars, window))
+    else:
+        raise ValueError(f"Unknown chunking mode: {mode}")
+
+    for index, text in enumerate(groups):
+        yield StoryChunk(index, text)
+
+
+def chunk_story(story_text: str, max_chars: int = 600, mode: str = "paragraph",
+                window: int = 3) -> List[StoryChunk]:
+    """List version of iter_chunks"""
+    return list(iter_chunks(story_text, max_chars, mode, window))
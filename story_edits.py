@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Edit-aware reprocessing of a story
+
+A run of process_story_edited remembers, per chunk, a hash of the chunk
+text, the characters the extractor returned for it, the scenes planned from
+it and the validation of those scenes. When the edited story comes back,
+its chunks are hashed and aligned with the previous run's chunks. Unchanged
+chunks replay their recorded characters and scenes instead of calling the
+extraction and planning agents. Their scenes are validated again only if one
+of their characters ended up with different attributes in the new roster.
+"""
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Set
+
+from story_chunking import PARAGRAPH_BOUNDARY
+
+
+def chunk_digest(text: str) -> str:
+    """Hash of a chunk's text, ignoring whitespace differences within paragraphs"""
+    paragraphs = (" ".join(paragraph.split()) for paragraph in PARAGRAPH_BOUNDARY.split(text))
+    return hashlib.sha256("\n\n".join(paragraphs).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ChunkRun:
+    """What one chunk contributed to a run"""
+    digest: str
+    characters: List[Dict[str, Any]]
+    scenes: List[Dict[str, Any]]
+    validation: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class StoryRun:
+    """Per-chunk results of one run, for reuse when the story is edited"""
+    max_chars: int
+    mode: str
+    chunks: List[ChunkRun]
+    roster: Dict[str, Dict[str, Any]]  # character key -> Character.to_dict() at the end of the run
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "StoryRun":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        data["chunks"] = [ChunkRun(**chunk) for chunk in data["chunks"]]
+        return cls(**data)
+
+
+def match_chunks(old_digests: List[str], new_digests: List[str]) -> Dict[int, int]:
+    """New chunk index -> previous chunk index, for chunks whose text did not change"""
+    matcher = SequenceMatcher(None, old_digests, new_digests, autojunk=False)
+    matched: Dict[int, int] = {}
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            matched[block.b + offset] = block.a + offset
+    return matched
+
+
+def changed_characters(old_roster: Dict[str, Dict[str, Any]], new_roster: Dict[str, Dict[str, Any]]) -> Set[str]:
+    """Keys of characters that were added, removed or whose attributes differ"""
+    return {key for key in old_roster.keys() | new_roster.keys() if old_roster.get(key) != new_roster.get(key)}
+
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Persistent storyboard store for SharedMemory
+
+Characters and scenes are written through to a sqlite database in WAL mode,
+so a long-running series keeps its roster and scenes across runs and other
+processes can read the database while one of them writes.
+
+Scenes are never loaded as a whole. PagedScenes is a list-like view over the
+scene table that loads fixed-size pages on demand and keeps a few of them
+in an LRU, so ``len(scenes)``, ``scenes[-3:]`` (get_recent_scenes) and
+appends touch one or two pages however long the history is.
+"""
+
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class StoryboardStore:
+    """sqlite (WAL) tables for characters and scenes"""
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS characters "
+                           "(name TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 1)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(characters)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE characters ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        # Scene position = seq - 1; rows are only ever appended
+        self._conn.execute("CREATE TABLE IF NOT EXISTS scenes (seq INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+
+    def load_characters(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name, data FROM characters ORDER BY rowid").fetchall()
+        return {name: json.loads(data) for name, data in rows}
+
+    def load_character_versions(self) -> Dict[str, Tuple[int, Dict[str, Any]]]:
+        """Character name -> (version, data)"""
+        with self._lock:
+            rows = self._conn.execute("SELECT name, version, data FROM characters ORDER BY rowid").fetchall()
+        return {name: (version, json.loads(data)) for name, version, data in rows}
+
+    def load_character(self, name: str) -> Optional[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            row = self._conn.execute("SELECT version, data FROM characters WHERE name = ?", (name,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def save_character(self, name: str, data: Dict[str, Any]):
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO characters (name, data) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, version = version + 1",
+                (name, payload)
+            )
+
+    def compare_and_set_character(self, name: str, data: Dict[str, Any], expected_version: int) -> Optional[int]:
+        """Write a character only if its stored version is still expected_version (0: not stored yet)
+
+        Returns the new version, or None if another writer got there first.
+        """
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            if expected_version == 0:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO characters (name, data, version) VALUES (?, ?, 1)", (name, payload)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE characters SET data = ?, version = version + 1 WHERE name = ? AND version = ?",
+                    (payload, name, expected_version)
+                )
+        return expected_version + 1 if cursor.rowcount == 1 else None
+
+    def append_scene(self, data: Dict[str, Any]) -> int:
+        """Store a scene and return its position"""
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            cursor = self._conn.execute("INSERT INTO scenes (data) VALUES (?)", (payload,))
+        return cursor.lastrowid - 1
+
+    def scene_count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM scenes").fetchone()
+        return count
+
+    def load_scenes(self, start: int, end: int) -> List[Dict[str, Any]]:
+        """Scenes at positions start <= position < end"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM scenes WHERE seq > ? AND seq <= ? ORDER BY seq", (start, end)
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PagedScenes(Sequence):
+    """List-like scene history backed by a StoryboardStore, loaded page by page
+
+    Only complete pages are cached; the last, partial page is read again when
+    needed so scenes appended by other processes show up.
+    """
+
+    def __init__(self, store: StoryboardStore, factory: Callable[..., Any], page_size: int = 64, max_pages: int = 8):
+        self.store = store
+        self.factory = factory
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._pages: "OrderedDict[int, List[Any]]" = OrderedDict()
+        self.pages_loaded = 0
+
+    def __len__(self) -> int:
+        return self.store.scene_count()
+
+    def _page(self, number: int, count: int) -> List[Any]:
+        page = self._pages.get(number)
+        if page is not None:
+            self._pages.move_to_end(number)
+            return page
+        start = number * self.page_size
+        page = [self.factory(**data) for data in self.store.load_scenes(start, min(start + self.page_size, count))]
+        self.pages_loaded += 1
+        if len(page) == self.page_size:
+            self._pages[number] = page
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return page
+
+    def _range(self, start: int, stop: int, count: int) -> List[Any]:
+        scenes: List[Any] = []
+        position = start
+        while position < stop:
+            number, offset = divmod(position, self.page_size)
+            page = self._page(number, count)
+            if offset >= len(page):
+                break
+            take = page[offset:offset + stop - position]
+            scenes.extend(take)
+            position += len(take)
+        return scenes
+
+    def __getitem__(self, index):
+        count = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(count)
+            if step != 1:
+                return self._range(0, count, count)[index]
+            return self._range(start, stop, count) if start < stop else []
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("scene index out of range")
+        return self._range(index, index + 1, count)[0]
+
+    def __iter__(self):
+        count = len(self)
+        for number in range(0, (count + self.page_size - 1) // self.page_size):
+            yield from self._range(number * self.page_size, min((number + 1) * self.page_size, count), count)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def append(self, scene: Any):
+        self.store.append_scene(scene.to_dict())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Greedy output with a draft model must be byte-identical to the main model alone
+
+Runs on a randomly initialized tiny GPT-2, offline; skipped without torch.
+"""
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import torch  # noqa: E402
+
+from assisted_decoding import AssistedBackend  # noqa: E402
+from benchmark_assisted_decoding import SCHEMAS, truncated_draft  # noqa: E402
+from benchmark_prefix_cache import sample_prompts  # noqa: E402
+from early_stop import JsonStoppingCriteria  # noqa: E402
+from generator_backends import RawModelBackend  # noqa: E402
+from json_constraint import JsonLogitsProcessor, json_constraint  # noqa: E402
+from tiny_models import build_tiny_gpt2, build_tiny_pair  # noqa: E402
+
+PROMPTS = sample_prompts()
+
+
+@pytest.fixture(scope="module")
+def tiny():
+    return build_tiny_pair([prompt for _, _, prompt in PROMPTS], n_layer=4, n_embd=128, n_head=4)
+
+
+@pytest.fixture(scope="module", params=["truncated", "unrelated"])
+def backends(request, tiny):
+    """A draft that mostly agrees with the main model, and one that mostly does not (many rewinds)"""
+    tokenizer, model = tiny
+    if request.param == "truncated":
+        draft = truncated_draft(model, 2)
+    else:
+        draft = build_tiny_gpt2(tokenizer, n_layer=2, n_embd=128, n_head=4, seed=1)
+    return RawModelBackend(model, tokenizer), AssistedBackend(model, tokenizer, draft)
+
+
+@pytest.mark.parametrize("name, prompt", [(name, prompt) for name, _, prompt in PROMPTS],
+                         ids=[name for name, _, _ in PROMPTS])
+@pytest.mark.parametrize("constrained", [False, True])
+def test_assisted_greedy_matches_plain(backends, name, prompt, constrained):
+    plain, assisted = backends
+    params = {"max_new_tokens": 48, "do_sample": False}
+    if constrained:
+        params.update(json_schema=SCHEMAS[name], stop_on_json=True)
+    expected = plain.generate([prompt], **params)[0]
+    assert assisted.generate([prompt], **params)[0] == expected
+
+
+def test_assisted_rejects_some_draft_tokens(backends):
+    """Otherwise the comparison above never exercises the rewind path"""
+    _, assisted = backends
+    name, _, prompt = PROMPTS[0]
+    assisted.generate([prompt], max_new_tokens=48, do_sample=False, json_schema=SCHEMAS[name])
+    report = assisted.reports[-1]
+    assert report.target_passes > 1
+
+
+def test_json_processor_rewind_matches_fresh(tiny):
+    tokenizer, _ = tiny
+    constraint = json_constraint(tokenizer, SCHEMAS["ScenePlanner"])
+    prompt = tokenizer('{"x": 1}', return_tensors="pt")["input_ids"]
+    accepted = tokenizer.encode('{"description": "a')
+    scores = torch.zeros(1, len(tokenizer))
+
+    # Draft proposes the accepted tokens plus two that verification rejects, then the input rewinds
+    rewound = JsonLogitsProcessor(constraint)
+    rewound(prompt, scores)
+    rewound(torch.cat([prompt, torch.tensor([accepted + tokenizer.encode('bc"')])], dim=1), scores)
+    final = torch.cat([prompt, torch.tensor([accepted])], dim=1)
+
+    fresh = JsonLogitsProcessor(constraint)
+    fresh(prompt, scores)
+    assert torch.equal(rewound(final, scores), fresh(final, scores))
+
+
+def test_stopping_criteria_rewind_reopens(tiny):
+    tokenizer, _ = tiny
+    prompt = tokenizer("prompt", return_tensors="pt")["input_ids"]
+    criteria = JsonStoppingCriteria(tokenizer, prompt_length=prompt.shape[1])
+    opened = tokenizer.encode('{"a": 1')
+    closed = torch.cat([prompt, torch.tensor([opened + tokenizer.encode("}")])], dim=1)
+    assert criteria(closed, None).tolist() == [True]
+    # Rewinding past the closing brace must not leave the row marked done
+    assert criteria(torch.cat([prompt, torch.tensor([opened])], dim=1), None).tolist() == [False]
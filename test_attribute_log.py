@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+AttributeLog: version history, point-in-time lookups and deltas
+"""
+
+from attribute_log import AttributeLog
+from character_consistency_poc import Character, Scene, SharedMemory
+
+
+def test_value_at_follows_the_versions():
+    log = AttributeLog()
+    log.record("علی", "age", 12, 1)
+    log.record("علی", "age", 30, 4)
+    assert log.value_at("علی", "age", 0) is None
+    assert log.value_at("علی", "age", 1) == 12
+    assert log.value_at("علی", "age", 3) == 12
+    assert log.value_at("علی", "age", 4) == 30
+    assert log.value_at("علی", "hair", 4) is None
+    assert [version.value for version in log.history("علی", "age")] == [12, 30]
+
+
+def test_repeated_value_is_not_a_new_version():
+    log = AttributeLog()
+    assert log.record("علی", "age", 12, 1) is not None
+    assert log.record("علی", "age", 12, 2) is None
+    assert len(log) == 1
+
+
+def test_scene_ids_never_move_backwards():
+    log = AttributeLog()
+    log.record("علی", "age", 12, 5)
+    late = log.record("سارا", "age", 11, 2)
+    assert late.scene_id == 5
+    assert log.value_at("سارا", "age", 4) is None
+
+
+def test_changes_since_and_records_from():
+    log = AttributeLog()
+    log.record("علی", "age", 12, 1)
+    log.record("سارا", "age", 11, 2)
+    log.record("علی", "role", "قهرمان", 3)
+    assert [(v.character, v.attribute) for v in log.changes_since(1)] == [("سارا", "age"), ("علی", "role")]
+    assert log.changes_since(3) == []
+    assert [v.attribute for v in log.records_from(2)] == ["role"]
+
+
+def test_shared_memory_stamps_extractions_with_the_next_scene():
+    # Attributes extracted for a chunk describe the scenes planned from it, after the current one
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", age=20), scene_id=memory.current_scene_id + 1)
+    for scene_id in (1, 2):
+        memory.add_scene(Scene(scene_id=scene_id, description="", characters_present=["علی"], location="خانه"))
+    memory.add_character(Character(name="علی", age=40), scene_id=memory.current_scene_id + 1)
+    assert memory.attribute_at("علی", "age", 2) == 20
+    assert memory.attribute_at("علی", "age", 3) == 40
+    assert [(v.value, v.scene_id) for v in memory.changes_since(2)] == [(40, 3)]
+
+
+def test_relationships_are_versioned_per_related_character():
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", relationships={"سارا": "دوست"}), scene_id=1)
+    memory.update_character("علی", scene_id=2, relationships={"سارا": "همکلاسی", "مریم": "خواهر"})
+    assert memory.attribute_at("علی", "relationships.سارا", 1) == "دوست"
+    assert memory.attribute_at("علی", "relationships.سارا", 2) == "همکلاسی"
+    assert memory.attribute_at("علی", "relationships.مریم", 1) is None
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Alias resolution: name variants merge into one character, distinct names do not
+"""
+
+from character_consistency_poc import Character, SharedMemory
+from character_index import AliasIndex, name_key
+
+
+def test_case_and_letter_variants_share_a_key():
+    assert name_key("Ali") == name_key("ali")
+    # Arabic yeh/kaf and a zero-width joiner normalize to the Persian spelling
+    assert name_key("علي") == name_key("علی")
+    assert name_key("مهدی‌کاظمی") == name_key("مهدی کاظمی")
+
+
+def test_ali_and_lowercase_ali_merge():
+    memory = SharedMemory()
+    memory.add_character(Character(name="Ali", age=12))
+    merged = memory.add_character(Character(name="ali", appearance="black hair"))
+    assert list(memory.characters) == ["Ali"]
+    assert merged.age == 12 and merged.appearance == "black hair"
+
+
+def test_alireza_stays_separate_from_ali():
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی"))
+    memory.add_character(Character(name="علیرضا"))
+    assert sorted(memory.characters) == ["علی", "علیرضا"]
+    assert memory.resolve(["علی", "علیرضا"]) == {"علی": "علی", "علیرضا": "علیرضا"}
+
+
+def test_name_variations_collapse_to_one_character():
+    # The variants test_edge_cases.py's name_variations story uses for one doctor
+    memory = SharedMemory()
+    for name in ["دکتر احمد حسینی", "آقای حسینی", "احمد", "دکتر حسینی", "آقای احمد"]:
+        memory.add_character(Character(name=name))
+    assert list(memory.characters) == ["دکتر احمد حسینی"]
+    assert memory.get_character("حسینی").name == "دکتر احمد حسینی"
+
+
+def test_ambiguous_given_name_resolves_to_nothing():
+    index = AliasIndex()
+    index.add("احمد حسینی")
+    index.add("احمد رضایی")
+    assert index.candidates("احمد") == {"احمد حسینی", "احمد رضایی"}
+    assert index.resolve_one("احمد") is None
+
+
+def test_remove_forgets_aliases():
+    index = AliasIndex()
+    index.add("احمد حسینی")
+    index.add("احمد حسینی", "دکتر حسینی")
+    index.remove("احمد حسینی")
+    assert len(index) == 0
+    assert index.resolve_one("دکتر حسینی") is None
@@ -4,46 +4,165 @@ Edge Cases Testing for Character Consistency PoC
 
 This script tests various edge cases that can break character consistency
 in multi-agent video generation systems.
+
+Every scenario runs in its own process with a fresh orchestrator (so no
+characters leak between scenarios) and a fixed seed, so runs are
+repeatable and scenarios run in parallel. Each scenario's outcome is
+compared with a golden snapshot in edge_case_golden/<backend>/; latency,
+token counts and the golden comparison are recorded next to pass/fail in
+edge_case_results.json.
+
+    python test_edge_cases.py --stub
+    python test_edge_cases.py --update-golden
 """
 
+import argparse
 import asyncio
+import contextlib
+import io
 import json
 import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 from character_consistency_poc import MultiAgentOrchestrator
+from generator_backends import GeneratorBackend, StubBackend
+
+# Scenario methods of EdgeCaseTester, in report order
+EDGE_CASES = [
+    "test_sudden_character_changes",
+    "test_complex_relationships",
+    "test_inconsistent_descriptions",
+    "test_name_variations",
+    "test_minimal_story",
+    "test_multi_chunk_scene_ids",
+]
+GOLDEN_DIR = "edge_case_golden"
+
+
+def seed_everything(seed: int):
+    """Seed Python's and (when installed) torch's generators"""
+    random.seed(seed)
+    try:
+        from transformers import set_seed
+    except ImportError:
+        return
+    set_seed(seed)
+
+
+def run_edge_case(test_name: str, seed: int,
+                  backend_factory: Optional[Callable[[], GeneratorBackend]]) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """One scenario on a fresh orchestrator: its result, golden snapshot and captured output"""
+    seed_everything(seed)
+    tester = EdgeCaseTester(backend_factory)
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        asyncio.run(getattr(tester, test_name)())
+    latency = time.perf_counter() - start
+
+    test_result = tester.test_results[-1]
+    output = tester.last_output
+    agents = output["metadata"]["tracing"]["agents"].values()
+    snapshot = {
+        **test_result,
+        "characters": [char["name"] for char in output["characters"]],
+        "scenes": [scene["description"] for scene in output["scenes"]],
+        "overall_consistency": output["validation"].get("overall_consistency"),
+    }
+    test_result.update({
+        "seed": seed,
+        "latency_seconds": round(latency, 3),
+        "prompt_tokens": sum(agent["prompt_tokens"] for agent in agents),
+        "generated_tokens": sum(agent["generated_tokens"] for agent in agents),
+    })
+    return test_result, snapshot, log.getvalue()
+
+
+def compare_golden(path: str, snapshot: Dict[str, Any], update: bool) -> Tuple[str, List[str]]:
+    """"match", "mismatch" (with the differing keys) or "new" when no golden exists yet"""
+    if update or not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        return ("updated" if update else "new"), []
+    with open(path, encoding="utf-8") as f:
+        golden = json.load(f)
+    differing = sorted(key for key in golden.keys() | snapshot.keys() if golden.get(key) != snapshot.get(key))
+    return ("mismatch" if differing else "match"), differing
 
 
 class EdgeCaseTester:
     """Test various edge cases for the character consistency system"""
 
-    def __init__(self, openai_api_key: str):
-        self.orchestrator = MultiAgentOrchestrator(openai_api_key)
-        self.orchestrator.initialize_agents()
+    def __init__(self, backend_factory: Optional[Callable[[], GeneratorBackend]] = None, seed: int = 0,
+                 max_workers: Optional[int] = None, backend_name: str = "gpt2", update_golden: bool = False):
+        # A backend factory (picklable, e.g. StubBackend) replaces local GPT-2
+        self.backend_factory = backend_factory
+        self._orchestrator: Optional[MultiAgentOrchestrator] = None
+        self.seed = seed
+        self.max_workers = max_workers
+        self.golden_dir = os.path.join(GOLDEN_DIR, backend_name)
+        self.backend_name = backend_name
+        self.update_golden = update_golden
         self.test_results = []
+        self.last_output: Dict[str, Any] = {}
+        self.wall_seconds = 0.0
+
+    @property
+    def orchestrator(self) -> MultiAgentOrchestrator:
+        """Built on first use, so only the scenario workers create one (its model loads on the first generate())"""
+        if self._orchestrator is None:
+            self._orchestrator = MultiAgentOrchestrator(self.backend_factory() if self.backend_factory else None)
+            self._orchestrator.initialize_agents()
+        return self._orchestrator
+
+    async def process_story(self, story: str, max_chars: Optional[int] = None) -> Dict[str, Any]:
+        """Run the pipeline on a story; with max_chars, chunk by chunk (process_story_incremental)"""
+        # The pipeline's progress output would interleave across workers; keep only the scenario's report
+        with contextlib.redirect_stdout(io.StringIO()):
+            if max_chars is None:
+                self.last_output = await self.orchestrator.process_story(story)
+            else:
+                self.last_output = await self.orchestrator.process_story_incremental(story, max_chars=max_chars)
+        return self.last_output
 
     async def run_all_tests(self):
-        """Run all edge case tests"""
+        """Run all edge case tests, one process and one orchestrator per scenario"""
         print("🧪 شروع تست Edge Cases...")
         print("="*60)
 
-        # Test 1: Sudden Character Changes
-        await self.test_sudden_character_changes()
-
-        # Test 2: Multiple Characters with Complex Relationships
-        await self.test_complex_relationships()
-
-        # Test 3: Inconsistent Character Descriptions
-        await self.test_inconsistent_descriptions()
-
-        # Test 4: Character Name Variations
-        await self.test_name_variations()
-
-        # Test 5: Empty or Minimal Story
-        await self.test_minimal_story()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(self.max_workers) as executor:
+            outcomes = await asyncio.gather(*(
+                loop.run_in_executor(executor, run_edge_case, test_name, self.seed + index, self.backend_factory)
+                for index, test_name in enumerate(EDGE_CASES)
+            ))
+        self.wall_seconds = time.perf_counter() - start
+
+        for test_name, (test_result, snapshot, log) in zip(EDGE_CASES, outcomes):
+            print(log, end="")
+            golden, differing = compare_golden(
+                os.path.join(self.golden_dir, f"{test_result['test_name']}.json"), snapshot, self.update_golden
+            )
+            test_result["golden"] = golden
+            if differing:
+                test_result["golden_diff"] = differing
+            print(f"   ⏱️ {test_result['latency_seconds']}s, {test_result['prompt_tokens']} prompt / "
+                  f"{test_result['generated_tokens']} generated tokens, golden: {golden}"
+                  + (f" ({', '.join(differing)})" if differing else ""))
+            self.test_results.append(test_result)
 
         # Save results
         self.save_results()
 
         print("\n✅ همه تست‌ها کامل شد!")
+        print(f"⏱️ زمان کل: {self.wall_seconds:.2f}s")
         print(f"📊 نتایج در فایل edge_case_results.json ذخیره شد")
 
     async def test_sudden_character_changes(self):
@@ -58,7 +177,7 @@ class EdgeCaseTester:
         محمد به مدرسه رفت و دانش‌آموزانش را salut کرد.
         """
 
-        result = await self.orchestrator.process_story(story)
+        result = await self.process_story(story)
 
         # Analyze results
         issues_found = len(result.get("validation", {}).get("validation_results", []))
@@ -93,7 +212,7 @@ class EdgeCaseTester:
         عصر که خانواده دور هم جمع شدند، احمد از پروژه جدیدش گفت. فاطمه از کلاس‌هایش تعریف کرد. فرزندان هم از روزشان صحبت کردند.
         """
 
-        result = await self.orchestrator.process_story(story)
+        result = await self.process_story(story)
 
         characters = result.get("characters", [])
         relationships_total = sum(len(char.get("relationships", {})) for char in characters)
@@ -124,7 +243,7 @@ class EdgeCaseTester:
         عصر در پارک، سارا دوباره با موهای بلند مشکی و چشمانی سبز ظاهر شد و با دوستانش بازی می‌کرد.
         """
 
-        result = await self.orchestrator.process_story(story)
+        result = await self.process_story(story)
 
         validation_results = result.get("validation", {}).get("validation_results", [])
         has_consistency_issues = any(
@@ -155,7 +274,7 @@ class EdgeCaseTester:
         بعد از جراحی، آقای احمد با خانواده‌اش ملاقات کرد. او مردی ۴۵ ساله با ریش و چشمانی پشت عینک بود.
         """
 
-        result = await self.orchestrator.process_story(story)
+        result = await self.process_story(story)
 
         characters = result.get("characters", [])
         # Check if system recognizes these are the same character
@@ -181,7 +300,7 @@ class EdgeCaseTester:
 
         story = "علی رفت公园. سارا آمد. آنها بازی کردند."
 
-        result = await self.orchestrator.process_story(story)
+        result = await self.process_story(story)
 
         characters = result.get("characters", [])
         scenes = result.get("scenes", [])
@@ -199,14 +318,47 @@ class EdgeCaseTester:
         print(f"   ✅ Characters extracted: {len(characters)}")
         print(f"   🎬 Scenes created: {len(scenes)}")
 
+    async def test_multi_chunk_scene_ids(self):
+        """Test case: scene ids stay unique and increasing when a story is planned chunk by chunk"""
+        print("\n🔢 تست 6: شماره صحنه‌ها در داستان چندبخشی")
+
+        story = """
+        علی صبح زود از خانه بیرون رفت و در کوچه با همسایه‌اش سلام و احوالپرسی کرد.
+
+        ظهر، علی در کتابخانه شهر با سارا قرار داشت. آنها درباره کتاب تازه‌ای صحبت کردند.
+
+        عصر، سارا و علی به پارک رفتند و زیر درخت بزرگ نشستند و چای نوشیدند.
+
+        شب، علی به خانه برگشت و ماجرای روزش را در دفترچه‌اش نوشت.
+        """
+
+        result = await self.process_story(story, max_chars=120)
+
+        scene_ids = [scene.get("scene_id") for scene in result.get("scenes", [])]
+        increasing = all(later > earlier for earlier, later in zip(scene_ids, scene_ids[1:]))
+
+        test_result = {
+            "test_name": "multi_chunk_scene_ids",
+            "description": "شماره صحنه‌های یکتا و صعودی در پردازش بخش به بخش",
+            "input_length": len(story),
+            "scene_ids": scene_ids,
+            "passed": len(scene_ids) > 1 and increasing  # Each chunk must continue the numbering
+        }
+
+        self.test_results.append(test_result)
+        print(f"   ✅ Scene ids: {scene_ids}")
+
     def save_results(self):
         """Save test results to file"""
         summary = {
-            "test_timestamp": "2025-01-08T07:30:00",
+            "test_timestamp": datetime.now().isoformat(),
+            "backend": self.backend_name,
+            "wall_seconds": round(self.wall_seconds, 3),
             "total_tests": len(self.test_results),
             "passed_tests": sum(1 for test in self.test_results if test["passed"]),
             "failed_tests": sum(1 for test in self.test_results if not test["passed"]),
             "success_rate": f"{sum(1 for test in self.test_results if test['passed']) / len(self.test_results) * 100:.1f}%",
+            "golden_mismatches": sum(1 for test in self.test_results if test.get("golden") == "mismatch"),
             "detailed_results": self.test_results
         }
 
@@ -235,17 +387,25 @@ class EdgeCaseTester:
 async def main():
     """Main function to run edge case tests"""
 
-    # Check for API key
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if not openai_api_key:
-        print("❌ خطا: OPENAI_API_KEY تنظیم نشده است")
-        print("لطفا متغیر محیطی OPENAI_API_KEY را تنظیم کنید")
-        return
-
-    # Run tests
-    tester = EdgeCaseTester(openai_api_key)
+    parser = argparse.ArgumentParser(description="Edge case tests for the character consistency PoC")
+    parser.add_argument("--stub", action="store_true", help="use the offline stub backend instead of GPT-2")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first scenario (each next one adds 1)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--update-golden", action="store_true", help="overwrite the golden snapshots with this run")
+    args = parser.parse_args()
+
+    # Run tests (no API key needed: GPT-2 runs locally)
+    tester = EdgeCaseTester(
+        StubBackend if args.stub else None, seed=args.seed, max_workers=args.workers,
+        backend_name="stub" if args.stub else "gpt2", update_golden=args.update_golden
+    )
     await tester.run_all_tests()
     tester.print_summary()
+    # The stub cannot satisfy every scenario (its goldens record the expected failures), so it gates on goldens only
+    failed = any(test.get("golden") == "mismatch" or (not args.stub and not test["passed"])
+                 for test in tester.test_results)
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+JsonSchemaAutomaton: documents the agents' schemas accept and reject, byte by byte
+"""
+
+import json
+
+import pytest
+
+from character_consistency_poc import CHARACTERS_SCHEMA, SCENES_SCHEMA, VALIDATION_SCHEMA
+from json_constraint import JsonSchemaAutomaton
+
+
+def run(automaton, text):
+    """State after feeding the UTF-8 bytes of text, or None once a byte is rejected"""
+    state = automaton.initial_state()
+    for byte in text.encode("utf-8"):
+        state = automaton.advance(state, byte)
+        if state is None:
+            return None
+    return state
+
+
+def accepts(schema, text):
+    state = run(JsonSchemaAutomaton(schema), text)
+    return state is not None and JsonSchemaAutomaton.is_complete(state)
+
+
+@pytest.mark.parametrize("schema, document", [
+    (CHARACTERS_SCHEMA, {"characters": []}),
+    (CHARACTERS_SCHEMA, {"characters": [{"name": "علی", "age": 12, "appearance": "موهای سیاه",
+                                         "relationships": {"سارا": "دوست"}}]}),
+    (CHARACTERS_SCHEMA, {"characters": [{"name": "سارا", "age": None}]}),
+    (SCENES_SCHEMA, {"scenes": [{"scene_id": 1, "description": "آشنایی در پارک",
+                                 "characters_present": ["علی", "سارا"], "location": "پارک",
+                                 "key_actions": ["بازی"]}]}),
+    (VALIDATION_SCHEMA, {"validation_results": [{"scene_id": 2, "is_consistent": False, "issues": ["سن"]}],
+                         "overall_consistency": "85%"}),
+])
+def test_accepts_valid_documents(schema, document):
+    assert accepts(schema, json.dumps(document, ensure_ascii=False))
+    assert accepts(schema, json.dumps(document, ensure_ascii=False, separators=(",", ":")))
+
+
+@pytest.mark.parametrize("schema, text", [
+    (CHARACTERS_SCHEMA, '{}'),                                           # required key missing
+    (CHARACTERS_SCHEMA, '{"characters": [{"age": 3}]}'),                 # item without its name
+    (CHARACTERS_SCHEMA, '{"characters": [{"name": "علی", "age": "12"}]}'),  # string where integer
+    (CHARACTERS_SCHEMA, '{"characters": [{"name": "علی", "height": 1}]}'),  # undeclared property
+    (CHARACTERS_SCHEMA, '{"characters": [], "characters": []}'),         # repeated key
+    (CHARACTERS_SCHEMA, '{"characters": [],}'),                          # trailing comma
+    (SCENES_SCHEMA, '{"scenes": [{"scene_id": 1.5}]}'),                  # fraction for an integer
+    (VALIDATION_SCHEMA, '{"validation_results": [], "overall_consistency": "more than ten bytes"}'),
+    (VALIDATION_SCHEMA, '[]'),                                           # wrong top-level type
+    (CHARACTERS_SCHEMA, '{"characters":    []}'),                        # whitespace filler beyond the bound
+])
+def test_rejects_invalid_documents(schema, text):
+    assert not accepts(schema, text)
+
+
+def test_nothing_follows_a_complete_document():
+    automaton = JsonSchemaAutomaton(CHARACTERS_SCHEMA)
+    state = run(automaton, '{"characters": []}')
+    assert automaton.is_complete(state)
+    assert automaton.advance(state, ord("{")) is None
+
+
+def test_max_length_counts_utf8_bytes():
+    schema = {"type": "string", "maxLength": 4}
+    assert accepts(schema, '"عل"')        # two letters, four bytes
+    assert not accepts(schema, '"علی"')   # six bytes
+
+
+@pytest.mark.parametrize("prefix", [
+    '{', '{"characters": [', '{"characters": [{"name": "عل', '{"characters": [{"name": "علی", "age": 1',
+    '{"characters": [{"name": "علی", "relationships": {"سا',
+])
+def test_closing_suffix_completes_any_prefix(prefix):
+    automaton = JsonSchemaAutomaton(CHARACTERS_SCHEMA)
+    state = run(automaton, prefix)
+    assert state is not None
+    completed = prefix.encode("utf-8") + automaton.closing_suffix(state)
+    assert accepts(CHARACTERS_SCHEMA, completed.decode("utf-8"))
+    json.loads(completed)
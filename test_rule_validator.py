@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+RuleValidator: attribute drift, one-sided relationships and the three verdicts
+"""
+
+from character_consistency_poc import Character, Scene, SharedMemory
+from rule_validator import AMBIGUOUS, CONSISTENT, INCONSISTENT, RuleValidator, hair_colors, stated_ages
+
+
+def scene(scene_id, characters, description="صحنه"):
+    return Scene(scene_id=scene_id, description=description, characters_present=characters, location="پارک")
+
+
+def test_hair_colors_and_ages_are_read_from_text():
+    assert hair_colors("دختری با موهای بلوند و چشمان آبی") == {"blond"}
+    assert hair_colors("a girl with black hair") == {"black"}
+    assert hair_colors("کت سیاه") == frozenset()
+    assert stated_ages("علی ۱۲ ساله بود و پدرش 40 years old") == {12, 40}
+
+
+def test_consistent_scene():
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", age=12, appearance="موهای سیاه"))
+    [verdict] = RuleValidator(memory).check([scene(1, ["علی"], "علی با موهای سیاه در پارک")])
+    assert verdict.verdict == CONSISTENT and verdict.issues == []
+
+
+def test_age_and_hair_drift_flag_scenes_with_the_character():
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", age=12, appearance="موهای سیاه"), scene_id=1)
+    memory.add_character(Character(name="سارا", age=11), scene_id=1)
+    validator = RuleValidator(memory)
+    assert validator.roster_drift() == {}
+
+    memory.update_character("علی", scene_id=2, age=30)
+    memory.update_character("علی", scene_id=3, appearance="موهای بلوند")
+    drift = validator.roster_drift()
+    assert list(drift) == ["علی"] and len(drift["علی"]) == 2
+
+    with_ali, without_ali = validator.check([scene(3, ["علی", "سارا"]), scene(4, ["سارا"])])
+    assert with_ali.verdict == INCONSISTENT and len(with_ali.issues) == 2
+    assert without_ali.verdict == CONSISTENT
+
+
+def test_same_value_again_is_not_drift():
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", age=12, appearance="موهای سیاه"), scene_id=1)
+    memory.update_character("علی", scene_id=2, age=12, appearance="موهای مشکی و کوتاه")
+    assert RuleValidator(memory).roster_drift() == {}
+
+
+def test_one_sided_relationship_is_flagged():
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", relationships={"سارا": "دوست"}))
+    memory.add_character(Character(name="سارا", relationships={"مریم": "خواهر"}))
+    memory.add_character(Character(name="مریم", relationships={"سارا": "خواهر"}))
+    validator = RuleValidator(memory)
+    assert validator.asymmetric_pairs() == {frozenset(("علی", "سارا"))}
+
+    flagged, fine = validator.check([scene(1, ["علی", "سارا"]), scene(2, ["سارا", "مریم"])])
+    assert flagged.verdict == INCONSISTENT
+    assert fine.verdict == CONSISTENT
+
+
+def test_relationships_never_extracted_are_not_one_sided():
+    memory = SharedMemory()
+    memory.add_character(Character(name="علی", relationships={"سارا": "دوست"}))
+    memory.add_character(Character(name="سارا"))
+    assert RuleValidator(memory).asymmetric_pairs() == set()
+
+
+def test_unknown_ambiguous_and_unexplained_names():
+    memory = SharedMemory()
+    memory.add_character(Character(name="احمد حسینی", age=45))
+    memory.add_character(Character(name="احمد رضایی"))
+    unknown, ambiguous, unexplained = RuleValidator(memory).check([
+        scene(1, ["پرویز"]),
+        scene(2, ["احمد"]),
+        scene(3, ["احمد حسینی"], "مردی ۲۰ ساله"),
+    ])
+    assert unknown.verdict == INCONSISTENT and "پرویز" in unknown.issues[0]
+    assert ambiguous.verdict == AMBIGUOUS
+    assert unexplained.verdict == AMBIGUOUS
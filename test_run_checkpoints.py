@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+RunCheckpoints: keys, atomic phase files and resuming a story where it stopped
+"""
+
+import asyncio
+import os
+
+from character_consistency_poc import MultiAgentOrchestrator
+from generator_backends import StubBackend
+from run_checkpoints import RunCheckpoints
+
+STORY = "علی ۱۲ ساله بود و موهای سیاه داشت. در پارک با سارا آشنا شد."
+
+
+class RecordingStub(StubBackend):
+    """Stub that remembers which agent each prompt came from"""
+
+    def __init__(self):
+        super().__init__()
+        self.agents = []
+
+    def respond(self, prompt: str) -> str:
+        for agent, marker in (("validator", "validation_results"), ("planner", '"scenes"'),
+                              ("extractor", '"characters"')):
+            if marker in prompt:
+                self.agents.append(agent)
+                break
+        return super().respond(prompt)
+
+
+def run(directory, resume, backend=None):
+    backend = backend or RecordingStub()
+    orchestrator = MultiAgentOrchestrator(backend, checkpoints=RunCheckpoints(str(directory)), resume=resume)
+    orchestrator.initialize_agents()
+    output = asyncio.run(orchestrator.process_story(STORY))
+    return orchestrator, backend, output
+
+
+def test_key_covers_story_pipeline_and_config():
+    key = RunCheckpoints.key(STORY, "orchestrator", {"model": "gpt2"})
+    assert key == RunCheckpoints.key(STORY, "orchestrator", {"model": "gpt2"})
+    assert key != RunCheckpoints.key(STORY, "local", {"model": "gpt2"})
+    assert key != RunCheckpoints.key(STORY, "orchestrator", {"model": "distilgpt2"})
+    assert key != RunCheckpoints.key(STORY + ".", "orchestrator", {"model": "gpt2"})
+
+
+def test_save_load_and_clear(tmp_path):
+    checkpoints = RunCheckpoints(str(tmp_path))
+    assert checkpoints.load("k") == {}
+    checkpoints.save_phase("k", "characters", {"characters": []}, {"characters": [], "scenes": []})
+    checkpoints.save_phase("k", "scenes", {"scenes": []}, {"characters": [], "scenes": [{"scene_id": 1}]})
+    state = checkpoints.load("k")
+    assert list(state["phases"]) == ["characters", "scenes"]
+    assert state["memory"]["scenes"] == [{"scene_id": 1}]
+    assert os.listdir(str(tmp_path)) == ["k.json"]  # no temporary file left behind
+    checkpoints.clear("k")
+    checkpoints.clear("k")
+    assert checkpoints.load("k") == {}
+
+
+def test_finished_story_is_returned_without_agent_calls(tmp_path):
+    _, first_backend, first = run(tmp_path, resume=False)
+    assert first_backend.agents
+    _, backend, resumed = run(tmp_path, resume=True)
+    assert backend.agents == []
+    assert resumed == first
+
+
+def test_resume_runs_only_the_missing_phases(tmp_path):
+    orchestrator, _, first = run(tmp_path, resume=False)
+    key = orchestrator.checkpoint_key(STORY)
+    checkpoints = RunCheckpoints(str(tmp_path))
+    # Pretend the run stopped right after character extraction
+    state = checkpoints.load(key)
+    checkpoints.clear(key)
+    checkpoints.save_phase(key, "characters", state["phases"]["characters"], {**state["memory"], "scenes": []})
+
+    orchestrator, backend, resumed = run(tmp_path, resume=True)
+    assert "extractor" not in backend.agents and "planner" in backend.agents
+    assert [scene["scene_id"] for scene in resumed["scenes"]] == [scene["scene_id"] for scene in first["scenes"]]
+    assert resumed["characters"] == first["characters"]
+
+
+def test_without_resume_old_checkpoints_are_dropped(tmp_path):
+    run(tmp_path, resume=False)
+    _, backend, _ = run(tmp_path, resume=False)
+    assert "extractor" in backend.agents
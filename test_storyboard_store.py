@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+StoryboardStore and PagedScenes: what one SharedMemory writes, the next one reads back
+"""
+
+import pytest
+
+from character_consistency_poc import Character, Scene, SharedMemory
+from storyboard_store import PagedScenes, StoryboardStore
+
+
+def make_scene(scene_id, location="پارک"):
+    return Scene(scene_id=scene_id, description=f"صحنه {scene_id}", characters_present=["علی"], location=location)
+
+
+def test_characters_and_scenes_round_trip(tmp_path):
+    path = str(tmp_path / "story.db")
+    memory = SharedMemory(StoryboardStore(path))
+    memory.add_character(Character(name="علی", age=12, relationships={"سارا": "دوست"}))
+    memory.add_character(Character(name="آقای علی", appearance="موهای سیاه"))  # merged into علی
+    for scene_id in (1, 2, 3):
+        memory.add_scene(make_scene(scene_id))
+    memory.store.close()
+
+    reloaded = SharedMemory(StoryboardStore(path))
+    assert list(reloaded.characters) == ["علی"]
+    ali = reloaded.characters["علی"]
+    assert (ali.age, ali.appearance, ali.relationships) == (12, "موهای سیاه", {"سارا": "دوست"})
+    assert [scene.to_dict() for scene in reloaded.scenes] == [make_scene(i).to_dict() for i in (1, 2, 3)]
+    assert reloaded.current_scene_id == 3
+    # The previous run's scenes are context, not part of this run
+    assert reloaded.run_scenes() == []
+    reloaded.add_scene(make_scene(4))
+    assert [scene.scene_id for scene in reloaded.run_scenes()] == [4]
+
+
+def test_paged_scenes_index_and_slice_across_pages(tmp_path):
+    store = StoryboardStore(str(tmp_path / "story.db"))
+    scenes = PagedScenes(store, Scene, page_size=4, max_pages=2)
+    assert not scenes and len(scenes) == 0
+    for scene_id in range(1, 11):
+        scenes.append(make_scene(scene_id))
+
+    assert len(scenes) == 10
+    assert scenes[0].scene_id == 1 and scenes[-1].scene_id == 10
+    assert [scene.scene_id for scene in scenes[3:9]] == [4, 5, 6, 7, 8, 9]
+    assert [scene.scene_id for scene in scenes[-3:]] == [8, 9, 10]
+    assert [scene.scene_id for scene in scenes[::3]] == [1, 4, 7, 10]
+    assert [scene.scene_id for scene in scenes] == list(range(1, 11))
+    assert scenes[5:2] == []
+    # Only complete pages are kept, at most max_pages of them
+    assert len(scenes._pages) <= 2
+
+
+def test_paged_scenes_out_of_range(tmp_path):
+    scenes = PagedScenes(StoryboardStore(str(tmp_path / "story.db")), Scene)
+    scenes.append(make_scene(1))
+    with pytest.raises(IndexError):
+        scenes[1]
+
+
+def test_partial_page_shows_other_writers_scenes(tmp_path):
+    path = str(tmp_path / "story.db")
+    reader = PagedScenes(StoryboardStore(path), Scene, page_size=4)
+    writer = PagedScenes(StoryboardStore(path), Scene, page_size=4)
+    writer.append(make_scene(1))
+    assert [scene.scene_id for scene in reader] == [1]
+    writer.append(make_scene(2))
+    assert [scene.scene_id for scene in reader[-2:]] == [1, 2]
+
+
+def test_restore_does_not_append_stored_scenes_again(tmp_path):
+    memory = SharedMemory(StoryboardStore(str(tmp_path / "story.db")))
+    memory.add_scene(make_scene(1))
+    memory.begin_run()
+    memory.add_scene(make_scene(2))
+    snapshot = memory.snapshot()
+    assert [scene["scene_id"] for scene in snapshot["scenes"]] == [2]
+
+    memory.restore(snapshot)
+    assert [scene.scene_id for scene in memory.scenes] == [1, 2]
+    assert [scene.scene_id for scene in memory.run_scenes()] == [2]
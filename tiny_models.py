@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Randomly initialized tiny GPT-2 models for offline benchmarks
+
+Benchmarks and CPU experiments should not need to download GPT-2. These
+helpers build a small byte-level BPE tokenizer from sample text and a
+randomly initialized GPT-2 with the same architecture family, so timing and
+cache behaviour can be measured anywhere. Outputs are meaningless text.
+"""
+
+from typing import Iterable, Tuple
+
+EOS_TOKEN = "<|endoftext|>"
+
+
+def build_tokenizer(corpus: Iterable[str], vocab_size: int = 2000):
+    """Train a byte-level BPE tokenizer on the given text"""
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import PreTrainedTokenizerFast
+
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(list(corpus), vocab_size=vocab_size, min_frequency=1, special_tokens=[EOS_TOKEN])
+    return PreTrainedTokenizerFast(tokenizer_object=bpe._tokenizer, eos_token=EOS_TOKEN, pad_token=EOS_TOKEN)
+
+
+def build_tiny_gpt2(tokenizer, n_layer: int = 4, n_embd: int = 128, n_head: int = 4,
+                    n_positions: int = 2048, seed: int = 0):
+    """Randomly initialized GPT-2 sized to the tokenizer's vocabulary"""
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    torch.manual_seed(seed)
+    config = GPT2Config(
+        vocab_size=len(tokenizer),
+        n_layer=n_layer,
+        n_embd=n_embd,
+        n_head=n_head,
+        n_positions=n_positions,
+        bos_token_id=tokenizer.eos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+    return GPT2LMHeadModel(config).eval()
+
+
+def build_tiny_pair(corpus: Iterable[str], seed: int = 0, **model_kwargs) -> Tuple[object, object]:
+    """Tokenizer and tiny model in one call"""
+    tokenizer = build_tokenizer(corpus)
+    return tokenizer, build_tiny_gpt2(tokenizer, seed=seed, **model_kwargs)
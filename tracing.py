@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Per-phase and per-agent-call tracing
+
+A run is a tree of spans: ``process_story`` at the root, one span per phase
+(characters, scenes, validation) and one per agent call below it. Agent call
+spans carry wall time, prompt and generated tokens, tokens/sec of the
+backend call, whether the answer parsed and whether a fallback was used.
+The current span is kept in a context variable, so calls running
+concurrently on the scheduler still attach to the right phase.
+
+Agents keep their own call spans (like their prompt and generation reports)
+for the ``tracing`` section of the output metadata and the summary table.
+Optionally every finished span is also written to a file as one OTLP/JSON
+``ExportTraceServiceRequest`` per line, which OpenTelemetry tooling (the
+collector's file receiver, Jaeger's importer) can read:
+
+    tracer = Tracer(FileSpanExporter("trace.jsonl"))
+    orchestrator = MultiAgentOrchestrator(tracer=tracer)
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+SERVICE_NAME = "character-consistency"
+
+
+@dataclass
+class Span:
+    """One timed operation; agent call spans carry their token counts as attributes"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    children: List["Span"] = field(default_factory=list, repr=False)
+
+    @property
+    def duration(self) -> float:
+        """Wall time in seconds"""
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def to_otel(self) -> Dict[str, Any]:
+        """The span in OTLP/JSON form"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otel_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otel_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileSpanExporter:
+    """Appends each finished span to a file as one OTLP/JSON line"""
+
+    def __init__(self, path: str, service_name: str = SERVICE_NAME):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+
+    def export(self, span: Span):
+        request = {"resourceSpans": [{
+            "resource": self._resource,
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otel()]}],
+        }]}
+        self._file.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class Tracer:
+    """Creates spans nested under the current one and hands finished spans to the exporter"""
+
+    def __init__(self, exporter: Optional[FileSpanExporter] = None):
+        self.exporter = exporter
+
+    def _new_span(self, name: str, start_ns: int, attributes: Dict[str, Any]) -> Span:
+        parent = _current_span.get()
+        return Span(
+            name,
+            parent.trace_id if parent is not None else os.urandom(16).hex(),
+            os.urandom(8).hex(),
+            parent.span_id if parent is not None else None,
+            start_ns,
+            attributes=dict(attributes),
+        )
+
+    def _finish(self, span: Span):
+        parent = _current_span.get()
+        if parent is not None and parent.span_id == span.parent_id:
+            parent.children.append(span)
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time the body as a child of the current span"""
+        span = self._new_span(name, time.time_ns(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            self._finish(span)
+
+    def record(self, name: str, start_ns: int, end_ns: int, **attributes) -> Span:
+        """Add an already finished span (e.g. one row of a batched backend call)"""
+        span = self._new_span(name, start_ns, attributes)
+        span.end_ns = end_ns
+        self._finish(span)
+        return span
+
+
+def call_attributes(prompt_tokens: int, generated_tokens: int, generate_seconds: float,
+                    parsed: bool, fallback: bool = False, batch_size: int = 1) -> Dict[str, Any]:
+    """Attributes of an agent call span"""
+    return {
+        "prompt_tokens": prompt_tokens,
+        "generated_tokens": generated_tokens,
+        "generate_seconds": round(generate_seconds, 6),
+        "tokens_per_sec": round(generated_tokens / generate_seconds, 1) if generate_seconds > 0 else 0.0,
+        "parsed": parsed,
+        "fallback": fallback,
+        "batch_size": batch_size,
+    }
+
+
+def summarize_calls(spans: Iterable[Span]) -> Dict[str, Dict[str, Any]]:
+    """Aggregate agent call spans per span name for run metadata"""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for span in spans:
+        attributes = span.attributes
+        entry = summary.setdefault(span.name, {
+            "calls": 0, "seconds": 0.0, "generate_seconds": 0.0, "prompt_tokens": 0, "generated_tokens": 0,
+            "tokens_per_sec": 0.0, "parse_failures": 0, "fallbacks": 0
+        })
+        entry["calls"] += 1
+        entry["seconds"] += span.duration
+        entry["generate_seconds"] += attributes.get("generate_seconds", 0.0)
+        entry["prompt_tokens"] += attributes.get("prompt_tokens", 0)
+        entry["generated_tokens"] += attributes.get("generated_tokens", 0)
+        entry["parse_failures"] += int(not attributes.get("parsed", True))
+        entry["fallbacks"] += int(attributes.get("fallback", False))
+    for entry in summary.values():
+        if entry["generate_seconds"] > 0:
+            entry["tokens_per_sec"] = round(entry["generated_tokens"] / entry["generate_seconds"], 1)
+        entry["seconds"] = round(entry["seconds"], 4)
+        entry["generate_seconds"] = round(entry["generate_seconds"], 4)
+    return summary
+
+
+def trace_metadata(call_spans: Iterable[Span], root: Optional[Span] = None) -> Dict[str, Any]:
+    """``tracing`` section of the output metadata: phase wall times and per-agent call stats"""
+    metadata: Dict[str, Any] = {}
+    if root is not None:
+        metadata["total_seconds"] = round(root.duration, 4)
+        metadata["phases"] = {
+            child.name: {"seconds": round(child.duration, 4), **child.attributes} for child in root.children
+        }
+    metadata["agents"] = summarize_calls(call_spans)
+    return metadata
+
+
+def format_trace_table(tracing: Dict[str, Any]) -> str:
+    """Plain-text table of a ``tracing`` metadata section"""
+    lines = []
+    if "phases" in tracing:
+        lines.append(f"{'phase':<24}{'seconds':>10}")
+        for name, phase in tracing["phases"].items():
+            flags = "  (restored)" if phase.get("restored") else "  (fallback)" if phase.get("fallback") else ""
+            lines.append(f"{name:<24}{phase['seconds']:>10.3f}{flags}")
+        lines.append(f"{'total':<24}{tracing['total_seconds']:>10.3f}")
+        lines.append("")
+    lines.append(f"{'agent':<24}{'calls':>6}{'seconds':>10}{'prompt':>9}{'output':>9}{'tok/s':>12}{'failed':>8}{'fallback':>9}")
+    for name, entry in tracing["agents"].items():
+        lines.append(
+            f"{name:<24}{entry['calls']:>6}{entry['seconds']:>10.3f}{entry['prompt_tokens']:>9}"
+            f"{entry['generated_tokens']:>9}{entry['tokens_per_sec']:>12.1f}{entry['parse_failures']:>8}"
+            f"{entry['fallbacks']:>9}"
+        )
+    return "\n".join(lines)